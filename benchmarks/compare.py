@@ -0,0 +1,57 @@
+"""
+Compares two runs of the benchmarks, made with --benchmark-json.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any
+
+
+def key(result: dict[str, Any]) -> str:
+    params = ", ".join(f"{name}={value}" for name, value in result["params"].items())
+    return f"{result['name']}[{params}]"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Fail if a median got slower than this ratio.",
+    )
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = {key(result): result for result in json.load(file)["benchmarks"]}
+    with open(args.after) as file:
+        after = {key(result): result for result in json.load(file)["benchmarks"]}
+
+    slower = []
+    for name, result in after.items():
+        if name not in before:
+            print(f"{name}: {result['median'] * 1000:.3f} ms (new)")
+            continue
+
+        ratio = result["median"] / before[name]["median"]
+        print(
+            f"{name}: {before[name]['median'] * 1000:.3f} ms -> "
+            f"{result['median'] * 1000:.3f} ms ({ratio:.2f}x)"
+        )
+
+        if args.threshold and ratio > args.threshold:
+            slower.append(name)
+
+    if slower:
+        sys.exit(f"Slower than {args.threshold}x: {', '.join(slower)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Times the hot paths of the controller. Run with:
+
+    pytest benchmarks --benchmark-json results.json
+
+and compare two runs with `python -m benchmarks.compare old.json new.json`.
+"""
+
+from __future__ import annotations
+
+import enum
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Optional
+
+import freezegun
+import pytest
+import sqlalchemy as sa
+
+# The same fixtures as the tests, so benchmarks set the game up the same way.
+from tests.conftest import (  # noqa: F401
+    frozen_time,
+    initialized_session,
+    mock_session,
+    test_controller,
+)
+
+# Time must go on for us, even when the game's clock is frozen.
+freezegun.configure(extend_ignore_list=[__name__])
+
+# Where results are kept during the run.
+RESULTS: list[dict[str, Any]] = []
+
+
+class Benchmark:
+    """
+    Calls a function a few times and keeps how long it took. Setup is called
+    before each call, and isn't timed.
+    """
+
+    def __init__(self, name: str, params: dict[str, Any]):
+        self.name = name
+        self.params = params
+
+    def __call__(
+        self,
+        function: Callable[[], Any],
+        rounds: int = 10,
+        setup: Optional[Callable[[], Any]] = None,
+        warmup: int = 1,
+    ) -> None:
+        timings = []
+
+        for i in range(warmup + rounds):
+            if setup:
+                setup()
+
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+
+            if i >= warmup:
+                timings.append(elapsed)
+
+        RESULTS.append(
+            {
+                "name": self.name,
+                "params": self.params,
+                "rounds": rounds,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "mean": statistics.mean(timings),
+                "max": max(timings),
+            }
+        )
+
+
+@pytest.fixture
+def benchmark(request: pytest.FixtureRequest) -> Benchmark:
+    callspec = getattr(request.node, "callspec", None)
+    params = {
+        name: value.name if isinstance(value, enum.Enum) else str(value)
+        for name, value in (callspec.params if callspec else {}).items()
+    }
+
+    return Benchmark(request.node.originalname, params)
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--benchmark-json", default=None, help="Write the results to this file."
+    )
+
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    filename = session.config.getoption("--benchmark-json")
+    if not filename or not RESULTS:
+        return
+
+    with open(filename, "w") as file:
+        json.dump(
+            {
+                "revision": revision(),
+                "machine": {
+                    "python": platform.python_version(),
+                    "sqlite": sqlite3.sqlite_version,
+                    "sqlalchemy": sa.__version__,
+                    "platform": platform.platform(),
+                    "processor": platform.processor(),
+                },
+                "benchmarks": RESULTS,
+            },
+            file,
+            indent=2,
+        )
+
+
+def pytest_terminal_summary(terminalreporter: Any) -> None:
+    if not RESULTS:
+        return
+
+    terminalreporter.section("benchmarks")
+    for result in RESULTS:
+        params = ", ".join(f"{key}={value}" for key, value in result["params"].items())
+        terminalreporter.write_line(
+            f"{result['name']}[{params}]: median {result['median'] * 1000:.3f} ms, "
+            f"min {result['min'] * 1000:.3f} ms ({result['rounds']} rounds)"
+        )
@@ -0,0 +1,188 @@
+"""
+Plays a game with many robots for a while, and measures how long each tick
+takes, how many queries it makes, and how much memory and disk it needs.
+
+    python -m benchmarks.loadtest --robots 1000 --minutes 10 --max-p99 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import sqlalchemy as sa
+
+import factory.database
+from factory.controller import StateController
+from factory.models import RobotAction
+from factory.montecarlo import percentile
+from factory.queries import QueryRecorder
+from factory.snapshots import SnapshotBuilder
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+# How often each action is picked, roughly what a player does.
+ACTION_WEIGHTS = {
+    RobotAction.MINING_FOO: 30,
+    RobotAction.MINING_BAR: 30,
+    RobotAction.MAKING_FOOBAR: 25,
+    RobotAction.SELLING_FOOBAR: 10,
+    RobotAction.BUYING_ROBOT: 5,
+}
+
+
+@dataclass
+class LoadTestResult:
+    robots: int
+    ticks: int
+    # Milliseconds a tick took.
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    # Statements sent to the database per tick.
+    queries_mean: float
+    queries_max: int
+    # How much the process grew, in KiB, if we can tell.
+    memory_growth: Optional[int]
+    database_size: int
+
+
+def max_rss() -> Optional[int]:
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(
+    robots: int,
+    duration: timedelta,
+    tick: timedelta = timedelta(milliseconds=16),
+    seed: int = 0,
+    fleet: bool = False,
+) -> LoadTestResult:
+    """
+    Plays with that many robots for the duration, in game time, ticking as
+    the window would. The database must be initialized.
+    """
+    rng = random.Random(seed)
+
+    now = datetime(2022, 1, 1)
+    if fleet:
+        from factory.fleet import FleetStateController
+
+        controller: StateController = FleetStateController(seed)
+    else:
+        controller = StateController(seed)
+    controller.clock = lambda: now
+    snapshots = SnapshotBuilder(controller)
+
+    with controller.model_session() as session:
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+        for _ in range(robots):
+            robot = controller.new_robot(session)
+            robot.change_action(session, rng.choices(actions, weights)[0])
+        session.commit()
+
+        rss_before = max_rss()
+        timings = []
+
+        with QueryRecorder(keep=False) as recorder:
+            end = now + duration
+            while now < end:
+                now += tick
+
+                start = time.perf_counter()
+                with recorder.tick():
+                    controller.update(session)
+                    session.commit()
+                    snapshots.build(session)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        query_counts = [stats.count for stats in recorder.ticks]
+
+        rss_after = max_rss()
+        page_count = session.scalar(sa.text("PRAGMA page_count"))
+        page_size = session.scalar(sa.text("PRAGMA page_size"))
+
+    timings.sort()
+    return LoadTestResult(
+        robots=robots,
+        ticks=len(timings),
+        p50=percentile(timings, 50),
+        p95=percentile(timings, 95),
+        p99=percentile(timings, 99),
+        max=timings[-1],
+        queries_mean=sum(query_counts) / len(query_counts),
+        queries_max=max(query_counts),
+        memory_growth=(
+            rss_after - rss_before if rss_before is not None and rss_after else None
+        ),
+        database_size=page_count * page_size,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--robots", type=int, default=1_000)
+    parser.add_argument(
+        "--minutes", type=float, default=10, help="How long to play, in game time."
+    )
+    parser.add_argument(
+        "--tick", type=float, default=16, help="Game time between ticks, in ms."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fleet", action="store_true", help="Keep the robots in arrays."
+    )
+    parser.add_argument(
+        "--database", default="sqlite:///:memory:", help="Database URL."
+    )
+    parser.add_argument(
+        "--max-p99", type=float, default=None, help="Fail above this many ms."
+    )
+    parser.add_argument(
+        "--max-queries",
+        type=float,
+        default=None,
+        help="Fail above this many queries per tick, on average.",
+    )
+    args = parser.parse_args()
+
+    factory.database.configure(args.database)
+    factory.database.init_database()
+
+    result = run(
+        args.robots,
+        timedelta(minutes=args.minutes),
+        timedelta(milliseconds=args.tick),
+        args.seed,
+        args.fleet,
+    )
+    print(json.dumps(asdict(result), indent=2))
+
+    failures = []
+    if args.max_p99 is not None and result.p99 > args.max_p99:
+        failures.append(f"p99 is {result.p99:.1f} ms, above {args.max_p99} ms")
+    if args.max_queries is not None and result.queries_mean > args.max_queries:
+        failures.append(
+            f"{result.queries_mean:.1f} queries per tick, above {args.max_queries}"
+        )
+
+    if failures:
+        sys.exit("Regression: " + ", ".join(failures) + ".")
+
+
+if __name__ == "__main__":
+    main()
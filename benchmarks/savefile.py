@@ -0,0 +1,92 @@
+"""
+Compares plain and compressed saves: how big they are, and how long they
+take to save and load.
+
+    python -m benchmarks.savefile --products 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import sqlalchemy as sa
+
+import factory.database
+from factory.controller import StateController
+from factory.models import Bar, Foo, Foobar, gen_uuid
+
+# Number of rows inserted at a time.
+CHUNK = 10_000
+
+
+def make_history(products: int) -> None:
+    """
+    Fills the game with that many foos and bars, most of them used to make
+    foobars, which were sold.
+    """
+    with factory.database.engine.begin() as conn:
+        for table in (Foo.__table__, Bar.__table__):
+            for start in range(0, products, CHUNK):
+                conn.execute(
+                    sa.insert(table),
+                    [
+                        {"serial": gen_uuid(), "used": i % 10 != 0}
+                        for i in range(start, min(start + CHUNK, products))
+                    ],
+                )
+
+        for start in range(1, products + 1, CHUNK):
+            conn.execute(
+                sa.insert(Foobar.__table__),
+                [
+                    {"foo_used_id": i, "bar_used_id": i, "used": True}
+                    for i in range(start, min(start + CHUNK, products + 1))
+                    if i % 10 != 0
+                ],
+            )
+
+
+def measure(controller: StateController, filename: str) -> dict[str, Any]:
+    start = time.perf_counter()
+    controller.save(filename)
+    saved = time.perf_counter()
+    controller.load(filename)
+    loaded = time.perf_counter()
+
+    return {
+        "size": Path(filename).stat().st_size,
+        "save_seconds": saved - start,
+        "load_seconds": loaded - saved,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--products", type=int, default=1_000_000, help="Number of foos and bars."
+    )
+    args = parser.parse_args()
+
+    factory.database.configure("sqlite:///:memory:")
+    factory.database.init_database()
+    make_history(args.products)
+
+    controller = StateController()
+    results: dict[str, Any] = {"products": args.products}
+
+    with tempfile.TemporaryDirectory() as directory:
+        results["plain"] = measure(controller, str(Path(directory) / "save.sqlite3"))
+        results["compressed"] = measure(
+            controller, str(Path(directory) / "save.sqlite3.gz")
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
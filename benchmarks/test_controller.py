@@ -0,0 +1,189 @@
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from freezegun.api import FrozenDateTimeFactory
+from sqlalchemy.orm import Session
+
+from benchmarks.conftest import Benchmark
+from benchmarks.savefile import make_history
+from factory.controller import StateController
+from factory.counters import count_from_database
+from factory.models import Foo, Foobar, Robot, RobotAction
+
+# Sizes of the histories we read, and save.
+HISTORY_SIZES = [1_000, 100_000]
+
+
+@pytest.fixture
+def controller(test_controller: StateController) -> StateController:
+    # Checking the counts would be what we measure.
+    test_controller.CHECK_COUNTS = False
+    return test_controller
+
+
+@pytest.fixture(params=HISTORY_SIZES)
+def history(
+    request: pytest.FixtureRequest,
+    initialized_session: Session,
+    controller: StateController,
+) -> int:
+    """
+    A game with that many foos and bars, most of them sold as foobars.
+    """
+    initialized_session.commit()
+    make_history(request.param)
+    controller.reload(initialized_session)
+
+    return int(request.param)
+
+
+@pytest.mark.parametrize("fleet", [False, True])
+@pytest.mark.parametrize("robots", [10, 1_000, 100_000])
+def test_update(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    frozen_time: FrozenDateTimeFactory,
+    robots: int,
+    fleet: bool,
+) -> None:
+    """
+    A tick where every robot is done mining foo, commit included.
+    """
+    if fleet:
+        pytest.importorskip("numpy")
+        from factory.fleet import FleetStateController
+
+        controller = FleetStateController()
+
+    controller.new_robots(initialized_session, robots)
+    initialized_session.commit()
+
+    def every_robot_is_done() -> None:
+        now = frozen_time()
+        initialized_session.execute(
+            sa.update(Robot).values(
+                action=RobotAction.MINING_FOO,
+                time_started=now - timedelta(seconds=2),
+                time_when_available=None,
+                time_when_done=now,
+            )
+        )
+        initialized_session.commit()
+        controller.reload(initialized_session)
+
+    def tick() -> None:
+        controller.update(initialized_session)
+        initialized_session.commit()
+
+    benchmark(
+        tick,
+        rounds=max(1_000 // robots, 1),
+        setup=every_robot_is_done,
+        warmup=0 if robots > 1_000 else 1,
+    )
+
+
+def test_counts(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    history: int,
+) -> None:
+    benchmark(lambda: controller.counts(initialized_session), rounds=1_000)
+
+
+def test_count_from_database(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    history: int,
+) -> None:
+    """
+    What counts would cost without the counters.
+    """
+    benchmark(lambda: count_from_database(initialized_session), rounds=100)
+
+
+@pytest.mark.parametrize("n", [1, 5])
+def test_use_n_products(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    history: int,
+    n: int,
+) -> None:
+    benchmark(
+        lambda: controller.use_n_products(initialized_session, Foo, n),
+        rounds=100,
+        setup=initialized_session.rollback,
+    )
+
+
+@pytest.mark.init_controller_with(foo=1_000, bar=1_000, foobar=1_000, euros=1_000)
+@pytest.mark.parametrize("action", list(RobotAction), ids=lambda action: action.name)
+def test_robot_action_done(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    action: RobotAction,
+) -> None:
+    initialized_session.commit()
+
+    benchmark(
+        lambda: controller.robot_action_done(action, initialized_session),
+        rounds=100,
+        setup=initialized_session.rollback,
+    )
+
+
+@pytest.mark.parametrize("start", ["first", "last"])
+def test_list_sold_foobars_since(
+    benchmark: Benchmark,
+    initialized_session: Session,
+    controller: StateController,
+    history: int,
+    start: str,
+) -> None:
+    """
+    Reading a batch of the history, from its start, or only what's new.
+    """
+    after_id = 0
+    if start == "last":
+        after_id = initialized_session.scalar(sa.select(sa.func.max(Foobar.id))) - 10
+
+    benchmark(
+        lambda: controller.list_sold_foobars_since(
+            initialized_session, after_id, limit=1_000
+        ),
+        rounds=100,
+    )
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_save(
+    benchmark: Benchmark,
+    controller: StateController,
+    history: int,
+    compressed: bool,
+    tmp_path: Path,
+) -> None:
+    savefile = str(tmp_path / ("save.sqlite3.gz" if compressed else "save.sqlite3"))
+
+    benchmark(lambda: controller.save(savefile), rounds=3)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_load(
+    benchmark: Benchmark,
+    controller: StateController,
+    history: int,
+    compressed: bool,
+    tmp_path: Path,
+) -> None:
+    savefile = str(tmp_path / ("save.sqlite3.gz" if compressed else "save.sqlite3"))
+    controller.save(savefile)
+
+    benchmark(lambda: controller.load(savefile), rounds=3)
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from sqlalchemy.orm import Session
+
+from benchmarks.loadtest import run
+
+
+def test_queries_per_tick(initialized_session: Session) -> None:
+    """
+    Unlike timings, the number of queries doesn't depend on the machine, so
+    it can be held to a budget.
+    """
+    result = run(100, timedelta(minutes=1), seed=42)
+
+    assert result.ticks == 3750
+    assert result.queries_mean < 5
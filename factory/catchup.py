@@ -0,0 +1,264 @@
+"""
+Works out what the robots did during a long time without being updated,
+after the computer slept or an old save was loaded, without going through
+every tick: how many times each robot finished its action, and what was
+mined, used, made and sold meanwhile, to be applied to the game at once.
+
+Miners don't need anything, so what they mined is only counted when it's
+needed, in jumps. Robots using products are replayed in order, each time
+they finish, against what was mined until then.
+"""
+
+from __future__ import annotations
+
+import heapq
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from factory.models import (
+    ACTION_DURATIONS,
+    FOOBAR_SUCCESS,
+    MINING_BAR_DURATION,
+    ROBOT_PRICE,
+    SALE_SIZE,
+    RobotAction,
+)
+from factory.snapshots import RobotState
+
+MINERS = (RobotAction.MINING_FOO, RobotAction.MINING_BAR)
+
+
+def duration(action: RobotAction, rng: random.Random) -> timedelta:
+    if action == RobotAction.MINING_BAR:
+        return timedelta(milliseconds=rng.randint(*MINING_BAR_DURATION))
+
+    return ACTION_DURATIONS[action]
+
+
+@dataclass
+class CatchUp:
+    """
+    What happened, in the order it did.
+    """
+
+    # Where each robot is at the end, and how many actions it finished.
+    robots: dict[int, RobotState] = field(default_factory=dict)
+    cycles: dict[int, int] = field(default_factory=dict)
+
+    foos: int = 0
+    bars: int = 0
+    # Products used, for foobars or robots.
+    foos_used: int = 0
+    bars_used: int = 0
+    # For each foobar made, which of the used foos and bars it was made of.
+    foobars: list[Tuple[int, int]] = field(default_factory=list)
+    foobars_sold: int = 0
+    robots_bought: int = 0
+
+    @property
+    def euros(self) -> int:
+        return self.foobars_sold - self.robots_bought * ROBOT_PRICE[1]
+
+
+class Track:
+    """
+    What a robot is doing while it's played, which changes too often to be
+    a RobotState.
+    """
+
+    __slots__ = ("robot", "action", "started", "available", "done", "cycles")
+
+    def __init__(self, robot: RobotState):
+        self.robot = robot
+        self.action = robot.action
+        self.started = robot.time_started
+        self.available = robot.time_when_available
+        self.done = robot.time_when_done
+        self.cycles = 0
+
+    def state(self) -> RobotState:
+        return RobotState(
+            id=self.robot.id,
+            name=self.robot.name,
+            action=self.action,
+            time_started=self.started,
+            time_when_available=self.available,
+            time_when_done=self.done,
+        )
+
+
+class Planner:
+    """
+    Plays the robots until now, from the inventory they start with.
+    """
+
+    def __init__(
+        self,
+        robots: Iterable[RobotState],
+        counts: Tuple[int, int, int, int],
+        now: datetime,
+        rng: random.Random,
+    ):
+        self.now = now
+        self.rng = rng
+        self.result = CatchUp()
+        self.foo, self.bar, self.foobar, self.euros = counts
+
+        self.tracks: dict[int, Track] = {}
+        # When the next action of each robot will be done, for miners and for
+        # the others.
+        self.miners: list[tuple[datetime, int]] = []
+        self.users: list[tuple[datetime, int]] = []
+
+        for robot in robots:
+            self.tracks[robot.id] = Track(robot)
+            when: Optional[datetime] = robot.time_when_available or robot.time_when_done
+            assert robot.action and when
+
+            if robot.action in MINERS and not robot.changing:
+                heapq.heappush(self.miners, (when, robot.id))
+            else:
+                heapq.heappush(self.users, (when, robot.id))
+
+    def plan(self) -> CatchUp:
+        while self.users and self.users[0][0] <= self.now:
+            when, robot_id = heapq.heappop(self.users)
+            self.finish(self.tracks[robot_id], when)
+
+        self.mine(self.now)
+
+        result = self.result
+        for robot_id, track in self.tracks.items():
+            result.robots[robot_id] = track.state()
+            result.cycles[robot_id] = track.cycles
+
+        return result
+
+    def start(self, track: Track, when: datetime) -> None:
+        """
+        Starts the robot's action again, or for the first time.
+        """
+        assert track.action
+        track.started = when
+        track.available = None
+        track.done = when + duration(track.action, self.rng)
+
+        heapq.heappush(
+            self.miners if track.action in MINERS else self.users,
+            (track.done, track.robot.id),
+        )
+
+    def stop(self, track: Track) -> None:
+        track.action = None
+        track.available = None
+
+    def mine(self, until: datetime) -> None:
+        """
+        Counts what was mined until then. Miners jump over as many actions as
+        they finished, as long as they take the same time.
+        """
+        while self.miners and self.miners[0][0] <= until:
+            done, robot_id = heapq.heappop(self.miners)
+            track = self.tracks[robot_id]
+
+            if track.action == RobotAction.MINING_FOO:
+                every = ACTION_DURATIONS[track.action]
+                cycles = (until - done) // every + 1
+                last = done + (cycles - 1) * every
+                following = last + every
+            else:
+                cycles, last, following = 0, done, done
+                while following <= until:
+                    cycles += 1
+                    last = following
+                    following = last + duration(RobotAction.MINING_BAR, self.rng)
+
+            track.cycles += cycles
+            track.started = last
+            track.done = following
+            if track.action == RobotAction.MINING_FOO:
+                self.foo += cycles
+                self.result.foos += cycles
+            else:
+                self.bar += cycles
+                self.result.bars += cycles
+
+            heapq.heappush(self.miners, (following, robot_id))
+
+    def enough(self, when: datetime, foo: int = 0, bar: int = 0) -> bool:
+        """
+        Were there that many foos and bars then? Mining only adds to them,
+        so we only have to count what was mined since when there weren't.
+        """
+        if self.foo < foo or self.bar < bar:
+            self.mine(when)
+
+        return self.foo >= foo and self.bar >= bar
+
+    def finish(self, track: Track, when: datetime) -> None:
+        """
+        What the robot does when it's done changing, or with its action, as
+        robot_action_done would.
+        """
+        result = self.result
+
+        if track.available:
+            if track.action != RobotAction.BUYING_ROBOT:
+                self.start(track, when)
+                return
+
+            # Buying a robot is done as soon as it starts, and only once.
+            track.cycles += 1
+            foo_price, euro_price = ROBOT_PRICE
+            if self.euros >= euro_price and self.enough(when, foo=foo_price):
+                self.foo -= foo_price
+                self.euros -= euro_price
+                result.foos_used += foo_price
+                result.robots_bought += 1
+
+            self.stop(track)
+            return
+
+        if track.action == RobotAction.MAKING_FOOBAR:
+            if not self.enough(when, foo=1, bar=1):
+                self.stop(track)
+                return
+
+            track.cycles += 1
+            self.foo -= 1
+            result.foos_used += 1
+
+            if self.rng.randint(1, 100) <= FOOBAR_SUCCESS:
+                self.bar -= 1
+                result.bars_used += 1
+                self.foobar += 1
+                result.foobars.append((result.foos_used - 1, result.bars_used - 1))
+
+        elif track.action == RobotAction.SELLING_FOOBAR:
+            if not self.foobar:
+                self.stop(track)
+                return
+
+            track.cycles += 1
+            sold = min(self.rng.randint(1, SALE_SIZE), self.foobar)
+            self.foobar -= sold
+            self.euros += sold
+            result.foobars_sold += sold
+
+        self.start(track, when)
+
+
+def plan(
+    robots: Iterable[RobotState],
+    counts: Tuple[int, int, int, int],
+    now: datetime,
+    rng: Optional[random.Random] = None,
+) -> CatchUp:
+    """
+    Works out what the robots did until now, from the inventory given as
+    counts, drawing their luck from rng. The robots must be due, and are
+    expected to be all of them.
+    """
+    return Planner(robots, counts, now, rng or random.Random()).plan()
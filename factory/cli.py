@@ -0,0 +1,164 @@
+"""
+The factory command. Without a command it opens the game's window, but the
+other commands never import Qt, so they can run on a server.
+
+Only what a command needs is imported, once it was chosen: starting the
+command is meant to stay fast, which startup-time measures.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+from typing import Optional, Sequence
+
+# What a command shouldn't import, if it doesn't need them.
+HEAVY_MODULES = ("PySide6", "faker", "sqlalchemy")
+
+# How long starting the command may take, in milliseconds, not counting the
+# interpreter itself.
+STARTUP_BUDGET = 100.0
+
+
+def play(args: argparse.Namespace) -> None:
+    from factory.main import main
+
+    main()
+
+
+def simulate(args: argparse.Namespace) -> None:
+    from factory.simulation import main
+
+    main(args.arguments, prog="factory simulate")
+
+
+def evaluate(args: argparse.Namespace) -> None:
+    from factory.montecarlo import main
+
+    main(args.arguments, prog="factory evaluate")
+
+
+def inspect(args: argparse.Namespace) -> None:
+    import sqlalchemy as sa
+
+    import factory.database
+    from factory.controller import StateController
+    from factory.journal import Journal, journal_path
+    from factory.models import Foobar, Robot
+
+    if not os.path.exists(args.save):
+        sys.exit(f"There is no save at {args.save}.")
+
+    # Whatever the game is kept in, the save is only read in memory.
+    factory.database.configure("sqlite:///:memory:")
+    factory.database.init_database()
+
+    controller = StateController()
+    controller.load(args.save, keep_journal=False)
+
+    with controller.model_session() as session:
+        foo, bar, foobar, euros = controller.counts(session)
+        actions = Counter(session.scalars(sa.select(Robot.action)))
+        sold = session.scalar(sa.select(sa.func.count(Foobar.id)).where(Foobar.used))
+
+    print(f"Robots: {sum(actions.values())}")
+    for action, n in sorted(actions.items(), key=lambda item: -item[1]):
+        print(f"  {action.to_string() if action else 'Idle'}: {n}")
+    print(f"Inventory: {foo} foos, {bar} bars, {foobar} foobars, {euros}€")
+    print(f"Sold foobars: {sold}")
+
+    try:
+        transactions, length = Journal.read(journal_path(args.save))
+    except FileNotFoundError:
+        transactions, length = [], 0
+    print(f"Journal: {len(transactions)} transactions, {length} bytes")
+
+
+def startup_time(args: argparse.Namespace) -> None:
+    """
+    Measures how long it takes to start the command, by starting it in new
+    interpreters, and fails if it takes longer than the budget.
+    """
+    script = (
+        "import sys, time; start = time.perf_counter(); "
+        "import factory.cli; factory.cli.build_parser(); "
+        "print(time.perf_counter() - start); "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+
+    timings = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        timings.append(float(output[0]) * 1000)
+
+        if output[1:] and output[1]:
+            sys.exit(f"Starting imported {output[1]}.")
+
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"Startup: {median:.1f} ms (median of {args.runs}, best {timings[0]:.1f} ms)")
+
+    if median > args.budget:
+        sys.exit(f"Startup takes longer than {args.budget:.0f} ms.")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="factory", description="A fun game with robots… from the future!"
+    )
+    parser.set_defaults(command=play)
+    commands = parser.add_subparsers(title="commands")
+
+    play_parser = commands.add_parser("play", help="Open the game's window.")
+    play_parser.set_defaults(command=play)
+
+    simulate_parser = commands.add_parser(
+        "simulate",
+        help="Play without any window, faster than real time.",
+        add_help=False,
+    )
+    simulate_parser.set_defaults(command=simulate)
+
+    evaluate_parser = commands.add_parser(
+        "evaluate",
+        help="Compare strategies over many games played in parallel.",
+        add_help=False,
+    )
+    evaluate_parser.set_defaults(command=evaluate)
+
+    inspect_parser = commands.add_parser("inspect", help="Describe a save.")
+    inspect_parser.add_argument("save", help="The save file.")
+    inspect_parser.set_defaults(command=inspect)
+
+    startup_parser = commands.add_parser(
+        "startup-time", help="Measure how long this command takes to start."
+    )
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument(
+        "--budget",
+        type=float,
+        default=STARTUP_BUDGET,
+        help="Fail if the median is longer than this many milliseconds.",
+    )
+    startup_parser.set_defaults(command=startup_time)
+
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = build_parser()
+    args, arguments = parser.parse_known_args(argv)
+
+    # The simulation's arguments are given to it, it knows what they mean.
+    if arguments and args.command not in (simulate, evaluate):
+        parser.error(f"unrecognized arguments: {' '.join(arguments)}")
+    args.arguments = arguments
+
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,52 @@
 from __future__ import annotations
 
+import os
+import queue
 import random
 import sqlite3
+import tempfile
 import weakref
 from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Iterator, Optional, Tuple, Type
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 import sqlalchemy as sa
-from faker import Faker
 from sqlalchemy.orm import Session as SASession
-from sqlalchemy.sql.elements import not_
-from typing_extensions import TypeAlias
+from sqlalchemy.orm.attributes import set_committed_value
+from typing_extensions import Protocol, TypeAlias
 
+import factory.catchup
 import factory.database
+import factory.savefile
+from factory.counters import InventoryCounters, count_from_database
+from factory.events import (
+    Event,
+    EventBus,
+    FoobarsSold,
+    InventoryChanged,
+    RobotAdded,
+    RobotChanged,
+    StateReloaded,
+)
+from factory.journal import Entry, Journal, encode, journal_path
+from factory.ledger import EuroLedger
 from factory.models import (
+    ACTION_DURATIONS,
+    CHANGE_DURATION,
+    FOOBAR_SUCCESS,
+    MINING_BAR_DURATION,
+    ROBOT_PRICE,
+    SALE_SIZE,
     Bar,
     Foo,
     Foobar,
@@ -23,13 +55,84 @@ from factory.models import (
     RobotAction,
     UsableObject,
 )
+from factory.names import NamePool
+from factory.scheduler import Scheduler
+from factory.serials import CounterSerials, SerialStrategy
+from factory.snapshots import RobotState
+
+# Something to do with the state, given by another thread.
+Command: TypeAlias = Callable[[SASession], None]
+
+
+class RobotData(Protocol):
+    """
+    What a RobotController reads and writes of a robot that isn't kept in a
+    Robot, like a robot in a fleet.
+    """
+
+    @property
+    def id(self) -> int:
+        ...
+
+    @property
+    def name(self) -> str:
+        ...
+
+    @property
+    def action(self) -> Optional[RobotAction]:
+        ...
+
+    @action.setter
+    def action(self, value: Optional[RobotAction]) -> None:
+        ...
+
+    @property
+    def time_started(self) -> Optional[datetime]:
+        ...
+
+    @time_started.setter
+    def time_started(self, value: Optional[datetime]) -> None:
+        ...
+
+    @property
+    def time_when_available(self) -> Optional[datetime]:
+        ...
+
+    @time_when_available.setter
+    def time_when_available(self, value: Optional[datetime]) -> None:
+        ...
+
+    @property
+    def time_when_done(self) -> Optional[datetime]:
+        ...
+
+    @time_when_done.setter
+    def time_when_done(self, value: Optional[datetime]) -> None:
+        ...
+
+
+# Called after each step of a backup, with its status, the number of pages
+# remaining and the total number of pages.
+BackupProgress: TypeAlias = Callable[[int, int, int], object]
+
+
+class SoldFoobar(NamedTuple):
+    """
+    What we need to know about a sold foobar, for traceability.
+    """
+
+    id: int
+    foo_serial: Optional[str]
+    bar_serial: Optional[str]
 
 
 class RobotController:
     SESSION: TypeAlias = SASession
 
-    def __init__(self, parent: StateController, robot: Robot):
+    def __init__(self, parent: StateController, robot: Union[Robot, RobotData]):
         self.parent_controller = weakref.ref(parent)
+        # Robot doesn't pass for a RobotData to mypy, its columns are
+        # descriptors, so it's named on its own.
         self.robot = robot
 
     @property
@@ -65,6 +168,51 @@ class RobotController:
         """
         return self.robot.time_when_available is not None
 
+    @property
+    def next_event(self) -> Optional[datetime]:
+        """
+        When this robot will need to be updated, if ever.
+        """
+        if self.robot.action is None:
+            return None
+
+        if self.robot.time_when_available is not None:
+            return self.robot.time_when_available
+
+        return self.robot.time_when_done
+
+    def emit(self, session: SESSION, event: Event) -> None:
+        """
+        Tells the parent's subscribers about a change, once the session commits.
+        """
+        parent = self.parent_controller()
+        if parent:
+            parent.events.emit(session, event)
+
+    def record(self, session: SESSION) -> None:
+        """
+        Writes what the robot is doing to the parent's journal, if it keeps one.
+        """
+        parent = self.parent_controller()
+        if parent:
+            # Only rows are journaled, robots kept elsewhere record themselves.
+            assert isinstance(self.robot, Robot)
+            parent.record(session, self.robot)
+
+    def attach(self, session: SESSION) -> None:
+        """
+        Makes the robot part of the session, to change it.
+        """
+        self.robot = session.merge(self.robot)
+
+    def reschedule(self) -> None:
+        """
+        Tells the parent when this robot needs to be updated next.
+        """
+        parent = self.parent_controller()
+        if parent:
+            parent.scheduler.schedule(self.id, self.next_event)
+
     @contextmanager
     def model_session(self) -> Iterator[SESSION]:
         ref = self.parent_controller()
@@ -77,6 +225,30 @@ class RobotController:
             with factory.database.Session() as session:
                 yield session
 
+    def now(self) -> datetime:
+        """
+        The current time, as seen by the parent controller.
+        """
+        parent = self.parent_controller()
+        if parent:
+            return parent.now()
+
+        return datetime.now()
+
+    def state(self) -> RobotState:
+        """
+        Returns a copy of what the robot is doing, that can be read without
+        a session, or from another thread.
+        """
+        return RobotState(
+            id=self.robot.id,
+            name=self.robot.name,
+            action=self.robot.action,
+            time_started=self.robot.time_started,
+            time_when_available=self.robot.time_when_available,
+            time_when_done=self.robot.time_when_done,
+        )
+
     def progress(self) -> float:
         """
         Returns a float between 0 and 100 to indicate the progress
@@ -84,20 +256,7 @@ class RobotController:
 
         To call this the robot must be doing something.
         """
-        assert self.robot.action
-        assert self.robot.time_started
-
-        if self.robot.time_when_available is None:
-            assert self.robot.time_when_done
-
-            time_total = self.robot.time_when_done - self.robot.time_started
-            time_now = datetime.now() - self.robot.time_started
-            return (time_now / time_total) * 100
-        else:
-            time_total = self.robot.time_when_available - self.robot.time_started
-            time_now = datetime.now() - self.robot.time_started
-
-            return (time_now / time_total) * 100
+        return self.state().progress(self.now())
 
     def start_action(self, session: SESSION, now: datetime) -> None:
         def action_will_take() -> timedelta:
@@ -105,17 +264,13 @@ class RobotController:
             How much time will the action take? Can't use a mapping for this
             one since one of the action is random.
             """
-            if self.action == RobotAction.MINING_FOO:
-                return timedelta(seconds=2)
+            if self.action == RobotAction.MINING_BAR:
+                parent = self.parent_controller()
+                randint = parent.rng.randint if parent else random.randint
+                return timedelta(milliseconds=randint(*MINING_BAR_DURATION))
 
-            elif self.action == RobotAction.MINING_BAR:
-                return timedelta(milliseconds=random.randint(500, 2000))
-
-            elif self.action == RobotAction.MAKING_FOOBAR:
-                return timedelta(seconds=2)
-
-            elif self.action == RobotAction.SELLING_FOOBAR:
-                return timedelta(seconds=10)
+            elif self.action in ACTION_DURATIONS:
+                return ACTION_DURATIONS[self.action]
 
             raise AssertionError("The robot's action is in an incoherent state.")
 
@@ -148,7 +303,7 @@ class RobotController:
         """
         Check if current action is done, and updates state accordingly.
         """
-        self.robot = session.merge(self.robot)
+        self.attach(session)
 
         # Short-circuit if the robot is doing nothing.
         if self.action is None:
@@ -160,23 +315,30 @@ class RobotController:
                 self.robot.time_when_available = None
                 self.start_action(session, now)
 
-            return
-
         # Is the robot done with its action?
-        assert self.robot.time_when_done
-        if self.robot.time_when_done <= now:
-            if self.action_done(session):
-                self.start_action(session, now)
-            else:
-                self.action = None
+        else:
+            assert self.robot.time_when_done
+            if self.robot.time_when_done <= now:
+                if self.action_done(session):
+                    self.start_action(session, now)
+                else:
+                    self.action = None
+
+        self.reschedule()
+        self.record(session)
+        self.emit(session, RobotChanged(self.id))
 
     def change_action(self, session: SESSION, new_action: RobotAction) -> None:
-        self.robot = session.merge(self.robot)
+        self.attach(session)
 
-        now = datetime.now()
+        now = self.now()
         self.action = new_action
         self.robot.time_started = now
-        self.robot.time_when_available = now + timedelta(seconds=5)
+        self.robot.time_when_available = now + CHANGE_DURATION
+
+        self.reschedule()
+        self.record(session)
+        self.emit(session, RobotChanged(self.id))
 
 
 class StateController:
@@ -188,37 +350,256 @@ class StateController:
     # The factory used to make a Robot controller, useful when subclassing
     ROBOT_CONTROLLER_FACTORY = RobotController
 
+    # How mined products get their serial
+    SERIAL_STRATEGY: Type[SerialStrategy] = CounterSerials
+
     # The Session type used for queries
     SESSION: TypeAlias = SASession
 
-    def __init__(self) -> None:
-        self.faker = Faker()
+    # Compare the inventory counters with actual counts each time they're read.
+    # This is slow, and meant for debugging.
+    CHECK_COUNTS = False
+
+    # How late robots can be updated before they catch up on what they missed
+    # at once, instead of finishing a single action.
+    CATCH_UP_AFTER = timedelta(seconds=1)
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        # Where the luck of the game comes from, so that a game can be played
+        # again from its seed.
+        self.rng = random.Random(seed)
+
         self.robot_cache: dict[int, RobotController] = {}
+        self.scheduler = Scheduler()
+        self.ledger = EuroLedger()
+        self.counters = InventoryCounters(self.ledger)
+        self.events = EventBus()
+        self.serials = self.SERIAL_STRATEGY()
+        self.serials.reserved = self.counter_reserved
+        self.names = NamePool()
+        self.names.reserved = self.counter_reserved
+
+        # What other threads asked us to do, to be run where the state lives.
+        self.commands: queue.SimpleQueue[Command] = queue.SimpleQueue()
+
+        # Where the time comes from. None means the wall clock, but a
+        # simulation can plug a virtual clock in there.
+        self.clock: Optional[Callable[[], datetime]] = None
+
+        # The save the game was last saved to or loaded from, and the journal
+        # of what happened since, kept next to it.
+        self.savefile: Optional[str] = None
+        self.journal: Optional[Journal] = None
+
+    def now(self) -> datetime:
+        """
+        Returns the current time of the game.
+        """
+        if self.clock:
+            return self.clock()
+
+        return datetime.now()
+
+    def load(
+        self,
+        filename: str,
+        pages: int = -1,
+        progress: Optional[BackupProgress] = None,
+        keep_journal: bool = True,
+    ) -> None:
+        """
+        Replaces the game with a save. If pages is given, the file is read that
+        many pages at a time into memory, and progress is called after each
+        step. The game can go on from there, and is only replaced at the end.
+
+        Compressed saves are recognized from their content, and decompressed
+        to a temporary file first.
 
-    def load(self, filename: str) -> None:
+        The save's journal is replayed, and unless keep_journal is False, what
+        happens next is written to it.
+        """
         assert factory.database.engine.dialect.name == "sqlite"
 
-        # Loading the file
-        savefile = sqlite3.connect(filename)
+        with tempfile.TemporaryDirectory() as directory:
+            # Loading the file
+            if factory.savefile.is_compressed(filename):
+                copy = os.path.join(directory, "save.sqlite3")
+                factory.savefile.decompress(filename, copy, pages, progress)
+                savefile = sqlite3.connect(copy)
 
-        # Getting the raw SQLite connection
-        raw_connection = factory.database.engine.raw_connection()
+            else:
+                savefile = sqlite3.connect(filename)
+
+                if pages > 0:
+                    staging = sqlite3.connect(":memory:")
+                    savefile.backup(staging, pages=pages, progress=progress)
+                    savefile.close()
+                    savefile = staging
+
+            # Getting the raw SQLite connection
+            raw_connection = factory.database.engine.raw_connection()
+
+            # The stubs must be out-of-date, but this attribute exists (as of
+            # 1.4.23). mypy doesn't recognize it, so we have to ignore.
+            savefile.backup(raw_connection.dbapi_connection)  # type: ignore
+            savefile.close()
+            raw_connection.close()
 
-        # The stubs must be out-of-date, but this attribute exists (as of 1.4.23).
-        # mypy doesn't recognize it, so we have to ignore.
-        savefile.backup(raw_connection.dbapi_connection)  # type: ignore
+        # The save might come from an older version.
+        factory.database.migrate()
 
-    def save(self, filename: str) -> None:
+        # What happened after the copy was made, maybe up to a crash.
+        with factory.database.engine.begin() as connection:
+            Journal.replay(connection, journal_path(filename))
+        if keep_journal:
+            self.start_journal(filename, truncate=False)
+
+        with self.model_session() as session:
+            self.reload(session)
+
+    def start(self, session: SESSION, robots: int = 2) -> None:
+        """
+        Gets the game going. A game kept in a file goes on where it was, and
+        a game without robots is given that many to start with.
+        """
+        if factory.database.is_persistent():
+            self.reload(session)
+
+        if session.scalar(sa.select(Robot.id).limit(1)) is None:
+            for _ in range(robots):
+                self.new_robot(session)
+
+    def reload(self, session: SESSION) -> None:
+        """
+        Forgets everything we know about the robots, and reads them back
+        from the database. To be used when the database was replaced.
+        """
+        self.robot_cache.clear()
+        self.scheduler.clear()
+        self.serials.clear()
+        self.names.clear()
+
+        for robot in self.list_robots(session):
+            robot.reschedule()
+
+        self.counters.rebuild(session)
+        self.events.publish(StateReloaded())
+
+    def save(
+        self,
+        filename: str,
+        pages: int = -1,
+        progress: Optional[BackupProgress] = None,
+    ) -> None:
+        """
+        Copies the game to a file. If pages is given, the game is first copied
+        in memory, at once, then written that many pages at a time, and
+        progress is called after each step. The game can go on meanwhile, the
+        file will be what it was when the save started.
+
+        If the filename ends with factory.savefile.COMPRESSED_SUFFIX, the save
+        is compressed, and pages are counted in the uncompressed copy.
+        """
         assert factory.database.engine.dialect.name == "sqlite"
 
         # Getting the raw SQLite connection
         raw_connection = factory.database.engine.raw_connection()
 
+        if factory.savefile.wants_compression(filename):
+            with tempfile.TemporaryDirectory() as directory:
+                copy = os.path.join(directory, "save.sqlite3")
+                factory.savefile.vacuum_into(
+                    raw_connection.dbapi_connection, copy  # type: ignore
+                )
+                raw_connection.close()
+                self.start_journal(filename)
+
+                factory.savefile.compress(copy, filename, pages, progress)
+
+            return
+
         # Creating the file
         savefile = sqlite3.connect(filename)
 
-        # Same, mypy isn't aware of the ConnectionFairy proxy, apparently
-        raw_connection.backup(savefile)  # type: ignore
+        if pages > 0:
+            # Writing to an in-memory database restarts its backup, so we
+            # can't copy the game itself bit by bit.
+            staging = sqlite3.connect(":memory:")
+            raw_connection.backup(staging)  # type: ignore
+            raw_connection.close()
+
+            # What happens from now on isn't in the copy.
+            self.start_journal(filename)
+
+            staging.backup(savefile, pages=pages, progress=progress)
+            staging.close()
+        else:
+            # Same, mypy isn't aware of the ConnectionFairy proxy, apparently
+            raw_connection.backup(savefile)  # type: ignore
+            raw_connection.close()
+            self.start_journal(filename)
+
+        savefile.close()
+
+    def save_changes(self) -> None:
+        """
+        Saves the game to the file it was last saved to or loaded from. Only
+        the journal has to be synced, which costs what changed since the last
+        save. When the journal gets bigger than the copy, replaying it would
+        take longer than reading a new copy, so one is made instead.
+        """
+        assert self.savefile and self.journal, "The game was never saved."
+
+        if self.journal.size > os.path.getsize(self.savefile):
+            self.save(self.savefile)
+        else:
+            self.journal.sync()
+
+    def start_journal(self, filename: str, truncate: bool = True) -> None:
+        """
+        Starts writing what happens next to the journal of a save. Unless
+        truncate is False, what the journal held is forgotten.
+
+        A game kept in a file has every commit in it already, and is saved
+        by a checkpoint, so it doesn't keep a journal.
+        """
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+        self.savefile = filename
+        path = journal_path(filename)
+
+        if not factory.database.is_persistent():
+            self.journal = Journal(path, truncate)
+        elif truncate and os.path.exists(path):
+            # The save is a full copy, what was journaled before is in it.
+            os.remove(path)
+
+    def counter_reserved(self, session: SESSION, counter: str, end: int) -> None:
+        """
+        Journals that a counter of the global state was reserved up to end, so
+        that what was given out isn't given again after a replay.
+        """
+        self.record(session, ("counter", counter, end))
+
+    def record(self, session: SESSION, entry: Entry) -> None:
+        """
+        Writes a change to the journal, if there is one, when the session
+        commits.
+        """
+        if self.journal:
+            self.journal.record(session, entry)
+
+    def checkpoint(self) -> None:
+        """
+        Saves a game that is kept in a file. Everything committed is already
+        in the write-ahead log, so this only moves it into the file, which
+        costs what changed since the last checkpoint.
+        """
+        assert factory.database.is_persistent(), "The game is only in memory."
+
+        factory.database.checkpoint()
 
     @contextmanager
     def model_session(self) -> Iterator[SASession]:
@@ -233,55 +614,225 @@ class StateController:
     def get_from_cache_or_create(self, robot: Robot) -> RobotController:
         _robot_controller = self.robot_cache.get(robot.id)
         if _robot_controller:
+            # The given instance is the freshest, the cached one may be detached.
+            _robot_controller.robot = robot
             return _robot_controller
 
         self.robot_cache[robot.id] = self.ROBOT_CONTROLLER_FACTORY(self, robot)
         return self.robot_cache[robot.id]
 
-    def update(self, session: SESSION) -> None:
+    def get_robot(self, session: SESSION, robot_id: int) -> RobotController:
         """
-        Updates the state.
+        Returns the controller of a robot, from the cache if possible.
         """
-        now = datetime.now()
+        _robot_controller = self.robot_cache.get(robot_id)
+        if _robot_controller:
+            return _robot_controller
 
-        for robot in self.list_robots(session):
+        robot = session.get(Robot, robot_id)
+        assert robot, f"Robot {robot_id} doesn't exist."
+        return self.get_from_cache_or_create(robot)
+
+    def submit(self, command: Command) -> None:
+        """
+        Asks for the command to be run by run_commands. This can be called
+        from any thread.
+        """
+        self.commands.put(command)
+
+    def run_commands(self, session: SESSION) -> None:
+        """
+        Runs the submitted commands, each one in its own transaction.
+        """
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+
+            command(session)
+            session.commit()
+
+    def update(self, session: SESSION) -> list[RobotController]:
+        """
+        Updates the robots whose action or change is done. Returns the robots
+        that were updated.
+        """
+        now = self.now()
+        if self.behind(now):
+            return self.catch_up(session)
+
+        robots = self.due_robots(session, now)
+        for robot in robots:
             robot.update(session, now)
 
+        return robots
+
+    def due_robots(self, session: SESSION, now: datetime) -> list[RobotController]:
+        """
+        Returns the robots whose action or change is done, in the order they
+        were, and forgets about them until they're rescheduled.
+        """
+        return [
+            self.get_robot(session, robot_id)
+            for robot_id in self.scheduler.pop_due(now)
+        ]
+
+    def behind(self, now: datetime) -> bool:
+        """
+        Were robots due so long ago that they must catch up?
+        """
+        next_event = self.next_event()
+        return next_event is not None and now - next_event > self.CATCH_UP_AFTER
+
+    def catch_up(self, session: SESSION) -> list[RobotController]:
+        """
+        Updates the robots that are due as if they had been all along, in a
+        few statements: every action they finished is accounted for, in the
+        order they were, and they're left doing their last one. Returns the
+        robots that were updated.
+        """
+        now = self.now()
+        robots = self.due_robots(session, now)
+        result = factory.catchup.plan(
+            [robot.state() for robot in robots], self.counts(session), now, self.rng
+        )
+
+        mined: Tuple[Tuple[Type[UsableObject], int], ...] = (
+            (Foo, result.foos),
+            (Bar, result.bars),
+        )
+        for product_cls, n in mined:
+            self.add_products(
+                session,
+                product_cls,
+                [{"serial": serial} for serial in self.serials.many(session, n)],
+            )
+
+        foo_ids = self.consume_products(session, Foo, result.foos_used)
+        bar_ids = self.consume_products(session, Bar, result.bars_used)
+        self.add_products(
+            session,
+            Foobar,
+            [
+                {"foo_used_id": foo_ids[foo], "bar_used_id": bar_ids[bar]}
+                for foo, bar in result.foobars
+            ],
+        )
+
+        self.consume_products(session, Foobar, result.foobars_sold)
+        if result.euros > 0:
+            self.add_euros(session, result.euros)
+        elif result.euros < 0:
+            spent = self.sub_euros(session, -result.euros)
+            assert spent, "Robots were bought with euros we don't have."
+        self.new_robots(session, result.robots_bought)
+
+        for robot in robots:
+            state = result.robots[robot.id]
+            robot.attach(session)
+            robot.action = state.action
+            robot.robot.time_started = state.time_started
+            robot.robot.time_when_available = state.time_when_available
+            robot.robot.time_when_done = state.time_when_done
+
+            robot.reschedule()
+            robot.record(session)
+            robot.emit(session, RobotChanged(robot.id))
+
+        return robots
+
+    def next_event(self) -> Optional[datetime]:
+        """
+        Returns when the next robot will be done with its action or with
+        changing actions, or None if every robot is idle.
+        """
+        return self.scheduler.peek()
+
     def counts(self, session: SESSION) -> Tuple[int, int, int, int]:
         """
         Returns number of foo, bar, foobars and euros.
         """
-        return (
-            Foo.count_not_used(session),
-            Bar.count_not_used(session),
-            Foobar.count_not_used(session),
-            session.scalar(sa.select(GlobalState.euros)),
-        )
+        if self.CHECK_COUNTS:
+            self.check_counts(session)
+
+        return self.counters.get(session)
+
+    def check_counts(self, session: SESSION) -> None:
+        """
+        Makes sure the inventory counters agree with the database.
+        """
+        self.ledger.settle(session)
+        counted = count_from_database(session)
+        maintained = self.counters.get(session)
+
+        assert (
+            counted == maintained
+        ), f"Counters are {maintained}, but the database has {counted}."
 
     def add_euros(self, session: SESSION, n: int) -> None:
-        current_euros = session.scalar(sa.select(GlobalState.euros))
+        """
+        Earns euros. They're written to the database when the session commits.
+        """
+        self.ledger.add(session, n)
+        self.counters.add(session, euros=n)
+        self.record(session, ("euros", n))
+        self.events.emit(session, InventoryChanged())
 
-        session.execute(sa.update(GlobalState).values(euros=current_euros + n))
+    def sub_euros(self, session: SESSION, n: int) -> bool:
+        """
+        Spends euros, if there are enough of them in the database. Returns
+        whether they were spent.
+        """
+        # What we earned might be needed to pay.
+        self.ledger.settle(session)
+
+        if not GlobalState.spend_euros(session, n):
+            return False
 
-    def sub_euros(self, session: SESSION, n: int) -> None:
-        current_euros = session.scalar(sa.select(GlobalState.euros))
+        self.counters.add(session, euros=-n)
+        self.record(session, ("euros", -n))
+        self.events.emit(session, InventoryChanged())
+        return True
 
-        session.execute(sa.update(GlobalState).values(euros=current_euros - n))
+    def list_robots(self, session: SESSION, after_id: int = 0) -> list[RobotController]:
+        """
+        Returns the robots, in the order they were made. If after_id is given,
+        only the robots made after that one are returned.
+        """
+        query = sa.select(Robot).where(Robot.id > after_id).order_by(Robot.id)
 
-    def list_robots(self, session: SESSION) -> list[RobotController]:
         return [
             self.get_from_cache_or_create(robot)
-            for robot in session.scalars(sa.select(Robot)).all()
+            for robot in session.scalars(query).all()
         ]
 
-    def list_sold_foobars(self, session: SESSION) -> list[Foobar]:
-        return session.scalars(sa.select(Foobar).where(Foobar.used)).all()
+    def list_sold_foobars_since(
+        self, session: SESSION, after_id: int = 0, limit: Optional[int] = None
+    ) -> list[SoldFoobar]:
+        """
+        Returns the foobars sold with an id higher than after_id, with only the
+        serials of what they're made of, in a single query.
+
+        Foobars are sold in the order they were made, so the highest id we got
+        is enough to know where we stopped.
+        """
+        query = (
+            sa.select(Foobar.id, Foo.serial, Bar.serial)
+            .outerjoin(Foo, Foobar.foo_used_id == Foo.id)
+            .outerjoin(Bar, Foobar.bar_used_id == Bar.id)
+            .where(Foobar.used, Foobar.id > after_id)
+            .order_by(Foobar.id)
+            .limit(limit)
+        )
+
+        return [SoldFoobar(*row) for row in session.execute(query)]
 
     def new_robot(self, session: SESSION) -> RobotController:
         """
         Generate a new robot with a unique name.
         """
-        name = self.faker.unique.name()
+        (name,) = self.names.take(session, 1)
 
         robot = Robot(
             name=name,
@@ -291,21 +842,176 @@ class StateController:
         )
 
         session.add(robot)
+        # We need the id to cache the controller.
+        session.flush()
+        self.record(session, robot)
+        self.events.emit(session, RobotAdded(robot.id))
+
         return self.get_from_cache_or_create(robot)
 
+    def new_robots(self, session: SESSION, n: int) -> list[int]:
+        """
+        Generates n robots with unique names, in a single statement, and
+        returns their ids. Unlike new_robot, this doesn't load them.
+        """
+        if n <= 0:
+            return []
+
+        names = self.names.take(session, n)
+        last_id = session.scalar(sa.select(sa.func.max(Robot.id))) or 0
+
+        # Sent as a single statement, executed for each robot.
+        session.execute(sa.insert(Robot), [{"name": name} for name in names])
+        ids = session.scalars(
+            sa.select(Robot.id).where(Robot.id > last_id).order_by(Robot.id)
+        ).all()
+
+        for robot_id, name in zip(ids, names):
+            self.record(session, ("row", "robot", {"id": robot_id, "name": name}))
+            self.events.emit(session, RobotAdded(robot_id))
+
+        return ids
+
+    def change_actions(
+        self,
+        session: SESSION,
+        robot_ids: Optional[Iterable[int]],
+        action: RobotAction,
+        doing: Optional[Iterable[Optional[RobotAction]]] = None,
+        id_range: Optional[Tuple[int, int]] = None,
+    ) -> list[int]:
+        """
+        Gives robots a new action, in a single statement, and returns their
+        ids. Robots are chosen by id, all of them if robot_ids is None, and
+        only those doing one of the actions of doing (None for idle robots),
+        and whose id is within id_range, both ends included, are changed.
+        """
+        conditions = []
+        if robot_ids is not None:
+            conditions.append(Robot.id.in_(list(robot_ids)))
+        if id_range is not None:
+            conditions.append(Robot.id.between(*id_range))
+        if doing is not None:
+            actions = list(doing)
+            condition = Robot.action.in_([a for a in actions if a is not None])
+            if None in actions:
+                condition = sa.or_(condition, Robot.action.is_(None))
+            conditions.append(condition)
+
+        ids = session.scalars(
+            sa.select(Robot.id).where(*conditions).order_by(Robot.id)
+        ).all()
+        if not ids:
+            return []
+
+        now = self.now()
+        available = now + CHANGE_DURATION
+        session.execute(
+            sa.update(Robot)
+            .where(*conditions)
+            .values(action=action, time_started=now, time_when_available=available)
+            .execution_options(synchronize_session=False)
+        )
+
+        self.actions_changed(session, ids, action, now, available)
+        self.record(
+            session,
+            ("actions", tuple(ids), encode(action), encode(now), encode(available)),
+        )
+        for robot_id in ids:
+            self.events.emit(session, RobotChanged(robot_id))
+
+        return ids
+
+    def actions_changed(
+        self,
+        session: SESSION,
+        robot_ids: list[int],
+        action: RobotAction,
+        started: datetime,
+        available: datetime,
+    ) -> None:
+        """
+        Brings what we know about the robots up to date with a change of
+        action that was already written.
+        """
+        for robot_id in robot_ids:
+            self.scheduler.schedule(robot_id, available)
+
+            # Robots that aren't cached are read when they're needed.
+            robot_controller = self.robot_cache.get(robot_id)
+            if robot_controller:
+                # Written as committed, so that they aren't written again.
+                robot = robot_controller.robot
+                set_committed_value(robot, "action", action)
+                set_committed_value(robot, "time_started", started)
+                set_committed_value(robot, "time_when_available", available)
+
+    def add_products(
+        self,
+        session: SESSION,
+        product_cls: Type[UsableObject],
+        rows: list[dict[str, Any]],
+    ) -> None:
+        """
+        Makes products from their rows, in a single statement. Unlike adding
+        them to the session, this doesn't load them.
+        """
+        if not rows:
+            return
+
+        if self.journal:
+            # The journal needs their ids, which executemany doesn't return.
+            last = sa.select(sa.func.max(product_cls.id))  # type: ignore
+            last_id = session.scalar(last)
+            session.execute(sa.insert(product_cls), rows)
+            ids = session.scalars(
+                sa.select(product_cls.id)  # type: ignore
+                .where(product_cls.id > (last_id or 0))  # type: ignore
+                .order_by(product_cls.id)  # type: ignore
+            )
+
+            table = product_cls.__tablename__  # type: ignore
+            for product_id, row in zip(ids, rows):
+                self.record(session, ("row", table, {"id": product_id, **row}))
+        else:
+            session.execute(sa.insert(product_cls), rows)
+
+        self.counters.add_products(session, product_cls, len(rows))
+        self.events.emit(session, InventoryChanged())
+
+    def consume_products(
+        self, session: SESSION, product_cls: Type[UsableObject], n: int
+    ) -> list[int]:
+        """
+        Uses at max n products, in the order they were made, and returns their
+        ids. This doesn't load them.
+        """
+        ids = product_cls.use(session, n)
+        self.counters.add_products(session, product_cls, -len(ids))
+
+        if ids:
+            self.record(
+                session, ("use", product_cls.__tablename__, tuple(ids))  # type: ignore
+            )
+            self.events.emit(session, InventoryChanged())
+        if ids and product_cls is Foobar:
+            self.events.emit(session, FoobarsSold(tuple(ids)))
+
+        return ids
+
     def use_product(
         self, session: SESSION, product: Type[UsableObject]
     ) -> Optional[UsableObject]:
         """
         Uses a product and returns the product
         """
-        obj = session.scalar(sa.select(product).where(not_(product.used)))
-
-        if obj:
-            obj.used = True
+        ids = self.consume_products(session, product, 1)
+        if not ids:
+            return None
 
-        # Type of obj is either None or the queried type, but mypy can't check this.
-        return obj  # type: ignore
+        # It might have been loaded before being used.
+        return session.get(product, ids[0], populate_existing=True)
 
     def use_n_products(
         self, session: SESSION, product_cls: Type[UsableObject], n: int
@@ -313,14 +1019,7 @@ class StateController:
         """
         Uses at max n products, return the number that was used.
         """
-        query = sa.select(product_cls).where(not_(product_cls.used)).limit(n)
-
-        used_products = session.scalars(query).all()
-
-        for product in used_products:
-            product.used = True
-
-        return len(used_products)
+        return len(self.consume_products(session, product_cls, n))
 
     def robot_action_done(self, action: RobotAction, session: SESSION) -> bool:
         """
@@ -331,28 +1030,40 @@ class StateController:
 
         if action == RobotAction.MINING_FOO:
             # Create a new Foo. This can't fail.
-            session.add(Foo())
+            foo = Foo(serial=self.serials.next(session))
+            session.add(foo)
+            self.record(session, foo)
+            self.counters.add(session, foo=1)
+            self.events.emit(session, InventoryChanged())
 
             return True
 
         elif action == RobotAction.MINING_BAR:
             # Same but for Bar.
-            session.add(Bar())
+            bar = Bar(serial=self.serials.next(session))
+            session.add(bar)
+            self.record(session, bar)
+            self.counters.add(session, bar=1)
+            self.events.emit(session, InventoryChanged())
 
             return True
 
         elif action == RobotAction.MAKING_FOOBAR:
             if foo_count >= 1 and bar_count >= 1:
                 # We use the foo anyway, even if it fails.
-                foo: Foo = self.use_product(session, Foo)  # type: ignore
+                (foo_id,) = self.consume_products(session, Foo, 1)
 
-                chance_of_success = random.randint(1, 100)
-                if chance_of_success > 60:  # Making Foobar failed.
+                chance_of_success = self.rng.randint(1, 100)
+                if chance_of_success > FOOBAR_SUCCESS:  # Making Foobar failed.
                     return True
 
-                bar: Bar = self.use_product(session, Bar)  # type: ignore
+                (bar_id,) = self.consume_products(session, Bar, 1)
 
-                session.add(Foobar(foo_used=foo, bar_used=bar))
+                foobar = Foobar(foo_used_id=foo_id, bar_used_id=bar_id)
+                session.add(foobar)
+                self.record(session, foobar)
+                self.counters.add(session, foobar=1)
+                self.events.emit(session, InventoryChanged())
 
                 return True
             return False
@@ -361,7 +1072,7 @@ class StateController:
             if foobar_count == 0:
                 return False
 
-            nb_foobar_to_sell = random.randint(1, 5)
+            nb_foobar_to_sell = self.rng.randint(1, SALE_SIZE)
 
             # If we have less than the amount to sell but still not 0, we still sell the
             # max we can.
@@ -371,9 +1082,14 @@ class StateController:
             return True
 
         elif action == RobotAction.BUYING_ROBOT:  # This one finished instantly
-            if foo_count >= 6 and euros_count >= 3:
-                self.use_n_products(session, Foo, 6)
-                self.sub_euros(session, 3)
+            # Someone else might have spent the euros in the meantime.
+            foo_price, euro_price = ROBOT_PRICE
+            if (
+                foo_count >= foo_price
+                and euros_count >= euro_price
+                and self.sub_euros(session, euro_price)
+            ):
+                self.use_n_products(session, Foo, foo_price)
                 self.new_robot(session)
 
             return False
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import threading
+import weakref
+from typing import Optional, Tuple, Type
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import SessionTransaction
+
+from factory.ledger import EuroLedger
+from factory.models import Bar, Foo, Foobar, GlobalState, UsableObject
+
+Counts = Tuple[int, int, int, int]
+
+# Where each product is in the counts.
+PRODUCT_INDEX: dict[type, int] = {Foo: 0, Bar: 1, Foobar: 2}
+
+
+def count_from_database(session: SASession) -> Counts:
+    """
+    Actually counts the number of unused foo, bar, foobars, and the euros.
+    """
+    return (
+        Foo.count_not_used(session),
+        Bar.count_not_used(session),
+        Foobar.count_not_used(session),
+        session.scalar(sa.select(GlobalState.euros)),
+    )
+
+
+class InventoryCounters:
+    """
+    Keeps the number of unused foos, bars, foobars, and the euros, so we don't
+    have to count them again every time someone asks.
+
+    Changes are kept aside for each session, and are only added to the
+    committed counts when that session commits. If the transaction ends any
+    other way, they're forgotten, just like the rows they were counting.
+    """
+
+    def __init__(self, ledger: Optional[EuroLedger] = None) -> None:
+        # Euros not written yet, that we need to write before counting.
+        self.ledger = ledger
+
+        self.committed: Optional[list[int]] = None
+        self.pending: weakref.WeakKeyDictionary[
+            SASession, list[int]
+        ] = weakref.WeakKeyDictionary()
+        self.hooked_sessions: weakref.WeakSet[SASession] = weakref.WeakSet()
+
+        # Sessions from other threads might commit while we read.
+        self.lock = threading.Lock()
+
+    def hook(self, session: SASession) -> None:
+        """
+        Listens to the end of the session's transactions.
+        """
+        if session in self.hooked_sessions:
+            return
+
+        sa.event.listen(session, "after_commit", self.after_commit)
+        sa.event.listen(session, "after_transaction_end", self.after_transaction_end)
+        self.hooked_sessions.add(session)
+
+    def after_commit(self, session: SASession) -> None:
+        with self.lock:
+            changes = self.pending.pop(session, None)
+            if changes and self.committed is not None:
+                self.committed = [a + b for a, b in zip(self.committed, changes)]
+
+    def after_transaction_end(
+        self, session: SASession, transaction: SessionTransaction
+    ) -> None:
+        # Only the outermost transaction matters. If it was committed, the
+        # changes were already applied.
+        if transaction.parent is None:
+            with self.lock:
+                self.pending.pop(session, None)
+
+    def rebuild(self, session: SASession) -> None:
+        """
+        Counts everything again from the database. The session sees its own
+        changes, so they're taken back out of the committed counts, and stay
+        pending until the session commits or rolls back.
+        """
+        if self.ledger:
+            self.ledger.settle(session)
+
+        counts = count_from_database(session)
+
+        with self.lock:
+            changes = self.pending.get(session, [0, 0, 0, 0])
+            self.committed = [a - b for a, b in zip(counts, changes)]
+
+    def get(self, session: SASession) -> Counts:
+        """
+        Returns the counts as seen by the given session.
+        """
+        if self.committed is None:
+            self.rebuild(session)
+
+        with self.lock:
+            assert self.committed is not None
+            changes = self.pending.get(session, [0, 0, 0, 0])
+            foo, bar, foobar, euros = (a + b for a, b in zip(self.committed, changes))
+
+        return foo, bar, foobar, euros
+
+    def add(
+        self,
+        session: SASession,
+        foo: int = 0,
+        bar: int = 0,
+        foobar: int = 0,
+        euros: int = 0,
+    ) -> None:
+        """
+        Records a change made in the session's current transaction.
+        """
+        self.hook(session)
+
+        with self.lock:
+            changes = self.pending.setdefault(session, [0, 0, 0, 0])
+            changes[0] += foo
+            changes[1] += bar
+            changes[2] += foobar
+            changes[3] += euros
+
+    def add_products(
+        self, session: SASession, product_cls: Type[UsableObject], n: int
+    ) -> None:
+        """
+        Records that n products of the given type were made (or used, if n is
+        negative).
+        """
+        self.hook(session)
+
+        with self.lock:
+            changes = self.pending.setdefault(session, [0, 0, 0, 0])
+            changes[PRODUCT_INDEX[product_cls]] += n
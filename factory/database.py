@@ -1,11 +1,127 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any
+
 import sqlalchemy as sa
-from sqlalchemy.engine import create_engine
+from sqlalchemy.engine import Engine, create_engine, make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.schema import CreateColumn
 
 from factory.models import Base, GlobalState
 
-engine = create_engine("sqlite:///:memory:")
-Session = scoped_session(sessionmaker(engine))
+# Where the game is kept, unless told otherwise.
+DEFAULT_URL = os.environ.get("FACTORY_DATABASE_URL", "sqlite:///:memory:")
+
+
+@dataclass(frozen=True)
+class Pragmas:
+    """
+    How SQLite should be tuned, set on every new connection. See
+    https://www.sqlite.org/pragma.html for what they mean.
+    """
+
+    # WAL lets readers and the writer work at the same time, and makes each
+    # commit an append to the log. It's ignored for in-memory databases.
+    journal_mode: str = "wal"
+    # With WAL, "normal" is safe against corruption, and only loses the last
+    # commits if the machine itself crashes.
+    synchronous: str = "normal"
+    # Negative means KiB, so 64 MiB of page cache.
+    cache_size: int = -64000
+    mmap_size: int = 256 * 1024 * 1024
+    temp_store: str = "memory"
+
+    def statements(self) -> list[str]:
+        # These are written into SQL, so make sure they're what we expect.
+        assert self.journal_mode in ("delete", "truncate", "persist", "memory", "wal")
+        assert self.synchronous in ("off", "normal", "full", "extra")
+        assert self.temp_store in ("default", "file", "memory")
+
+        return [
+            f"PRAGMA journal_mode = {self.journal_mode}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA cache_size = {int(self.cache_size)}",
+            f"PRAGMA mmap_size = {int(self.mmap_size)}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+
+
+def is_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def make_engine(url: str = DEFAULT_URL, pragmas: Pragmas = Pragmas()) -> Engine:
+    """
+    Creates an engine to the given database, with the pragmas set on each
+    connection.
+    """
+    if is_memory(url):
+        # Each connection to an in-memory database gets its own database, so
+        # every thread has to share the same one. Only one thread uses it at
+        # a time.
+        new_engine = create_engine(
+            url, poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+    else:
+        # Keep the connections open: closing the last one checkpoints the
+        # database, which we want to decide ourselves. A connection is only
+        # used by one thread at a time, but not always the same.
+        new_engine = create_engine(
+            url, poolclass=QueuePool, connect_args={"check_same_thread": False}
+        )
+
+    statements = pragmas.statements()
+
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    sa.event.listen(new_engine, "connect", set_pragmas)
+
+    return new_engine
+
+
+engine = make_engine()
+# Controllers keep the objects they're given between sessions, and robots only
+# get merged back into a session when something happens to them. Expiring them
+# at each commit would leave them unreadable once the session is closed.
+Session = scoped_session(sessionmaker(engine, expire_on_commit=False))
+
+
+def configure(url: str, pragmas: Pragmas = Pragmas()) -> None:
+    """
+    Makes the game use another database. To be called before anything was
+    read from the current one.
+    """
+    global engine
+
+    engine.dispose()
+    engine = make_engine(url, pragmas)
+
+    Session.remove()
+    Session.configure(bind=engine)
+
+
+def is_persistent() -> bool:
+    """
+    Whether the database is kept in a file, rather than in memory.
+    """
+    return not is_memory(str(engine.url))
+
+
+def checkpoint() -> None:
+    """
+    Makes sure everything committed is in the database file itself, and
+    empties the write-ahead log. This is all it takes to save a game that is
+    kept in a file.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
 
 
 def init_database() -> None:
@@ -13,6 +129,7 @@ def init_database() -> None:
     This initializes the database with every table it needs.
     """
     Base.metadata.create_all(engine)
+    migrate()
 
     # If there is no global state, we need to create it.
     with engine.begin() as conn:
@@ -20,3 +137,30 @@ def init_database() -> None:
 
         if not global_state:
             conn.execute(sa.insert(GlobalState))
+
+
+def migrate() -> None:
+    """
+    Brings a database made by a previous version up to date. For now, this
+    means adding the columns and creating the indexes it doesn't have.
+    """
+    inspector = sa.inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in columns:
+                    # New columns must have a server default, to fill the
+                    # rows that are already there.
+                    definition = CreateColumn(column).compile(engine)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {definition}"
+                    )
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
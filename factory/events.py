@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Type, TypeVar
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import SessionTransaction
+
+
+@dataclass(frozen=True)
+class Event:
+    """
+    Something changed in the state of the game.
+    """
+
+
+@dataclass(frozen=True)
+class RobotAdded(Event):
+    robot_id: int
+
+
+@dataclass(frozen=True)
+class RobotChanged(Event):
+    """
+    A robot changed action, started or finished one.
+    """
+
+    robot_id: int
+
+
+@dataclass(frozen=True)
+class InventoryChanged(Event):
+    """
+    Some counts of foos, bars, foobars or euros changed.
+    """
+
+
+@dataclass(frozen=True)
+class FoobarsSold(Event):
+    foobar_ids: tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class StateReloaded(Event):
+    """
+    The whole database was replaced, everything might have changed.
+    """
+
+
+E = TypeVar("E", bound=Event)
+Handler = Callable[[E], None]
+
+
+class EventBus:
+    """
+    Tells whoever subscribed what changed, so they don't have to look at
+    everything to find out.
+
+    Events emitted in a session are kept aside, and only published when the
+    session commits. If the transaction ends any other way, nothing happened.
+    The same event emitted twice in a transaction is only published once.
+
+    Handlers are called right after the commit, when the session can't be
+    used anymore, so they should only take note of what changed.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: defaultdict[type, list[Handler[Any]]] = defaultdict(list)
+        self.pending: weakref.WeakKeyDictionary[
+            SASession, dict[Event, None]
+        ] = weakref.WeakKeyDictionary()
+        self.hooked_sessions: weakref.WeakSet[SASession] = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+    def subscribe(self, event_type: Type[E], handler: Handler[E]) -> None:
+        self.handlers[event_type].append(handler)
+
+    def unsubscribe(self, event_type: Type[E], handler: Handler[E]) -> None:
+        self.handlers[event_type].remove(handler)
+
+    def hook(self, session: SASession) -> None:
+        """
+        Listens to the end of the session's transactions.
+        """
+        if session in self.hooked_sessions:
+            return
+
+        sa.event.listen(session, "after_commit", self.after_commit)
+        sa.event.listen(session, "after_transaction_end", self.after_transaction_end)
+        self.hooked_sessions.add(session)
+
+    def after_commit(self, session: SASession) -> None:
+        with self.lock:
+            events = self.pending.pop(session, {})
+
+        for event in events:
+            self.publish(event)
+
+    def after_transaction_end(
+        self, session: SASession, transaction: SessionTransaction
+    ) -> None:
+        if transaction.parent is None:
+            with self.lock:
+                self.pending.pop(session, None)
+
+    def emit(self, session: SASession, event: Event) -> None:
+        """
+        Publishes the event when the session's current transaction commits.
+        """
+        self.hook(session)
+
+        with self.lock:
+            self.pending.setdefault(session, {})[event] = None
+
+    def publish(self, event: Event) -> None:
+        """
+        Calls the handlers of the event right away.
+        """
+        for handler in self.handlers[type(event)]:
+            handler(event)
@@ -0,0 +1,553 @@
+"""
+The robots' actions and timings kept in arrays, one row per robot, so that a
+tick with many robots is a few passes over the arrays instead of a loop over
+their rows. It needs NumPy, which the game doesn't otherwise: only import
+this module when a FleetStateController is asked for.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import sqlalchemy as sa
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import SessionTransaction
+
+from factory.controller import RobotController, StateController
+from factory.events import RobotChanged
+from factory.journal import encode
+from factory.models import (
+    ACTION_DURATIONS,
+    MINING_BAR_DURATION,
+    Robot,
+    RobotAction,
+)
+
+Array = npt.NDArray[np.int64]
+
+# Actions are kept as their position in here, and no action as NO_ACTION.
+ACTIONS = list(RobotAction)
+NO_ACTION = -1
+BUYING_ROBOT = ACTIONS.index(RobotAction.BUYING_ROBOT)
+MINING_BAR = ACTIONS.index(RobotAction.MINING_BAR)
+
+# Times are kept in nanoseconds since EPOCH, and a time that isn't set as
+# NEVER, which no time reaches.
+EPOCH = datetime(1970, 1, 1)
+NEVER = np.iinfo(np.int64).max
+
+# How long each action takes, by position. Mining a bar is drawn for each
+# robot, and buying a robot doesn't take any time.
+DURATIONS = np.array(
+    [
+        ACTION_DURATIONS.get(action, timedelta()) // timedelta(microseconds=1) * 1000
+        for action in ACTIONS
+    ],
+    dtype=np.int64,
+)
+
+
+def to_ns(value: Optional[datetime]) -> int:
+    if value is None:
+        return int(NEVER)
+
+    return (value - EPOCH) // timedelta(microseconds=1) * 1000
+
+
+def from_ns(value: int) -> Optional[datetime]:
+    if value == NEVER:
+        return None
+
+    return EPOCH + timedelta(microseconds=int(value) // 1000)
+
+
+def to_datetimes(values: Array) -> list[Optional[datetime]]:
+    """
+    Converts many times at once.
+    """
+    never = values == NEVER
+    dates = np.where(never, 0, values).astype("datetime64[ns]").astype("datetime64[us]")
+
+    return [None if unset else date for date, unset in zip(dates.tolist(), never)]
+
+
+class Fleet:
+    """
+    The arrays, and what was changed in them during each session's current
+    transaction, to be written to the robot table in bulk when it commits.
+    If it doesn't, the robots it changed are read again.
+    """
+
+    # Rows the arrays start with. They double when they're full.
+    CAPACITY = 64
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+        self.size = 0
+        self.ids = np.zeros(self.CAPACITY, dtype=np.int64)
+        self.actions = np.full(self.CAPACITY, NO_ACTION, dtype=np.int8)
+        self.started = np.full(self.CAPACITY, NEVER, dtype=np.int64)
+        self.available = np.full(self.CAPACITY, NEVER, dtype=np.int64)
+        self.done = np.full(self.CAPACITY, NEVER, dtype=np.int64)
+        self.names: list[str] = []
+        self.rows: dict[int, int] = {}
+
+        # Rows changed by each session, and the robots of the transactions
+        # that didn't commit, to be read again.
+        self.pending: weakref.WeakKeyDictionary[
+            SASession, set[int]
+        ] = weakref.WeakKeyDictionary()
+        self.stale: set[int] = set()
+        self.hooked_sessions: weakref.WeakSet[SASession] = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+        # Called with the rows that were written, as they were, if given.
+        self.synced: Optional[Callable[[SASession, list[dict[str, Any]]], None]] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def clear(self) -> None:
+        self.size = 0
+        self.actions[:] = NO_ACTION
+        self.names.clear()
+        self.rows.clear()
+        self.stale.clear()
+
+        # Their rows now belong to other robots, or to none.
+        with self.lock:
+            self.pending.clear()
+
+    def add(self, robot: Robot) -> int:
+        """
+        Copies a robot into the arrays, and returns its row.
+        """
+        if self.size == len(self.ids):
+            self.grow()
+
+        row = self.size
+        self.size += 1
+
+        self.ids[row] = robot.id
+        self.names.append(robot.name)
+        self.rows[robot.id] = row
+        self.read(row, robot.action, robot)
+
+        return row
+
+    def read(self, row: int, action: Optional[RobotAction], robot: Any) -> None:
+        self.actions[row] = NO_ACTION if action is None else ACTIONS.index(action)
+        self.started[row] = to_ns(robot.time_started)
+        self.available[row] = to_ns(robot.time_when_available)
+        self.done[row] = to_ns(robot.time_when_done)
+
+    def grow(self) -> None:
+        capacity = 2 * len(self.ids)
+        for name, fill in (
+            ("ids", 0),
+            ("actions", NO_ACTION),
+            ("started", NEVER),
+            ("available", NEVER),
+            ("done", NEVER),
+        ):
+            array = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def deadlines(self) -> Array:
+        """
+        When each robot needs to be updated next, NEVER if it's idle.
+        """
+        n = self.size
+        deadlines = np.where(
+            self.available[:n] != NEVER, self.available[:n], self.done[:n]
+        )
+        deadlines[self.actions[:n] == NO_ACTION] = NEVER
+
+        return deadlines
+
+    def next_event(self) -> Optional[int]:
+        if not self.size:
+            return None
+
+        deadline = self.deadlines().min()
+        return None if deadline == NEVER else int(deadline)
+
+    def due(self, now: int) -> Array:
+        """
+        Returns the rows of the robots whose deadline has passed, in the order
+        they passed.
+        """
+        deadlines = self.deadlines()
+        rows = np.flatnonzero(deadlines <= now)
+
+        due: Array = rows[np.lexsort((self.ids[rows], deadlines[rows]))]
+        return due
+
+    def start(self, rows: Array, now: int) -> None:
+        """
+        Starts the action of each of the robots, which can't be buying a robot.
+        """
+        durations = DURATIONS[self.actions[rows]]
+
+        mining_bar = self.actions[rows] == MINING_BAR
+        low, high = MINING_BAR_DURATION
+        durations[mining_bar] = (
+            self.rng.integers(low, high + 1, size=int(mining_bar.sum())) * 1_000_000
+        )
+
+        self.started[rows] = now
+        self.available[rows] = NEVER
+        self.done[rows] = now + durations
+
+    def progress(self, now: int) -> npt.NDArray[np.float64]:
+        """
+        Returns, for every robot, a float between 0 and 100 to indicate the
+        progress with its current task, whether it's changing or not. Idle
+        robots get NaN.
+        """
+        n = self.size
+        end = np.where(self.available[:n] != NEVER, self.available[:n], self.done[:n])
+        idle = self.actions[:n] == NO_ACTION
+
+        # Idle robots might not have times, which mustn't get in the way.
+        started = np.where(idle, 0, self.started[:n])
+        total = np.where(idle, 1, end - started)
+        progress = (now - started) / total * 100
+
+        return np.where(idle, np.nan, progress)
+
+    def hook(self, session: SASession) -> None:
+        """
+        Listens to the end of the session's transactions.
+        """
+        if session in self.hooked_sessions:
+            return
+
+        sa.event.listen(session, "before_commit", self.sync)
+        sa.event.listen(session, "after_transaction_end", self.after_transaction_end)
+        self.hooked_sessions.add(session)
+
+    def touch(self, session: SASession, rows: Any) -> None:
+        """
+        Writes the robots of these rows to the database when the session's
+        current transaction commits.
+        """
+        self.hook(session)
+        # Make sure there's a transaction, so that we know when it ends.
+        session.connection()
+
+        with self.lock:
+            self.pending.setdefault(session, set()).update(np.atleast_1d(rows).tolist())
+
+    def sync(self, session: SASession) -> None:
+        """
+        Writes the robots the session changed, as a single statement executed
+        for each of them.
+        """
+        with self.lock:
+            rows = np.array(sorted(self.pending.pop(session, ())), dtype=np.int64)
+
+        if not len(rows):
+            return
+
+        actions = self.actions[rows].tolist()
+        values = [
+            {
+                "robot_id": robot_id,
+                "action": None if action == NO_ACTION else ACTIONS[action],
+                "time_started": started,
+                "time_when_available": available,
+                "time_when_done": done,
+            }
+            for robot_id, action, started, available, done in zip(
+                self.ids[rows].tolist(),
+                actions,
+                to_datetimes(self.started[rows]),
+                to_datetimes(self.available[rows]),
+                to_datetimes(self.done[rows]),
+            )
+        ]
+
+        table = Robot.__table__
+        session.execute(
+            table.update().where(table.c.id == sa.bindparam("robot_id")), values
+        )
+
+        if self.synced:
+            self.synced(session, values)
+
+    def flush(self, session: SASession) -> None:
+        """
+        Writes the robots the session changed now, for a statement that reads
+        them. They're still read again if the transaction doesn't commit.
+        """
+        with self.lock:
+            rows = list(self.pending.get(session, ()))
+
+        self.sync(session)
+        if rows:
+            self.touch(session, rows)
+
+    def after_transaction_end(
+        self, session: SASession, transaction: SessionTransaction
+    ) -> None:
+        # What wasn't written didn't happen, the robots must be read again.
+        if transaction.parent is None:
+            with self.lock:
+                rows = self.pending.pop(session, set())
+                self.stale.update(int(self.ids[row]) for row in rows)
+
+    def refresh(self, session: SASession) -> None:
+        """
+        Reads the robots of the transactions that didn't commit again.
+        """
+        with self.lock:
+            ids, self.stale = self.stale, set()
+
+        if not ids:
+            return
+
+        query = sa.select(
+            Robot.id,
+            Robot.action,
+            Robot.time_started,
+            Robot.time_when_available,
+            Robot.time_when_done,
+        ).where(Robot.id.in_(ids))
+
+        for robot in session.execute(query):
+            self.read(self.rows[robot.id], robot.action, robot)
+            ids.discard(robot.id)
+
+        # Robots that were never committed are left idle.
+        for robot_id in ids:
+            self.actions[self.rows[robot_id]] = NO_ACTION
+
+
+class FleetRobot:
+    """
+    A robot's row in the fleet, that reads and writes like a Robot.
+    """
+
+    __slots__ = ("fleet", "row")
+
+    def __init__(self, fleet: Fleet, row: int):
+        self.fleet = fleet
+        self.row = row
+
+    @property
+    def id(self) -> int:
+        return int(self.fleet.ids[self.row])
+
+    @property
+    def name(self) -> str:
+        return self.fleet.names[self.row]
+
+    @property
+    def action(self) -> Optional[RobotAction]:
+        action = self.fleet.actions[self.row]
+        return None if action == NO_ACTION else ACTIONS[action]
+
+    @action.setter
+    def action(self, action: Optional[RobotAction]) -> None:
+        self.fleet.actions[self.row] = (
+            NO_ACTION if action is None else ACTIONS.index(action)
+        )
+
+    @property
+    def time_started(self) -> Optional[datetime]:
+        return from_ns(self.fleet.started[self.row])
+
+    @time_started.setter
+    def time_started(self, value: Optional[datetime]) -> None:
+        self.fleet.started[self.row] = to_ns(value)
+
+    @property
+    def time_when_available(self) -> Optional[datetime]:
+        return from_ns(self.fleet.available[self.row])
+
+    @time_when_available.setter
+    def time_when_available(self, value: Optional[datetime]) -> None:
+        self.fleet.available[self.row] = to_ns(value)
+
+    @property
+    def time_when_done(self) -> Optional[datetime]:
+        return from_ns(self.fleet.done[self.row])
+
+    @time_when_done.setter
+    def time_when_done(self, value: Optional[datetime]) -> None:
+        self.fleet.done[self.row] = to_ns(value)
+
+
+class FleetRobotController(RobotController):
+    """
+    Controls a robot whose state is kept in the fleet, not in its row.
+    """
+
+    robot: FleetRobot
+
+    def attach(self, session: SASession) -> None:
+        # The row is written when the session commits.
+        pass
+
+    def reschedule(self) -> None:
+        # The fleet is its own schedule.
+        pass
+
+    def record(self, session: SASession) -> None:
+        self.robot.fleet.touch(session, self.robot.row)
+
+
+class FleetStateController(StateController):
+    """
+    A controller that keeps the robots in a Fleet, and updates them all at
+    once. Only what robots do when they're done is still done one by one.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.fleet = Fleet(seed)
+        self.fleet.synced = self.robots_synced
+
+    def robots_synced(self, session: SASession, values: list[dict[str, Any]]) -> None:
+        """
+        Journals the robots that were written.
+        """
+        if not self.journal:
+            return
+
+        for robot in values:
+            row = {
+                "id" if key == "robot_id" else key: encode(value)
+                for key, value in robot.items()
+            }
+            row["name"] = self.fleet.names[self.fleet.rows[row["id"]]]
+            self.record(session, ("row", "robot", row))
+
+    def reload(self, session: SASession) -> None:
+        self.fleet.clear()
+        super().reload(session)
+
+    def get_from_cache_or_create(self, robot: Robot) -> RobotController:
+        # The fleet is fresher than any row, those aren't written to.
+        robot_controller = self.robot_cache.get(robot.id)
+        if robot_controller:
+            return robot_controller
+
+        row = self.fleet.add(robot)
+        robot_controller = FleetRobotController(self, FleetRobot(self.fleet, row))
+        self.robot_cache[robot.id] = robot_controller
+        return robot_controller
+
+    def change_actions(
+        self,
+        session: SASession,
+        robot_ids: Optional[Iterable[int]],
+        action: RobotAction,
+        doing: Optional[Iterable[Optional[RobotAction]]] = None,
+        id_range: Optional[Tuple[int, int]] = None,
+    ) -> list[int]:
+        # Robots are chosen by what they're doing in the database.
+        self.fleet.refresh(session)
+        self.fleet.flush(session)
+
+        return super().change_actions(session, robot_ids, action, doing, id_range)
+
+    def actions_changed(
+        self,
+        session: SASession,
+        robot_ids: list[int],
+        action: RobotAction,
+        started: datetime,
+        available: datetime,
+    ) -> None:
+        fleet = self.fleet
+
+        # Robots made in bulk aren't in the fleet until they're loaded, and
+        # the fleet is the only place robots get updated from.
+        missing = [robot_id for robot_id in robot_ids if robot_id not in fleet.rows]
+        if missing:
+            query = (
+                sa.select(Robot)
+                .where(Robot.id.in_(missing))
+                .execution_options(populate_existing=True)
+            )
+            for robot in session.scalars(query):
+                self.get_from_cache_or_create(robot)
+
+        rows = np.array(
+            [fleet.rows[robot_id] for robot_id in robot_ids], dtype=np.int64
+        )
+
+        fleet.actions[rows] = ACTIONS.index(action)
+        fleet.started[rows] = to_ns(started)
+        fleet.available[rows] = to_ns(available)
+        # Written again when the session commits, but read again if it doesn't.
+        fleet.touch(session, rows)
+
+    def next_event(self) -> Optional[datetime]:
+        next_event = self.fleet.next_event()
+        return None if next_event is None else from_ns(next_event)
+
+    def progress(self) -> dict[int, float]:
+        """
+        Returns the progress of every robot doing something, by id.
+        """
+        fleet = self.fleet
+        progress = fleet.progress(to_ns(self.now()))
+        doing = ~np.isnan(progress)
+
+        return dict(
+            zip(fleet.ids[: fleet.size][doing].tolist(), progress[doing].tolist())
+        )
+
+    def due_robots(self, session: SASession, now: datetime) -> list[RobotController]:
+        self.fleet.refresh(session)
+        rows = self.fleet.due(to_ns(now))
+
+        return [
+            self.robot_cache[robot_id] for robot_id in self.fleet.ids[rows].tolist()
+        ]
+
+    def update(self, session: SASession) -> list[RobotController]:
+        fleet = self.fleet
+        fleet.refresh(session)
+
+        if self.behind(self.now()):
+            return self.catch_up(session)
+
+        now = to_ns(self.now())
+        rows = fleet.due(now)
+        if not len(rows):
+            return []
+
+        changing = fleet.available[rows] != NEVER
+        buying = fleet.actions[rows] == BUYING_ROBOT
+        fleet.available[rows[changing]] = NEVER
+
+        # What robots do when they're done can't be done at once, and must be
+        # done in the order they were done. Buying a robot is done as soon as
+        # it starts.
+        restart = changing & ~buying
+        robots = [self.robot_cache[robot_id] for robot_id in fleet.ids[rows].tolist()]
+        for i in np.flatnonzero(~restart).tolist():
+            robot = robots[i]
+            if robot.action_done(session) and not buying[i]:
+                restart[i] = True
+            else:
+                robot.action = None
+
+        fleet.start(rows[restart], now)
+        fleet.touch(session, rows)
+
+        for robot in robots:
+            self.events.emit(session, RobotChanged(robot.id))
+
+        return robots
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import enum
+import json
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import IO, Any, Tuple, Union
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import SessionTransaction
+
+from factory.models import Base, GlobalState
+
+# What can be recorded: a row that was added or changed, the ids of the
+# products that were used ("use", table, ids), euros earned or spent
+# ("euros", n), a counter of the global state that was reserved up to a
+# value ("counter", column, end), or robots that started changing to an
+# action ("actions", ids, action, time_started, time_when_available).
+Entry = Union[Base, Tuple[Any, ...]]
+
+
+def journal_path(filename: str) -> str:
+    """
+    Where the journal of a save is kept. SQLite uses "-journal" for itself.
+    """
+    return f"{filename}.journal"
+
+
+def encode(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+def decode(column: sa.Column[Any], value: Any) -> Any:
+    if value is None:
+        return None
+    # The stubs don't know that Enum columns keep their enum class.
+    enum_class = getattr(column.type, "enum_class", None)
+    if isinstance(column.type, sa.Enum) and enum_class:
+        return enum_class[value]
+    if isinstance(column.type, sa.DateTime):
+        return datetime.fromisoformat(value)
+
+    return value
+
+
+def encode_entry(entry: Entry) -> list[Any]:
+    """
+    Makes an entry into something JSON can write. Rows are read now, when
+    the transaction is over, so they are written as they were committed.
+    """
+    if isinstance(entry, tuple):
+        return list(entry)
+
+    mapper = sa.inspect(entry).mapper
+    row = {
+        attribute.columns[0].name: encode(getattr(entry, attribute.key))
+        for attribute in mapper.column_attrs
+    }
+
+    return ["row", mapper.local_table.name, row]
+
+
+class Journal:
+    """
+    Everything that happened to the game since it was last saved, appended to
+    a file next to the save. A save is then its last full copy, plus the
+    journal, and saving again only has to make sure the journal is on disk.
+
+    What a session records is kept aside, and written as one line when the
+    session commits. If the transaction ends any other way, nothing happened.
+    Lines are flushed to the system as they are written, but only synced to
+    the disk every SYNC_INTERVAL seconds, or when asked to.
+    """
+
+    SYNC_INTERVAL = 1.0  # Number of seconds between each sync.
+
+    def __init__(self, path: str, truncate: bool = False):
+        self.path = path
+        self.pending: weakref.WeakKeyDictionary[
+            SASession, dict[Any, Entry]
+        ] = weakref.WeakKeyDictionary()
+        self.hooked_sessions: weakref.WeakSet[SASession] = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+        if truncate or not os.path.exists(path):
+            self.file: IO[bytes] = open(path, "wb")
+        else:
+            # A crash might have cut the last line short, which would get in
+            # the way of the next ones.
+            _, length = self.read(path)
+            self.file = open(path, "r+b")
+            self.file.truncate(length)
+            self.file.seek(length)
+
+        self.last_sync = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return self.file.tell()
+
+    def hook(self, session: SASession) -> None:
+        """
+        Listens to the end of the session's transactions.
+        """
+        if session in self.hooked_sessions:
+            return
+
+        sa.event.listen(session, "after_commit", self.after_commit)
+        sa.event.listen(session, "after_transaction_end", self.after_transaction_end)
+        self.hooked_sessions.add(session)
+
+    def record(self, session: SASession, entry: Entry) -> None:
+        """
+        Writes the entry when the session's current transaction commits. A
+        row recorded twice is only written once, as it was at the end.
+        """
+        self.hook(session)
+
+        with self.lock:
+            entries = self.pending.setdefault(session, {})
+            # A second sale isn't the same as the first one, even if they're
+            # equal, so tuples are kept by their position.
+            entries[entry if isinstance(entry, Base) else len(entries)] = entry
+
+    def after_commit(self, session: SASession) -> None:
+        with self.lock:
+            entries = self.pending.pop(session, {})
+
+        if entries:
+            self.write([encode_entry(entry) for entry in entries.values()])
+
+    def after_transaction_end(
+        self, session: SASession, transaction: SessionTransaction
+    ) -> None:
+        if transaction.parent is None:
+            with self.lock:
+                self.pending.pop(session, None)
+
+    def write(self, entries: list[list[Any]]) -> None:
+        line = json.dumps(entries, separators=(",", ":")) + "\n"
+
+        with self.lock:
+            self.file.write(line.encode())
+            self.file.flush()
+
+            if time.monotonic() - self.last_sync >= self.SYNC_INTERVAL:
+                self.sync()
+
+    def sync(self) -> None:
+        """
+        Makes sure what was written is on the disk.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        self.sync()
+        self.file.close()
+
+    @staticmethod
+    def read(path: str) -> tuple[list[list[list[Any]]], int]:
+        """
+        Returns the transactions written in the journal, and the length of
+        the file they take. What follows a line that was cut short is ignored.
+        """
+        transactions = []
+        length = 0
+
+        with open(path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+
+                try:
+                    transactions.append(json.loads(line))
+                except ValueError:
+                    break
+
+                length += len(line)
+
+        return transactions, length
+
+    @classmethod
+    def replay(cls, connection: Connection, path: str) -> int:
+        """
+        Applies the journal to the save it belongs to. Returns the number of
+        transactions that were replayed.
+        """
+        if not os.path.exists(path):
+            return 0
+
+        transactions, _ = cls.read(path)
+        tables = Base.metadata.tables
+
+        for entries in transactions:
+            for kind, *arguments in entries:
+                if kind == "row":
+                    table_name, row = arguments
+                    table = tables[table_name]
+                    values = {
+                        name: decode(table.c[name], value)
+                        for name, value in row.items()
+                    }
+                    connection.execute(table.insert().prefix_with("OR REPLACE"), values)
+
+                elif kind == "use":
+                    table_name, ids = arguments
+                    table = tables[table_name]
+                    connection.execute(
+                        sa.update(table).where(table.c.id.in_(ids)).values(used=True)
+                    )
+
+                elif kind == "actions":
+                    ids, action, started, available = arguments
+                    table = tables["robot"]
+                    connection.execute(
+                        sa.update(table)
+                        .where(table.c.id.in_(ids))
+                        .values(
+                            action=decode(table.c.action, action),
+                            time_started=decode(table.c.time_started, started),
+                            time_when_available=decode(
+                                table.c.time_when_available, available
+                            ),
+                        )
+                    )
+
+                elif kind == "euros":
+                    (n,) = arguments
+                    connection.execute(
+                        sa.update(GlobalState).values(euros=GlobalState.euros + n)
+                    )
+
+                elif kind == "counter":
+                    name, end = arguments
+                    column = GlobalState.__table__.c[name]
+                    connection.execute(
+                        sa.update(GlobalState).values(
+                            {column: sa.func.max(column, end)}
+                        )
+                    )
+
+                else:
+                    raise AssertionError(f"Unknown journal entry {kind}.")
+
+        return len(transactions)
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import threading
+import weakref
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import SessionTransaction
+
+from factory.models import GlobalState
+
+
+class EuroLedger:
+    """
+    Euros earned during a transaction that aren't in the database yet.
+
+    Sales only add up in here, and are written as a single atomic increment
+    when the session commits. That's one statement per transaction instead of
+    a read and a write per sale, and the global state is only locked for
+    writing at the very end.
+    """
+
+    def __init__(self) -> None:
+        self.pending: weakref.WeakKeyDictionary[
+            SASession, int
+        ] = weakref.WeakKeyDictionary()
+        self.hooked_sessions: weakref.WeakSet[SASession] = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+    def hook(self, session: SASession) -> None:
+        """
+        Listens to the end of the session's transactions.
+        """
+        if session in self.hooked_sessions:
+            return
+
+        sa.event.listen(session, "before_commit", self.settle)
+        sa.event.listen(session, "after_transaction_end", self.after_transaction_end)
+        self.hooked_sessions.add(session)
+
+    def after_transaction_end(
+        self, session: SASession, transaction: SessionTransaction
+    ) -> None:
+        # If the transaction didn't commit, what was earned is lost with it.
+        if transaction.parent is None:
+            with self.lock:
+                self.pending.pop(session, None)
+
+    def add(self, session: SASession, n: int) -> None:
+        """
+        Earns n euros in the session's current transaction.
+        """
+        self.hook(session)
+        # Make sure there's a transaction, so that we know when it ends.
+        session.connection()
+
+        with self.lock:
+            self.pending[session] = self.pending.get(session, 0) + n
+
+    def settle(self, session: SASession) -> None:
+        """
+        Writes what the session earned to the database.
+        """
+        with self.lock:
+            n = self.pending.pop(session, 0)
+
+        if n:
+            GlobalState.add_euros(session, n)
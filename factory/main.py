@@ -15,8 +15,7 @@ def main() -> NoReturn:
 
     state = StateController()
     with factory.database.Session() as session:
-        state.new_robot(session)
-        state.new_robot(session)
+        state.start(session)
         session.commit()
 
     window = MainWindow(state)
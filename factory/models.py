@@ -1,5 +1,9 @@
+from __future__ import annotations
+
 import enum
+import sqlite3
 import uuid
+from datetime import timedelta
 
 import sqlalchemy as sa
 from sqlalchemy.orm import Mapped, declarative_base, declared_attr, relationship
@@ -32,13 +36,86 @@ class UsableObject:
         doc="Has this object been used?",
     )
 
+    @declared_attr
+    def __table_args__(cls) -> tuple[sa.Index]:
+        """
+        Unused objects are the ones we look for, but used ones pile up
+        without limit. A partial index only holds the unused ones, so
+        finding and counting them doesn't depend on the history. It's on
+        the used column so it covers our queries, and its entries are
+        ordered by id.
+        """
+        not_used = not_(sa.column("used", sa.Boolean))
+
+        return (
+            sa.Index(
+                f"ix_{cls.__tablename__}_not_used",  # type: ignore
+                "used",
+                sqlite_where=not_used,
+                postgresql_where=not_used,
+            ),
+        )
+
+    @classmethod
+    def use(cls, session: Session, n: int) -> list[int]:
+        """
+        Marks the n oldest unused instances as used, in a single statement, and
+        returns their ids. Instances already loaded in the session aren't
+        updated.
+        """
+        if n <= 0:
+            return []
+
+        # Objects waiting to be inserted should be usable too.
+        session.flush()
+
+        table = cls.__tablename__  # type: ignore
+        dialect = session.get_bind().dialect
+
+        if dialect.name == "sqlite" and sqlite3.sqlite_version_info >= (3, 35):
+            # SQLite knows RETURNING, but SQLAlchemy 1.4 can't write it for SQLite.
+            # The condition must stay the same as the index's to be able to use it.
+            statement = sa.text(
+                f"UPDATE {table} SET used = 1 WHERE id IN "
+                f"(SELECT id FROM {table} WHERE used = 0 ORDER BY id LIMIT :n) "
+                "RETURNING id"
+            )
+            return sorted(session.scalars(statement, {"n": n}))
+
+        ids_query = (
+            sa.select(cls.id)  # type: ignore
+            .where(not_(cls.used))
+            .order_by(cls.id)  # type: ignore
+            .limit(n)
+        )
+
+        if getattr(dialect, "full_returning", False):
+            statement = (
+                sa.update(cls)
+                .where(cls.id.in_(ids_query))  # type: ignore
+                .values(used=True)
+                .returning(cls.id)  # type: ignore
+                .execution_options(synchronize_session=False)
+            )
+            return sorted(session.scalars(statement))
+
+        # Otherwise we need two statements.
+        ids = session.scalars(ids_query).all()
+        session.execute(
+            sa.update(cls)
+            .where(cls.id.in_(ids))  # type: ignore
+            .values(used=True)
+            .execution_options(synchronize_session=False)
+        )
+        return ids
+
     @classmethod
     def count_not_used(cls, session: Session) -> int:
         """
         Returns the number of instances that weren't used.
         """
         return session.scalar(  # type: ignore
-            sa.select(sa.func.count(cls.used)).where(not_(cls.used))
+            sa.select(sa.func.count(cls.id)).where(not_(cls.used))  # type: ignore
         )
 
 
@@ -62,6 +139,27 @@ class RobotAction(enum.Enum):
         }[self]
 
 
+# How long actions take once started. Mining a bar takes a random number of
+# milliseconds between those of MINING_BAR_DURATION, and buying a robot is
+# instant.
+ACTION_DURATIONS = {
+    RobotAction.MINING_FOO: timedelta(seconds=2),
+    RobotAction.MAKING_FOOBAR: timedelta(seconds=2),
+    RobotAction.SELLING_FOOBAR: timedelta(seconds=10),
+}
+MINING_BAR_DURATION = (500, 2000)
+
+# How long a robot takes to change actions, before starting the new one.
+CHANGE_DURATION = timedelta(seconds=5)
+
+# Making a foobar succeeds this many times out of 100, a sale is of 1 to
+# SALE_SIZE foobars, at a euro each, and a robot costs ROBOT_PRICE, in foos
+# and euros.
+FOOBAR_SUCCESS = 60
+SALE_SIZE = 5
+ROBOT_PRICE = (6, 3)
+
+
 class Robot(Base, PKMixin):
     __tablename__ = "robot"
 
@@ -157,3 +255,47 @@ class GlobalState(Base, PKMixin):
     __tablename__ = "global_state"
 
     euros = sa.Column(sa.Integer, default=0, nullable=False)
+    next_serial = sa.Column(
+        sa.Integer,
+        default=1,
+        server_default="1",
+        nullable=False,
+        doc="The first serial that wasn't given to a product yet.",
+    )
+    next_name = sa.Column(
+        sa.Integer,
+        default=0,
+        server_default="0",
+        nullable=False,
+        doc="The first name in the pool that wasn't given to a robot yet.",
+    )
+
+    @classmethod
+    def add_euros(cls, session: Session, n: int) -> None:
+        """
+        Atomically adds euros, without reading them first.
+        """
+        session.execute(sa.update(cls).values(euros=cls.euros + n))
+
+    @classmethod
+    def spend_euros(cls, session: Session, n: int) -> bool:
+        """
+        Atomically removes euros if there are enough. Returns whether they
+        were spent.
+        """
+        result = session.execute(
+            sa.update(cls).where(cls.euros >= n).values(euros=cls.euros - n)
+        )
+
+        return result.rowcount > 0  # type: ignore
+
+    @classmethod
+    def reserve(cls, session: Session, counter: str, n: int) -> int:
+        """
+        Takes the next n values of a counter, such as next_serial, atomically,
+        and returns the first one.
+        """
+        column = getattr(cls, counter)
+        session.execute(sa.update(cls).values({column: column + n}))
+
+        return session.scalar(sa.select(column)) - n  # type: ignore
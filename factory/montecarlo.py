@@ -0,0 +1,244 @@
+"""
+Compares strategies by playing many headless games of each. Every game is
+played from a seed of its own, in a process of a pool with its own database
+in memory, so that they use every core and can be played again.
+
+Every strategy plays the same seeds, so that they're compared on the same
+luck.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Optional, Sequence
+
+import factory.database
+from factory.controller import StateController
+from factory.models import ROBOT_PRICE
+from factory.simulation import GreedyStrategy, Simulation, Strategy
+
+# Strategies that can be chosen by name from the command line.
+STRATEGIES: dict[str, Strategy] = {
+    "greedy": GreedyStrategy(),
+    "sell-early": GreedyStrategy(sell_batch=1),
+    "sell-late": GreedyStrategy(sell_batch=5),
+    "no-reserve": GreedyStrategy(foo_reserve=0),
+}
+
+
+@dataclass(frozen=True)
+class Game:
+    """
+    A game to play, and how.
+    """
+
+    strategy: str
+    seed: int
+    target_robots: int = 30
+    initial_robots: int = 2
+    # Games that don't reach the target by then are given up.
+    max_time: timedelta = timedelta(days=1)
+
+
+@dataclass
+class GameResult:
+    game: Game
+    robots: int
+    # Game time it took, until the target or until it was given up.
+    elapsed: timedelta
+    events: int
+    foobars_sold: int
+    # Seconds it took to play.
+    duration: float
+
+    @property
+    def reached(self) -> bool:
+        return self.robots >= self.game.target_robots
+
+    @property
+    def throughput(self) -> float:
+        """
+        Foobars sold per hour of game time.
+        """
+        hours = self.elapsed / timedelta(hours=1)
+        return self.foobars_sold / hours if hours else 0.0
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    The value below which p percent of the sorted values are.
+    """
+    index = min(int(len(values) * p / 100), len(values) - 1)
+    return values[index]
+
+
+@dataclass
+class StrategyReport:
+    """
+    How a strategy did over all its games.
+    """
+
+    strategy: str
+    results: list[GameResult] = field(default_factory=list)
+
+    @property
+    def times(self) -> list[float]:
+        """
+        Hours of game time it took to reach the target, sorted, for the games
+        that did.
+        """
+        return sorted(
+            result.elapsed / timedelta(hours=1)
+            for result in self.results
+            if result.reached
+        )
+
+    @property
+    def throughputs(self) -> list[float]:
+        return sorted(result.throughput for result in self.results)
+
+    @property
+    def given_up(self) -> int:
+        return sum(not result.reached for result in self.results)
+
+    def summary(self) -> str:
+        lines = [f"{self.strategy}: {len(self.results)} games"]
+
+        for name, values, unit in (
+            ("time to target", self.times, "h"),
+            ("throughput", self.throughputs, " foobars/h"),
+        ):
+            if values:
+                p50, p95 = percentile(values, 50), percentile(values, 95)
+                lines.append(
+                    f"  {name}: p5 {percentile(values, 5):.2f}, "
+                    f"p50 {p50:.2f}, p95 {p95:.2f}{unit}"
+                )
+
+        if self.given_up:
+            lines.append(f"  given up: {self.given_up}")
+
+        return "\n".join(lines)
+
+
+def play(game: Game, strategy: Strategy) -> GameResult:
+    """
+    Plays a game from the start, in a new database in memory. Meant to be
+    run in a process of its own, since the database is the process's.
+    """
+    start = time.perf_counter()
+    factory.database.configure("sqlite:///:memory:")
+    factory.database.init_database()
+
+    controller = StateController(game.seed)
+    simulation = Simulation(controller, strategy)
+    with controller.model_session() as session:
+        for _ in range(game.initial_robots):
+            controller.new_robot(session)
+        session.commit()
+
+    result = simulation.run(target_robots=game.target_robots, max_time=game.max_time)
+
+    # Euros only go to robots once earned.
+    bought = result.robots - game.initial_robots
+    foobars_sold = result.counts[3] + bought * ROBOT_PRICE[1]
+
+    return GameResult(
+        game=game,
+        robots=result.robots,
+        elapsed=result.elapsed,
+        events=result.events,
+        foobars_sold=foobars_sold,
+        duration=time.perf_counter() - start,
+    )
+
+
+def seeds(seed: int, n: int) -> list[int]:
+    """
+    The seeds of n games, from the seed of the whole evaluation.
+    """
+    rng = random.Random(seed)
+    return [rng.randrange(2**32) for _ in range(n)]
+
+
+def evaluate(
+    strategies: dict[str, Strategy],
+    games: int,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    target_robots: int = 30,
+    max_time: timedelta = timedelta(days=1),
+) -> dict[str, StrategyReport]:
+    """
+    Plays that many games of every strategy, spread over workers processes,
+    one per core by default. The reports don't depend on how many there are.
+    """
+    to_play = [
+        Game(name, game_seed, target_robots=target_robots, max_time=max_time)
+        for game_seed in seeds(seed, games)
+        for name in strategies
+    ]
+    reports = {name: StrategyReport(name) for name in strategies}
+    workers = workers or os.cpu_count() or 1
+
+    # Forked processes would share the parent's database connection, so they
+    # start afresh instead.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        # Many games per task, so that sending them isn't what takes time.
+        chunksize = max(1, len(to_play) // (4 * workers))
+        results = executor.map(
+            play,
+            to_play,
+            [strategies[game.strategy] for game in to_play],
+            chunksize=chunksize,
+        )
+
+        for result in results:
+            reports[result.game.strategy].results.append(result)
+
+    return reports
+
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Compares strategies over many games played in parallel.",
+    )
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=list(STRATEGIES),
+        dest="strategies",
+        help="A strategy to compare, all of them by default. Can be repeated.",
+    )
+    parser.add_argument("--games", type=int, default=100, help="Games per strategy.")
+    parser.add_argument("--robots", type=int, default=30, help="Robots to reach.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Processes, one per core by default."
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    reports = evaluate(
+        {name: STRATEGIES[name] for name in args.strategies or STRATEGIES},
+        args.games,
+        seed=args.seed,
+        workers=args.workers,
+        target_robots=args.robots,
+    )
+    elapsed = time.perf_counter() - start
+
+    for report in reports.values():
+        print(report.summary())
+
+    played = sum(len(report.results) for report in reports.values())
+    print(f"Played {played} games in {elapsed:.1f} s ({played / elapsed:.1f}/s).")
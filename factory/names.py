@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import math
+import threading
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session as SASession
+
+from factory.models import GlobalState, Robot
+
+
+class NamePool:
+    """
+    Gives robots unique names, made of a first and a last name.
+
+    Every combination is numbered, and the numbers are walked in a shuffled
+    order by stepping over them with a step that has no common divisor with
+    their count, so we never have to look for a free name. When every
+    combination was given, they are given again with a number after them.
+
+    Where we are is kept in the global state, so it survives a save. Names
+    that were given by a previous version are looked up once, the first time
+    a name is needed, and skipped.
+    """
+
+    def __init__(self) -> None:
+        # Names of robots we didn't name, or None if we didn't look yet.
+        self.taken: Optional[set[str]] = None
+        self.lock = threading.Lock()
+
+        # Told when names are reserved in the database, with the counter and
+        # the first value that isn't reserved.
+        self.reserved: Optional[Callable[[SASession, str, int], object]] = None
+
+        # What names are made of, and the step between names given in a row,
+        # set by load the first time a name is needed.
+        self.first_names: list[str] = []
+        self.last_names: list[str] = []
+        self.step = 0
+
+    def load(self) -> None:
+        """
+        Reads the names, and works out the step, unless it was done already.
+        """
+        if not self.first_names or not self.last_names:
+            # Faker is slow to import, and only its lists are needed.
+            from faker.providers.person.en_US import Provider
+
+            self.first_names = self.first_names or sorted(set(Provider.first_names))
+            self.last_names = self.last_names or sorted(set(Provider.last_names))
+
+        if not self.step:
+            # Far enough that names given in a row don't look alike.
+            step = int(self.size * 0.618)
+            while math.gcd(step, self.size) != 1:
+                step += 1
+
+            self.step = step
+
+    @property
+    def size(self) -> int:
+        """
+        How many names there are before they're given again with a number.
+        """
+        return len(self.first_names) * len(self.last_names)
+
+    def name(self, index: int) -> str:
+        """
+        Returns the name with that number.
+        """
+        self.load()
+        lap, position = divmod(index, self.size)
+        shuffled = position * self.step % self.size
+        first, last = divmod(shuffled, len(self.last_names))
+
+        name = f"{self.first_names[first]} {self.last_names[last]}"
+        return f"{name} {lap + 1}" if lap else name
+
+    def take(self, session: SASession, n: int) -> list[str]:
+        """
+        Returns n names that no robot has, and marks them as given in the
+        session's transaction.
+        """
+        with self.lock:
+            if self.taken is None:
+                self.taken = set(session.scalars(sa.select(Robot.name)))
+            taken = self.taken
+
+        names: list[str] = []
+        while len(names) < n:
+            missing = n - len(names)
+            first = GlobalState.reserve(session, "next_name", missing)
+            if self.reserved:
+                self.reserved(session, "next_name", first + missing)
+
+            names.extend(
+                name
+                for name in map(self.name, range(first, first + missing))
+                if name not in taken
+            )
+
+        return names
+
+    def clear(self) -> None:
+        """
+        Forgets the names we looked up, when the database was replaced.
+        """
+        with self.lock:
+            self.taken = None
@@ -0,0 +1,159 @@
+"""
+Measures where the time of each tick goes, to find out why the game
+stutters. Profiling is off unless asked for, and then costs almost nothing.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from types import TracebackType
+from typing import Optional, Type
+
+# Where to dump the timings when the game ends. Ending with .pstats means a
+# profile of the ticks, anything else means the timings as JSON.
+PROFILE_VARIABLE = "FACTORY_PROFILE"
+
+# The phases of a tick, in order.
+PHASES = ("commands", "update", "commit", "snapshot")
+
+
+@dataclass(frozen=True)
+class TickTimings:
+    """
+    How long each phase of a tick took, in milliseconds.
+    """
+
+    commands: float = 0.0
+    update: float = 0.0
+    commit: float = 0.0
+    snapshot: float = 0.0
+    # Number of robots that were updated.
+    robots: int = 0
+
+    @property
+    def total(self) -> float:
+        return self.commands + self.update + self.commit + self.snapshot
+
+
+class Phase:
+    """
+    Times what happens in its block, for the tick being measured.
+    """
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.profiler.current[self.name] = (time.perf_counter() - self.start) * 1000
+
+
+class NoPhase:
+    """
+    What is timed when profiling is off: nothing.
+    """
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+
+NO_PHASE = NoPhase()
+
+
+class Profiler:
+    """
+    Keeps the timings of the last CAPACITY ticks, and, if asked, a profile of
+    every function they called.
+    """
+
+    CAPACITY = 1000
+
+    def __init__(self, enabled: bool = False, profile: bool = False):
+        self.enabled = enabled
+        self.ticks: deque[TickTimings] = deque(maxlen=self.CAPACITY)
+        self.current: dict[str, float] = {}
+        self.phases = {name: Phase(self, name) for name in PHASES}
+
+        # Only made when asked for, it slows every call down.
+        self.profile: Optional[cProfile.Profile] = (
+            cProfile.Profile() if profile else None
+        )
+
+        # Where to dump everything at the end, if anywhere.
+        self.filename: Optional[str] = None
+
+    @classmethod
+    def from_environment(cls) -> Profiler:
+        """
+        Profiles the game if FACTORY_PROFILE gives a file to dump to.
+        """
+        filename = os.environ.get(PROFILE_VARIABLE)
+        if not filename:
+            return cls()
+
+        profiler = cls(enabled=True, profile=filename.endswith(".pstats"))
+        profiler.filename = filename
+        return profiler
+
+    def start_tick(self) -> None:
+        if not self.enabled:
+            return
+
+        self.current = {}
+        if self.profile:
+            self.profile.enable()
+
+    def phase(self, name: str) -> Phase | NoPhase:
+        return self.phases[name] if self.enabled else NO_PHASE
+
+    def end_tick(self, robots: int) -> Optional[TickTimings]:
+        """
+        Keeps the timings of the tick, and returns them.
+        """
+        if not self.enabled:
+            return None
+
+        if self.profile:
+            self.profile.disable()
+
+        timings = TickTimings(robots=robots, **self.current)
+        self.ticks.append(timings)
+        return timings
+
+    def dump(self, filename: str) -> None:
+        """
+        Writes the profile of the ticks if the filename ends with .pstats, or
+        else the timings we kept, as JSON.
+        """
+        if filename.endswith(".pstats"):
+            assert self.profile, "Functions weren't profiled."
+            self.profile.dump_stats(filename)
+            return
+
+        ticks = list(self.ticks)
+        with open(filename, "w") as file:
+            json.dump(
+                {
+                    "phases": list(PHASES),
+                    "ticks": [asdict(tick) for tick in ticks],
+                },
+                file,
+                indent=2,
+            )
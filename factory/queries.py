@@ -0,0 +1,234 @@
+"""
+Records the statements sent to the database, to find out which part of the
+game sends them, and to hold ticks to a budget.
+"""
+
+from __future__ import annotations
+
+import functools
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+import factory.database
+
+# The controller's methods that send statements, and that we tell apart.
+TRACKED_METHODS = (
+    "run_commands",
+    "update",
+    "get_robot",
+    "list_robots",
+    "list_sold_foobars_since",
+    "counts",
+    "add_euros",
+    "sub_euros",
+    "new_robot",
+    "new_robots",
+    "consume_products",
+    "robot_action_done",
+)
+
+
+@dataclass(frozen=True)
+class Statement:
+    sql: str
+    parameters: Any
+    # Milliseconds it took.
+    duration: float
+    # Rows it changed, if the database told us.
+    rows: Optional[int]
+    # The innermost tracked method it was sent from, if any.
+    scope: Optional[str]
+    # The tick it was sent during, starting at 0, if any.
+    tick: Optional[int]
+
+
+@dataclass
+class Stats:
+    count: int = 0
+    rows: int = 0
+    # Milliseconds.
+    duration: float = 0.0
+
+    def add(self, statement: Statement) -> None:
+        self.count += 1
+        self.rows += statement.rows or 0
+        self.duration += statement.duration
+
+
+class QueryRecorder:
+    """
+    Listens to the statements sent to an engine while it's used as a context
+    manager:
+
+        with QueryRecorder() as recorder:
+            recorder.track(controller)
+            with recorder.tick():
+                ...
+
+        recorder.assert_at_most(3, tick=0)
+
+    Without keep, only the stats of each tick are kept, for long runs.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, keep: bool = True):
+        self.engine = engine or factory.database.engine
+        self.keep = keep
+        self.statements: list[Statement] = []
+        self.ticks: list[Stats] = []
+        self.scopes: list[str] = []
+        self.current_tick: Optional[int] = None
+        self.tracked: list[tuple[object, str]] = []
+
+    def __enter__(self) -> QueryRecorder:
+        sa.event.listen(self.engine, "before_cursor_execute", self.before_execute)
+        sa.event.listen(self.engine, "after_cursor_execute", self.after_execute)
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        sa.event.remove(self.engine, "before_cursor_execute", self.before_execute)
+        sa.event.remove(self.engine, "after_cursor_execute", self.after_execute)
+
+        for instance, name in self.tracked:
+            delattr(instance, name)
+        self.tracked.clear()
+
+    def before_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        start = conn.info["query_start"].pop()
+        rowcount = getattr(cursor, "rowcount", -1)
+
+        recorded = Statement(
+            sql=statement,
+            parameters=parameters,
+            duration=(time.perf_counter() - start) * 1000,
+            rows=rowcount if rowcount >= 0 else None,
+            scope=self.scopes[-1] if self.scopes else None,
+            tick=self.current_tick,
+        )
+
+        if self.current_tick is not None:
+            self.ticks[self.current_tick].add(recorded)
+        if self.keep:
+            self.statements.append(recorded)
+
+    def track(self, instance: object, names: tuple[str, ...] = TRACKED_METHODS) -> None:
+        """
+        Tells the statements sent from these methods of the instance apart,
+        until the recorder is closed.
+        """
+        for name in names:
+            method = getattr(instance, name)
+            setattr(instance, name, self.scoped(name, method))
+            self.tracked.append((instance, name))
+
+    def scoped(self, name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            self.scopes.append(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.scopes.pop()
+
+        return wrapper
+
+    @contextmanager
+    def tick(self) -> Iterator[int]:
+        """
+        Marks the statements sent in the block as being from a new tick.
+        """
+        self.current_tick = len(self.ticks)
+        self.ticks.append(Stats())
+        try:
+            yield self.current_tick
+        finally:
+            self.current_tick = None
+
+    def select(
+        self, tick: Optional[int] = None, scope: Optional[str] = None
+    ) -> list[Statement]:
+        return [
+            statement
+            for statement in self.statements
+            if (tick is None or statement.tick == tick)
+            and (scope is None or statement.scope == scope)
+        ]
+
+    def stats(self, tick: Optional[int] = None, scope: Optional[str] = None) -> Stats:
+        stats = Stats()
+        for statement in self.select(tick, scope):
+            stats.add(statement)
+
+        return stats
+
+    def by_scope(self, tick: Optional[int] = None) -> dict[Optional[str], Stats]:
+        scopes: dict[Optional[str], Stats] = {}
+        for statement in self.select(tick):
+            scopes.setdefault(statement.scope, Stats()).add(statement)
+
+        return scopes
+
+    def assert_at_most(
+        self, n: int, tick: Optional[int] = None, scope: Optional[str] = None
+    ) -> None:
+        statements = self.select(tick, scope)
+
+        assert len(statements) <= n, (
+            f"{len(statements)} statements were sent, at most {n} were expected:\n"
+            + "\n".join(statement.sql for statement in statements)
+        )
+
+    def hot_statements(self, n: int = 5) -> list[tuple[str, int]]:
+        """
+        The n statements sent the most often, with how many times they were.
+        """
+        return Counter(statement.sql for statement in self.statements).most_common(n)
+
+    def explain(self, n: int = 5) -> dict[str, list[str]]:
+        """
+        Asks SQLite how it runs the n hot statements that read, with the
+        parameters they were last sent with.
+        """
+        parameters = {
+            statement.sql: statement.parameters for statement in self.statements
+        }
+        plans = {}
+
+        with self.engine.connect() as conn:
+            for sql, _ in self.hot_statements(n):
+                if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+
+                sent = parameters[sql]
+                if isinstance(sent, list):
+                    # Sent for many rows, they all run the same way.
+                    sent = sent[0]
+
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", sent)
+                plans[sql] = [row[-1] for row in rows]
+
+        return plans
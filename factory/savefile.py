@@ -0,0 +1,118 @@
+"""
+Compressed saves. The game is copied without its free pages, with VACUUM
+INTO, then the copy is compressed with gzip. Loading does the opposite, so a
+compressed save is the exact same database as a plain one, only smaller.
+"""
+
+import gzip
+import math
+import os
+import sqlite3
+from typing import IO, Callable, Optional
+
+from typing_extensions import Protocol
+
+# Called after each step of a copy, like a backup's progress: with a status,
+# the number of pages remaining and the total number of pages.
+Progress = Callable[[int, int, int], object]
+
+# Saves whose name ends with this are compressed.
+COMPRESSED_SUFFIX = ".gz"
+
+# What gzip files start with.
+MAGIC = b"\x1f\x8b"
+
+# Size of the pages we count progress in, SQLite's default.
+PAGE_SIZE = 4096
+
+# From 1 to 9. Higher is smaller, but slower. Serials are random, so higher
+# levels hardly make saves any smaller.
+COMPRESS_LEVEL = 1
+
+
+class Reader(Protocol):
+    """
+    What copy_chunks reads from: a file, or a gzip file.
+    """
+
+    def read(self, __size: int) -> bytes:
+        ...
+
+
+class Writer(Protocol):
+    def write(self, __data: bytes) -> object:
+        ...
+
+
+def wants_compression(filename: str) -> bool:
+    """
+    Whether a save made to that file should be compressed.
+    """
+    return filename.endswith(COMPRESSED_SUFFIX)
+
+
+def is_compressed(filename: str) -> bool:
+    """
+    Whether the save in that file is compressed, whatever its name.
+    """
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def vacuum_into(connection: sqlite3.Connection, filename: str) -> None:
+    """
+    Copies the database to a new file, without its free pages, and with its
+    tables and indexes defragmented.
+    """
+    connection.execute("VACUUM INTO ?", (filename,))
+
+
+def copy_chunks(
+    reader: Reader,
+    writer: Writer,
+    source: IO[bytes],
+    pages: int = -1,
+    progress: Optional[Progress] = None,
+) -> None:
+    """
+    Copies what the reader reads to the writer. If pages is given, that many
+    pages are read at a time, and progress is called after each step, with
+    how far we are in the source file.
+    """
+    total = max(math.ceil(os.fstat(source.fileno()).st_size / PAGE_SIZE), 1)
+    step = pages * PAGE_SIZE if pages > 0 else -1
+
+    while True:
+        chunk = reader.read(step)
+        if not chunk:
+            return
+
+        writer.write(chunk)
+
+        if progress:
+            read = min(math.ceil(source.tell() / PAGE_SIZE), total)
+            progress(0, total - read, total)
+
+
+def compress(
+    source: str,
+    destination: str,
+    pages: int = -1,
+    progress: Optional[Progress] = None,
+) -> None:
+    with open(source, "rb") as reader, gzip.open(
+        destination, "wb", compresslevel=COMPRESS_LEVEL
+    ) as writer:
+        copy_chunks(reader, writer, reader, pages, progress)
+
+
+def decompress(
+    source: str,
+    destination: str,
+    pages: int = -1,
+    progress: Optional[Progress] = None,
+) -> None:
+    with open(source, "rb") as compressed, gzip.open(compressed, "rb") as reader, open(
+        destination, "wb"
+    ) as writer:
+        copy_chunks(reader, writer, compressed, pages, progress)
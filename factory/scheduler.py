@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import heapq
+from datetime import datetime
+from typing import Optional
+
+
+class Scheduler:
+    """
+    Keeps the robots ordered by the next time something happens to them,
+    so an update only has to look at the robots that are due.
+
+    Rescheduling a robot doesn't remove its previous entry from the heap,
+    that would be linear. Instead, we remember the current deadline of each
+    robot and skip the entries that don't match it anymore.
+    """
+
+    def __init__(self) -> None:
+        self.heap: list[tuple[datetime, int]] = []
+        self.deadlines: dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def __contains__(self, robot_id: int) -> bool:
+        return robot_id in self.deadlines
+
+    def clear(self) -> None:
+        self.heap.clear()
+        self.deadlines.clear()
+
+    def schedule(self, robot_id: int, when: Optional[datetime]) -> None:
+        """
+        Sets when a robot should be updated next. None means never.
+        """
+        if when is None:
+            self.deadlines.pop(robot_id, None)
+            return
+
+        if self.deadlines.get(robot_id) == when:
+            return
+
+        self.deadlines[robot_id] = when
+        heapq.heappush(self.heap, (when, robot_id))
+
+        # Don't let the outdated entries pile up.
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Rebuilds the heap with only the current deadlines.
+        """
+        self.heap = [(when, robot_id) for robot_id, when in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+    def peek(self) -> Optional[datetime]:
+        """
+        Returns the next deadline, if any.
+        """
+        while self.heap:
+            when, robot_id = self.heap[0]
+            if self.deadlines.get(robot_id) == when:
+                return when
+
+            heapq.heappop(self.heap)
+
+        return None
+
+    def pop_due(self, now: datetime) -> list[int]:
+        """
+        Returns the ids of the robots whose deadline has passed, in order,
+        and forgets about them until they're scheduled again.
+        """
+        due = []
+
+        while self.heap and self.heap[0][0] <= now:
+            when, robot_id = heapq.heappop(self.heap)
+
+            if self.deadlines.get(robot_id) == when:
+                del self.deadlines[robot_id]
+                due.append(robot_id)
+
+        return due
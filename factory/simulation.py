@@ -0,0 +1,280 @@
+"""
+A headless engine for the game. Instead of polling the state every few
+milliseconds against the wall clock, it drives the StateController with a
+virtual clock that jumps straight to the next time something happens.
+"""
+
+from __future__ import annotations
+
+import argparse
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy.orm import Session as SASession
+
+import factory.database
+from factory.controller import RobotController, StateController
+from factory.models import ROBOT_PRICE, RobotAction
+
+
+class Strategy(ABC):
+    """
+    Plays the game in place of the user, by telling robots what to do.
+    """
+
+    @abstractmethod
+    def assign(
+        self,
+        controller: StateController,
+        session: SASession,
+        robots: Sequence[RobotController],
+    ) -> None:
+        """
+        Called each time something happened, with the robots that just
+        finished an action or that are idle.
+        """
+
+
+class GreedyStrategy(Strategy):
+    """
+    A simple strategy: buy a robot whenever possible, then sell, then make
+    foobars, and mine otherwise. Robots only reconsider what they do when
+    they finish an action, and resources are reserved as actions are given
+    so that every robot doesn't rush for the same thing.
+    """
+
+    def __init__(self, sell_batch: int = 3, foo_reserve: int = ROBOT_PRICE[0]):
+        # How many foobars must be waiting before a robot goes selling.
+        self.sell_batch = sell_batch
+        # How many foos we keep for buying robots once we have the money.
+        self.foo_reserve = foo_reserve
+
+    def choose(
+        self,
+        current: Optional[RobotAction],
+        foo: int,
+        bar: int,
+        foobar: int,
+        euros: int,
+    ) -> RobotAction:
+        """
+        Chooses what a robot should do with the given (reserved) resources.
+        """
+        foo_price, euro_price = ROBOT_PRICE
+        if foo >= foo_price and euros >= euro_price:
+            return RobotAction.BUYING_ROBOT
+
+        if foobar >= self.sell_batch:
+            return RobotAction.SELLING_FOOBAR
+
+        foo_needed = 1 + (self.foo_reserve if euros >= euro_price else 0)
+        if foo >= foo_needed and bar >= 1:
+            return RobotAction.MAKING_FOOBAR
+
+        if current in (RobotAction.MINING_FOO, RobotAction.MINING_BAR):
+            # Only switch mining if there's a real imbalance.
+            if current == RobotAction.MINING_BAR and bar > foo + 5:
+                return RobotAction.MINING_FOO
+            if current == RobotAction.MINING_FOO and foo > bar + 10:
+                return RobotAction.MINING_BAR
+
+            return current
+
+        return RobotAction.MINING_FOO if foo <= bar else RobotAction.MINING_BAR
+
+    def assign(
+        self,
+        controller: StateController,
+        session: SASession,
+        robots: Sequence[RobotController],
+    ) -> None:
+        foo, bar, foobar, euros = controller.counts(session)
+
+        for robot in robots:
+            current = robot.action
+            if current in (RobotAction.MAKING_FOOBAR, RobotAction.SELLING_FOOBAR):
+                # These stop by themselves when they run out of resources.
+                continue
+
+            action = self.choose(current, foo, bar, foobar, euros)
+
+            # Reserve what the new action will need.
+            if action == RobotAction.BUYING_ROBOT:
+                foo, euros = foo - ROBOT_PRICE[0], euros - ROBOT_PRICE[1]
+            elif action == RobotAction.SELLING_FOOBAR:
+                foobar -= self.sell_batch
+            elif action == RobotAction.MAKING_FOOBAR:
+                foo, bar = foo - 1, bar - 1
+
+            if action != current:
+                robot.change_action(session, action)
+
+
+@dataclass
+class SimulationResult:
+    """
+    What happened during a run.
+    """
+
+    robots: int
+    elapsed: timedelta
+    events: int
+    counts: tuple[int, int, int, int]
+
+
+class Simulation:
+    """
+    Runs the game without any window, as fast as possible.
+    """
+
+    def __init__(
+        self,
+        controller: Optional[StateController] = None,
+        strategy: Optional[Strategy] = None,
+        start: Optional[datetime] = None,
+    ):
+        self.controller = controller or StateController()
+        self.strategy = strategy or GreedyStrategy()
+        self.now = start or datetime(2022, 1, 1)
+        self.start = self.now
+        self.events = 0
+
+        # Robots the strategy has seen, to find new ones.
+        self.robots: dict[int, RobotController] = {}
+
+        self.controller.clock = lambda: self.now
+
+    def new_robots(self) -> list[RobotController]:
+        """
+        Returns robots that were created since the last call. The controller
+        caches every robot it creates, so we only have to look at the cache
+        when it grew, which is when a robot was bought.
+        """
+        cache = self.controller.robot_cache
+        if len(cache) == len(self.robots):
+            return []
+
+        robots = [robot for id, robot in cache.items() if id not in self.robots]
+        self.robots.update((robot.id, robot) for robot in robots)
+
+        return robots
+
+    def decide(self, session: SASession, updated: Iterable[RobotController]) -> None:
+        """
+        Gives the strategy the robots that need a decision: the idle ones,
+        the new ones, and those that just restarted their action.
+        """
+        robots = {robot.id: robot for robot in self.new_robots()}
+
+        for robot in updated:
+            just_restarted = (
+                robot.robot.time_started == self.now
+                and robot.robot.time_when_available is None
+            )
+            if robot.action is None or just_restarted:
+                robots[robot.id] = robot
+
+        if robots:
+            self.strategy.assign(self.controller, session, list(robots.values()))
+
+    def step(self, session: SASession) -> bool:
+        """
+        Jumps to the next event and processes it. Returns False if nothing
+        is scheduled anymore.
+        """
+        next_event = self.controller.next_event()
+        if next_event is None:
+            return False
+
+        self.now = max(self.now, next_event)
+        updated = self.controller.update(session)
+        self.decide(session, updated)
+        self.events += 1
+
+        return True
+
+    def run(
+        self,
+        target_robots: int = 30,
+        max_time: Optional[timedelta] = None,
+        max_events: Optional[int] = None,
+    ) -> SimulationResult:
+        """
+        Runs until we have target_robots robots, nothing happens anymore, or
+        one of the limits is reached.
+        """
+        with self.controller.model_session() as session:
+            # Robots that weren't created by the controller, from a save for
+            # instance, aren't cached yet.
+            self.controller.list_robots(session)
+            self.decide(session, [])
+
+            while len(self.robots) < target_robots:
+                if max_time is not None and self.now - self.start >= max_time:
+                    break
+                if max_events is not None and self.events >= max_events:
+                    break
+                if not self.step(session):
+                    break
+
+            session.commit()
+
+            return SimulationResult(
+                robots=len(self.robots),
+                elapsed=self.now - self.start,
+                events=self.events,
+                counts=self.controller.counts(session),
+            )
+
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Plays the game without any window, faster than real time.",
+    )
+    parser.add_argument(
+        "--robots", type=int, default=30, help="Stop once we have this many robots."
+    )
+    parser.add_argument(
+        "--initial-robots", type=int, default=2, help="Robots to start with."
+    )
+    parser.add_argument(
+        "--max-hours", type=float, default=None, help="Limit in game time."
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+    parser.add_argument(
+        "--database", default=None, help="Database URL, in memory by default."
+    )
+    parser.add_argument(
+        "--fleet",
+        action="store_true",
+        help="Keep the robots in arrays, for many robots. Needs NumPy.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.database:
+        factory.database.configure(args.database)
+    factory.database.init_database()
+
+    if args.fleet:
+        from factory.fleet import FleetStateController
+
+        controller: StateController = FleetStateController(args.seed)
+    else:
+        controller = StateController(args.seed)
+
+    simulation = Simulation(controller)
+    with simulation.controller.model_session() as session:
+        simulation.controller.start(session, args.initial_robots)
+        session.commit()
+
+    max_time = timedelta(hours=args.max_hours) if args.max_hours else None
+    result = simulation.run(target_robots=args.robots, max_time=max_time)
+
+    foo, bar, foobar, euros = result.counts
+    print(f"Robots: {result.robots}")
+    print(f"Game time: {result.elapsed}")
+    print(f"Events: {result.events}")
+    print(f"Inventory: {foo} foos, {bar} bars, {foobar} foobars, {euros}€")
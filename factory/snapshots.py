@@ -0,0 +1,168 @@
+"""
+Immutable copies of the state of the game, made after each tick. They can be
+handed to another thread, which doesn't have to touch the database or the
+controllers to show them.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from sqlalchemy.orm import Session as SASession
+
+from factory.events import (
+    FoobarsSold,
+    InventoryChanged,
+    RobotAdded,
+    RobotChanged,
+    StateReloaded,
+)
+from factory.models import RobotAction
+
+if TYPE_CHECKING:
+    from factory.controller import SoldFoobar, StateController
+
+
+@dataclass(frozen=True)
+class RobotState:
+    """
+    What a robot is doing, at the time of the snapshot.
+    """
+
+    id: int
+    name: str
+    action: Optional[RobotAction]
+    time_started: Optional[datetime]
+    time_when_available: Optional[datetime]
+    time_when_done: Optional[datetime]
+
+    @property
+    def changing(self) -> bool:
+        return self.time_when_available is not None
+
+    def progress(self, now: datetime) -> float:
+        """
+        Returns a float between 0 and 100 to indicate the progress
+        with the current task, whether it's changing or not.
+
+        To call this the robot must be doing something.
+        """
+        assert self.action
+        assert self.time_started
+
+        end = self.time_when_available or self.time_when_done
+        assert end
+
+        time_total = end - self.time_started
+        time_now = now - self.time_started
+        return (time_now / time_total) * 100
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    What changed during a tick. Counts are None when they didn't change.
+    """
+
+    robots: Tuple[RobotState, ...] = ()
+    counts: Optional[Tuple[int, int, int, int]] = None
+    sold_foobars: Tuple[SoldFoobar, ...] = ()
+    # Everything was reloaded, what was known before is outdated.
+    reset: bool = False
+
+
+class SnapshotBuilder:
+    """
+    Listens to the controller's events, and reads what they say changed
+    into a Snapshot.
+    """
+
+    # Maximum number of sold foobars read for a snapshot, so that a big
+    # history gets loaded over a few ticks instead of freezing one.
+    BATCH_SIZE = 1000
+
+    def __init__(self, controller: StateController):
+        self.controller = controller
+
+        # Highest ids we have seen, to find new robots and sold foobars.
+        self.last_robot_id = 0
+        self.last_foobar_id = 0
+
+        # What changed since the last snapshot. We don't know about what
+        # happened before we were made, so the first snapshot reads everything.
+        self.reset = False
+        self.robots_added = True
+        self.changed_robots: set[int] = set()
+        self.inventory_changed = True
+        self.foobars_sold = True
+
+        controller.events.subscribe(RobotAdded, self.robot_added)
+        controller.events.subscribe(RobotChanged, self.robot_changed)
+        controller.events.subscribe(InventoryChanged, self.inventory_change)
+        controller.events.subscribe(FoobarsSold, self.foobar_sold)
+        controller.events.subscribe(StateReloaded, self.state_reloaded)
+
+    def robot_added(self, event: RobotAdded) -> None:
+        self.robots_added = True
+
+    def robot_changed(self, event: RobotChanged) -> None:
+        self.changed_robots.add(event.robot_id)
+
+    def inventory_change(self, event: InventoryChanged) -> None:
+        self.inventory_changed = True
+
+    def foobar_sold(self, event: FoobarsSold) -> None:
+        self.foobars_sold = True
+
+    def state_reloaded(self, event: StateReloaded) -> None:
+        self.reset = True
+        self.last_robot_id = 0
+        self.last_foobar_id = 0
+        self.robots_added = True
+        self.changed_robots.clear()
+        self.inventory_changed = True
+        self.foobars_sold = True
+
+    def build(self, session: SASession) -> Snapshot:
+        """
+        Reads what changed since the last snapshot.
+        """
+        robots = {}
+
+        if self.robots_added:
+            self.robots_added = False
+            for robot in self.controller.list_robots(session, self.last_robot_id):
+                robots[robot.id] = robot.state()
+                self.last_robot_id = robot.id
+
+        for robot_id in self.changed_robots - robots.keys():
+            robots[robot_id] = self.controller.get_robot(session, robot_id).state()
+        self.changed_robots.clear()
+
+        counts = None
+        if self.inventory_changed:
+            self.inventory_changed = False
+            counts = self.controller.counts(session)
+
+        sold_foobars: list[SoldFoobar] = []
+        if self.foobars_sold:
+            sold_foobars = self.controller.list_sold_foobars_since(
+                session, self.last_foobar_id, limit=self.BATCH_SIZE
+            )
+            if sold_foobars:
+                self.last_foobar_id = sold_foobars[-1].id
+
+            # A full batch means there might be more to read.
+            self.foobars_sold = len(sold_foobars) == self.BATCH_SIZE
+
+        snapshot = Snapshot(
+            robots=tuple(robots.values()),
+            counts=counts,
+            sold_foobars=tuple(sold_foobars),
+            reset=self.reset,
+        )
+        self.reset = False
+
+        return snapshot
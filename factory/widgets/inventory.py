@@ -1,9 +1,9 @@
 from typing import Optional
 
 from PySide6.QtWidgets import QGroupBox, QLabel, QVBoxLayout, QWidget
-from sqlalchemy.orm import Session as SASession
 
 from factory.controller import StateController
+from factory.snapshots import Snapshot
 
 
 class InventoryView(QGroupBox):
@@ -11,10 +11,12 @@ class InventoryView(QGroupBox):
     View the number of each resources available.
     """
 
-    def update_from_controller(self, session: SASession) -> None:
-        foo_count, bar_count, foobar_count, euros_count = self.controller.counts(
-            session
-        )
+    def apply(self, snapshot: Snapshot) -> None:
+        # Counts are only in the snapshot if they changed.
+        if snapshot.counts is None:
+            return
+
+        foo_count, bar_count, foobar_count, euros_count = snapshot.counts
 
         self.foo_label.setText(f"Foos: {foo_count}")
         self.bar_label.setText(f"Bars: {bar_count}")
@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
 import os
+import time
 from typing import Optional
 
-from PySide6.QtCore import QSize, QTimer, Slot
+from PySide6.QtCore import QSize, Qt, QThread, QTimer, Signal, Slot
+from PySide6.QtGui import QCloseEvent
 from PySide6.QtWidgets import (
     QFileDialog,
     QHBoxLayout,
+    QLabel,
     QMainWindow,
     QMenuBar,
+    QProgressBar,
     QVBoxLayout,
     QWidget,
 )
-from sqlalchemy.orm import Session as SASession
 
+import factory.database
 from factory.controller import StateController
+from factory.profiling import Profiler, TickTimings
+from factory.snapshots import Snapshot
 from factory.widgets.trace import TraceabilityView
+from factory.worker import SimulationWorker
 
 from .inventory import InventoryView
 from .robots import RobotsView
@@ -28,11 +35,28 @@ class MainWindow(QMainWindow):
 
     UPDATE_INTERVAL = 16  # Number of milliseconds between each update.
 
-    def __init__(self, controller: StateController, parent: Optional[QWidget] = None):
+    # Asks the worker to save or load, with a filename.
+    save_requested = Signal(str)
+    load_requested = Signal(str)
+
+    def __init__(
+        self,
+        controller: StateController,
+        parent: Optional[QWidget] = None,
+        threaded: bool = True,
+        profiler: Optional[Profiler] = None,
+    ):
         super().__init__(parent)
         self.controller = controller
+        self.profiler = profiler or Profiler.from_environment()
+
+        # When the last frame was painted, and how long applying the last
+        # snapshot took, in milliseconds, for the timings overlay.
+        self.last_frame = time.perf_counter()
+        self.frame_time = 0.0
+        self.apply_time = 0.0
 
-        # Timer
+        # Timer, for the frames
         self.timer = QTimer()
         self.timer.timeout.connect(self.update)
         self.timer.start(self.UPDATE_INTERVAL)
@@ -41,10 +65,20 @@ class MainWindow(QMainWindow):
         menu = QMenuBar(self)
         file_menu = menu.addMenu("File")
         save_action = file_menu.addAction("Save")
+        save_as_action = file_menu.addAction("Save as…")
         load_action = file_menu.addAction("Load")
         save_action.triggered.connect(self.save)
+        save_as_action.triggered.connect(self.save_as)
         load_action.triggered.connect(self.load)
 
+        debug_menu = menu.addMenu("Debug")
+        self.timings_action = debug_menu.addAction("Show timings")
+        self.timings_action.setCheckable(True)
+        self.timings_action.setChecked(self.profiler.enabled)
+        dump_action = debug_menu.addAction("Dump timings…")
+        self.timings_action.toggled.connect(self.show_timings)
+        dump_action.triggered.connect(self.dump_timings)
+
         self.setMenuBar(menu)
 
         central_widget = QWidget(self)
@@ -64,6 +98,39 @@ class MainWindow(QMainWindow):
         central_widget.setLayout(central_layout)
         self.setCentralWidget(central_widget)
 
+        # Shown while saving or loading.
+        self.copy_progress = QProgressBar(self)
+        self.copy_progress.hide()
+        self.statusBar().addPermanentWidget(self.copy_progress)
+
+        # Drawn over the views, it doesn't take any room in the layout.
+        self.timings_overlay = QLabel(central_widget)
+        self.timings_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.timings_overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white; padding: 4px;"
+        )
+        self.timings_overlay.setVisible(self.profiler.enabled)
+
+        # The game runs in the worker, at its own pace, and sends us what
+        # changed. Without a thread, it ticks from our event loop.
+        self.worker = SimulationWorker(controller, profiler=self.profiler)
+        self.worker.ticked.connect(self.apply_snapshot)
+        self.worker.profiled.connect(self.show_tick_timings)
+        self.worker.copying.connect(self.show_copy_progress)
+        self.worker.copied.connect(self.copy_progress.hide)
+        self.save_requested.connect(self.worker.save)
+        self.load_requested.connect(self.worker.load)
+        self.worker_thread: Optional[QThread] = None
+
+        if threaded:
+            self.worker_thread = QThread(self)
+            self.worker.moveToThread(self.worker_thread)
+            self.worker_thread.started.connect(self.worker.start)
+            self.worker_thread.finished.connect(self.worker.stop)
+            self.worker_thread.start()
+        else:
+            self.worker.start()
+
     @Slot()
     def load(self) -> None:
         current_dir = os.getcwd()
@@ -71,37 +138,129 @@ class MainWindow(QMainWindow):
             self,
             "What is the filename to load?",
             current_dir,
-            "SQLite database (*.sqlite *.sqlite3)",
+            "Saves (*.sqlite *.sqlite3 *.gz)",
         )
 
         if filename:
-            self.controller.load(filename)
+            self.load_requested.emit(filename)
 
     @Slot()
     def save(self) -> None:
+        """
+        A game kept in a file only has to be checkpointed. A game that was
+        saved or loaded only has to save its journal. Otherwise it has to be
+        copied somewhere.
+        """
+        if factory.database.is_persistent():
+            self.controller.submit(lambda session: self.controller.checkpoint())
+        elif self.controller.savefile:
+            self.controller.submit(lambda session: self.controller.save_changes())
+        else:
+            self.save_as()
+
+    @Slot()
+    def save_as(self) -> None:
         current_dir = os.getcwd()
         filename, _ = QFileDialog.getSaveFileName(
-            self, "Where to save?", current_dir, "SQLite database (*.sqlite *.sqlite3)"
+            self,
+            "Where to save?",
+            current_dir,
+            "SQLite database (*.sqlite *.sqlite3);;Compressed save (*.gz)",
         )
 
         if filename:
-            self.controller.save(filename)
+            self.save_requested.emit(filename)
+
+    @Slot(bool)
+    def show_timings(self, shown: bool) -> None:
+        """
+        Starts or stops profiling the ticks, and shows what they cost.
+        """
+        self.profiler.enabled = shown
+        self.timings_overlay.setVisible(shown)
+
+    @Slot()
+    def dump_timings(self) -> None:
+        current_dir = os.getcwd()
+        filters = "Timings (*.json)"
+        if self.profiler.profile:
+            filters += ";;Profile (*.pstats)"
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Where to dump the timings?", current_dir, filters
+        )
+
+        if filename:
+            # The profile is being made in the worker's thread.
+            self.controller.submit(lambda session: self.profiler.dump(filename))
+
+    @Slot(object)
+    def show_tick_timings(self, timings: TickTimings) -> None:
+        self.timings_overlay.setText(
+            f"Frame: {self.frame_time:.1f} ms\n"
+            f"Tick: {timings.total:.1f} ms\n"
+            f"  Commands: {timings.commands:.1f} ms\n"
+            f"  Update: {timings.update:.1f} ms\n"
+            f"  Commit: {timings.commit:.1f} ms\n"
+            f"  Snapshot: {timings.snapshot:.1f} ms\n"
+            f"Apply: {self.apply_time:.1f} ms\n"
+            f"Robots updated: {timings.robots}"
+        )
+        self.timings_overlay.adjustSize()
+        self.timings_overlay.move(
+            self.centralWidget().width() - self.timings_overlay.width(), 0
+        )
+        self.timings_overlay.raise_()
+
+    @Slot(int, int)
+    def show_copy_progress(self, copied: int, total: int) -> None:
+        self.copy_progress.setMaximum(total)
+        self.copy_progress.setValue(copied)
+        self.copy_progress.show()
 
     @Slot()
     def update(self) -> None:
         """
-        Updates the state, then updates the view from the controller.
+        Paints a new frame. The state isn't changed here, so this doesn't
+        have to wait for the worker.
+        """
+        if self.profiler.enabled:
+            now = time.perf_counter()
+            self.frame_time = (now - self.last_frame) * 1000
+            self.last_frame = now
+
+        self.robots_view.refresh()
+
+    @Slot(object)
+    def apply_snapshot(self, snapshot: Snapshot) -> None:
+        """
+        Shows what changed during the worker's last tick.
         """
-        with self.controller.model_session() as session:
-            self.controller.update(session)
-            self.update_from_controller(session)
+        start = time.perf_counter() if self.profiler.enabled else 0.0
+
+        self.robots_view.apply(snapshot)
+        self.inventory_view.apply(snapshot)
+        self.traceability_view.apply(snapshot)
+
+        if start:
+            self.apply_time = (time.perf_counter() - start) * 1000
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        self.timer.stop()
+
+        # The worker's timer can only be stopped from its own thread, which
+        # does it when it finishes.
+        if self.worker_thread:
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        else:
+            self.worker.stop()
 
-            session.commit()
+        # The worker is done, so its profile can be read from here.
+        if self.profiler.filename:
+            self.profiler.dump(self.profiler.filename)
 
-    def update_from_controller(self, session: SASession) -> None:
-        self.robots_view.update_from_controller(session)
-        self.inventory_view.update_from_controller(session)
-        self.traceability_view.update_from_controller(session)
+        super().closeEvent(event)
 
     def sizeHint(self) -> QSize:
         return QSize(1366, 768)
@@ -1,182 +1,302 @@
-from typing import Optional
-
-from PySide6.QtCore import QSize, Slot
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence
+
+from PySide6.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
+    QObject,
+    QRect,
+    QSize,
+    Qt,
+    Slot,
+)
+from PySide6.QtGui import QPainter
 from PySide6.QtWidgets import (
+    QAbstractItemView,
+    QApplication,
     QButtonGroup,
-    QFrame,
+    QComboBox,
     QGroupBox,
     QHBoxLayout,
-    QLabel,
+    QListView,
     QMessageBox,
-    QProgressBar,
     QPushButton,
-    QScrollArea,
-    QSizePolicy,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionProgressBar,
+    QStyleOptionViewItem,
     QVBoxLayout,
     QWidget,
 )
 from sqlalchemy.orm import Session as SASession
 
-from factory.controller import RobotController, StateController
-from factory.models import Robot, RobotAction
-
+from factory.controller import StateController
+from factory.models import RobotAction
+from factory.snapshots import RobotState, Snapshot
 
-class RobotView(QFrame):
-    """
-    Presents a single Robot. Hi!
-    """
+# Roles to get what the delegate paints from the model.
+ActionRole = Qt.UserRole + 1
+ProgressRole = Qt.UserRole + 2
 
-    def sizePolicy(self) -> QSizePolicy:
-        return QSizePolicy(
-            QSizePolicy.Fixed,
-            QSizePolicy.Ignored,
-        )
+# Which robots the buttons change.
+SELECTED_ROBOTS = "Selected robots"
+ALL_ROBOTS = "All robots"
+IDLE_ROBOTS = "Idle robots"
 
-    def sizeHint(self) -> QSize:
-        return QSize(0, 100)
 
-    @property
-    def id(self) -> int:
-        return self.controller.id
+def action_text(robot: RobotState) -> str:
+    """
+    What the robot is doing, as it should be printed to the user.
+    """
+    if robot.action and robot.time_when_available is None:
+        # Case when a robot is actively doing something
+        return f"Current action: {robot.action.to_string()}"
+    elif robot.action and robot.time_when_available:
+        # Case when a robot is currently changing action
+        return f"Changing to: {robot.action.to_string()}"
 
-    @property
-    def robot(self) -> Robot:
-        return self.controller.robot
+    # Case when a robot is doing nothing (probably lazy)
+    return "Idle"
 
-    def update_from_controller(self) -> None:
-        if self.controller.action and self.robot.time_when_available is None:
-            # Case when a robot is actively doing something
-            self.action_label.setText(
-                f"Current action: {self.controller.action.to_string()}"
-            )
-            self.progress_bar.setValue(int(self.controller.progress()))
-        elif self.controller.action and self.robot.time_when_available:
-            # Case when a robot is currently changing action
-            self.action_label.setText(
-                f"Changing to: {self.controller.action.to_string()}"
-            )
-            self.progress_bar.setValue(int(self.controller.progress()))
-        else:
-            # Case when a robot is doing nothing (probably lazy)
-            self.action_label.setText("Idle")
-            self.progress_bar.setValue(0)
 
-    @Slot(QPushButton)
-    def button_pressed(self, button: QPushButton) -> None:
-        with self.controller.model_session() as session:
-            new_action = self.robot_actions[button]
-            self.controller.change_action(session, new_action)
-
-            session.commit()
+class RobotListModel(QAbstractListModel):
+    """
+    Every robot, in the order they were made, as of the last snapshot.
+    Progress is computed when it is asked for, which is only for the
+    visible rows.
+    """
 
-    def __init__(self, controller: RobotController, parent: Optional[QWidget] = None):
+    def __init__(
+        self,
+        clock: Callable[[], datetime] = datetime.now,
+        parent: Optional[QObject] = None,
+    ):
         super().__init__(parent)
-        self.controller: RobotController = controller
-
-        self.setFrameShape(QFrame.WinPanel)
-        self.setFrameShadow(QFrame.Raised)
-        main_layout = QVBoxLayout(self)
-
-        top_layout = QHBoxLayout()
-        name_label = QLabel(controller.name)
-        self.action_label = QLabel("Current action:")
-        self.progress_bar = QProgressBar()
-
-        top_layout.addWidget(name_label)
-        top_layout.addStretch(1)
-        top_layout.addWidget(self.action_label)
-        top_layout.addWidget(self.progress_bar, 1)
-
-        bottom_layout = QHBoxLayout()
-        self.button_group = QButtonGroup()
-        mine_foo_button = QPushButton("Mine Foo", None)
-        mine_bar_button = QPushButton("Mine Bar", None)
-        make_foobar_button = QPushButton("Make Foobar", None)
-        sell_foobar_button = QPushButton("Sell foobar", None)
-        buy_robot_button = QPushButton("Buy robot", None)
+        self.clock = clock
+        self.robots: list[RobotState] = []
+        # Row of each robot, from its id.
+        self.rows: dict[int, int] = {}
+        # Robots doing something, whose progress moves.
+        self.busy: set[int] = set()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        # Only the root has children, this is a list.
+        return 0 if parent.isValid() else len(self.robots)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        robot = self.robots[index.row()]
+
+        if role == Qt.DisplayRole:
+            return robot.name
+        elif role == ActionRole:
+            return action_text(robot)
+        elif role == ProgressRole:
+            # The robot might be a bit late to be updated.
+            return min(int(robot.progress(self.clock())), 100) if robot.action else 0
+
+        return None
+
+    def apply(self, robots: Sequence[RobotState]) -> None:
+        """
+        Replaces the robots we know, and adds the new ones at the end, all
+        at once.
+        """
+        new_robots = []
 
-        # Mapping buttons to actions
-        self.robot_actions = {
-            mine_foo_button: RobotAction.MINING_FOO,
-            mine_bar_button: RobotAction.MINING_BAR,
-            make_foobar_button: RobotAction.MAKING_FOOBAR,
-            sell_foobar_button: RobotAction.SELLING_FOOBAR,
-            buy_robot_button: RobotAction.BUYING_ROBOT,
-        }
+        for robot in robots:
+            if robot.action:
+                self.busy.add(robot.id)
+            else:
+                self.busy.discard(robot.id)
+
+            row = self.rows.get(robot.id)
+            if row is None:
+                new_robots.append(robot)
+                continue
+
+            self.robots[row] = robot
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+        if not new_robots:
+            return
+
+        first = len(self.robots)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_robots) - 1)
+        self.robots.extend(new_robots)
+        self.rows.update((robot.id, first + i) for i, robot in enumerate(new_robots))
+        self.endInsertRows()
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.robots.clear()
+        self.rows.clear()
+        self.busy.clear()
+        self.endResetModel()
+
+
+class RobotDelegate(QStyledItemDelegate):
+    """
+    Paints a robot: its name, what it does, and its progress, on one line.
+    """
 
-        for button in self.robot_actions:
-            self.button_group.addButton(button)
-        self.button_group.buttonClicked.connect(self.button_pressed)
+    ROW_HEIGHT = 32
+    MARGIN = 6
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        return QSize(0, self.ROW_HEIGHT)
+
+    def paint(
+        self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex
+    ) -> None:
+        style = option.widget.style() if option.widget else QApplication.style()
+
+        # Background, which shows the selection.
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        rect = option.rect.adjusted(self.MARGIN, 0, -self.MARGIN, 0)
+        third = rect.width() // 3
+        name_rect = QRect(rect.left(), rect.top(), third, rect.height())
+        action_rect = QRect(rect.left() + third, rect.top(), third, rect.height())
+        progress_rect = QRect(
+            rect.left() + 2 * third,
+            rect.top() + self.MARGIN,
+            rect.width() - 2 * third,
+            rect.height() - 2 * self.MARGIN,
+        )
 
-        bottom_layout.addWidget(mine_foo_button)
-        bottom_layout.addWidget(mine_bar_button)
-        bottom_layout.addWidget(make_foobar_button)
-        bottom_layout.addWidget(sell_foobar_button)
-        bottom_layout.addWidget(buy_robot_button)
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        painter.drawText(name_rect, Qt.AlignVCenter | Qt.AlignLeft, index.data())
+        painter.drawText(
+            action_rect, Qt.AlignVCenter | Qt.AlignLeft, index.data(ActionRole)
+        )
+        painter.restore()
 
-        main_layout.addLayout(top_layout)
-        main_layout.addLayout(bottom_layout)
+        progress = QStyleOptionProgressBar()
+        progress.rect = progress_rect
+        progress.minimum = 0
+        progress.maximum = 100
+        progress.progress = index.data(ProgressRole)
+        progress.text = f"{progress.progress}%"
+        progress.textVisible = True
+        progress.state = QStyle.State_Enabled | QStyle.State_Horizontal
+        style.drawControl(QStyle.CE_ProgressBar, progress, painter, option.widget)
 
 
 class RobotsView(QGroupBox):
     """
-    Presents all robots in a list-like fashion.
+    Presents all robots in a list-like fashion. Only the visible robots get
+    painted, so this stays fast whatever the number of robots.
     """
 
-    @Slot()
-    def update_from_controller(self, session: SASession) -> None:
+    def apply(self, snapshot: Snapshot) -> None:
         """
-        Update the widget from the data given by the controller.
+        Shows what changed in the snapshot. We don't need to check for removed
+        robots since there is no way to lose a robot.
         """
-        # Update present widgets. We don't need to check them out
-        # from the database, since the controller is supposed to have
-        # been updated just before.
-        for robot_view in self.present_robots.values():
-            robot_view.update_from_controller()
+        if snapshot.reset:
+            self.model.clear()
 
-        # Check for added robots. We don't need to check for removed robots
-        # since there is no way to lose a robot.
-        robots = self.controller.list_robots(session)
+        had_won = self.model.rowCount() >= 30
+        self.model.apply(snapshot.robots)
 
-        for robot in robots:
-            if robot.id not in self.present_robots:
-                self.add_robot(robot)
+        # Print a nice victory message if the 30th robot is being inserted
+        if not had_won and self.model.rowCount() >= 30:
+            QMessageBox.information(
+                self.parentWidget(), "Victory!", "You won the game!"
+            )
 
-    def add_robot(self, robot: RobotController) -> None:
+    def refresh(self) -> None:
         """
-        Add a RobotView given a RobotController
+        Progress changes all the time while a robot is busy, so it has to be
+        painted again on each frame. Only the visible rows get repainted.
         """
-        new_place = self.robot_layout.count() - 1
-        view = RobotView(robot)
-        self.robot_layout.insertWidget(new_place, view)
-        self.present_robots[robot.id] = view
+        if self.model.busy:
+            self.list_view.viewport().update()
 
-        # Print a nice victory message if the 30th robot is being inserted
-        if len(self.present_robots) == 30:
-            QMessageBox.information(
-                self.parentWidget(), "Victory!", "You won the game!"
+    def selected_robots(self) -> list[RobotState]:
+        return [
+            self.model.robots[index.row()]
+            for index in self.list_view.selectionModel().selectedRows()
+        ]
+
+    @Slot(QPushButton)
+    def button_pressed(self, button: QPushButton) -> None:
+        """
+        Gives the robots chosen by apply_to a new action, all at once. The
+        state may live in another thread, so this is only a request: the
+        change will come back with a snapshot.
+        """
+        new_action = self.robot_actions[button]
+        robot_ids: Optional[list[int]] = None
+        doing: Optional[list[Optional[RobotAction]]] = None
+
+        applies_to = self.apply_to.currentText()
+        if applies_to == SELECTED_ROBOTS:
+            robot_ids = [robot.id for robot in self.selected_robots()]
+        elif applies_to == IDLE_ROBOTS:
+            doing = [None]
+
+        def apply(session: SASession) -> None:
+            self.controller.change_actions(
+                session, robot_ids=robot_ids, action=new_action, doing=doing
             )
 
+        self.controller.submit(apply)
+
     def __init__(self, controller: StateController, parent: Optional[QWidget] = None):
         super().__init__("Robots", parent)
 
         self.controller = controller
-        # Robots already inserted. We keep them with a mapping from robot id to widget.
-        self.present_robots: dict[int, RobotView] = {}
 
         self.container_layout = QVBoxLayout()
 
         # Set the outermost layout to have no margins, we have plenty to go around.
         self.container_layout.setContentsMargins(0, 0, 0, 0)
 
-        self.scroll_area = QScrollArea(self)
-        self.scroll_area.setWidgetResizable(True)
-        self.container_widget = QWidget(self.scroll_area)
+        self.model = RobotListModel(controller.now, self)
+        self.list_view = QListView(self)
+        self.list_view.setModel(self.model)
+        self.list_view.setItemDelegate(RobotDelegate(self.list_view))
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+
+        # Every row has the same height, so the view doesn't need to ask
+        # each of them.
+        self.list_view.setUniformItemSizes(True)
+
+        button_layout = QHBoxLayout()
+        self.button_group = QButtonGroup(self)
+        mine_foo_button = QPushButton("Mine Foo", None)
+        mine_bar_button = QPushButton("Mine Bar", None)
+        make_foobar_button = QPushButton("Make Foobar", None)
+        sell_foobar_button = QPushButton("Sell foobar", None)
+        buy_robot_button = QPushButton("Buy robot", None)
+
+        # Mapping buttons to actions
+        self.robot_actions = {
+            mine_foo_button: RobotAction.MINING_FOO,
+            mine_bar_button: RobotAction.MINING_BAR,
+            make_foobar_button: RobotAction.MAKING_FOOBAR,
+            sell_foobar_button: RobotAction.SELLING_FOOBAR,
+            buy_robot_button: RobotAction.BUYING_ROBOT,
+        }
+
+        for button in self.robot_actions:
+            self.button_group.addButton(button)
+            button_layout.addWidget(button)
+        self.button_group.buttonClicked.connect(self.button_pressed)
 
-        self.robot_layout = QVBoxLayout()
-        self.robot_layout.addStretch()  # Remaining space should be taken by nothing.
+        self.apply_to = QComboBox(self)
+        self.apply_to.addItems([SELECTED_ROBOTS, ALL_ROBOTS, IDLE_ROBOTS])
+        button_layout.addWidget(self.apply_to)
 
-        self.container_widget.setLayout(self.robot_layout)
-        self.scroll_area.setWidget(self.container_widget)
-        self.container_layout.addWidget(self.scroll_area)
+        self.container_layout.addWidget(self.list_view)
+        self.container_layout.addLayout(button_layout)
         self.setLayout(self.container_layout)
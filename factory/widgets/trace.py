@@ -1,65 +1,101 @@
-from typing import Optional, cast
+from typing import Any, Optional, Sequence
 
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt
 from PySide6.QtWidgets import (
+    QAbstractItemView,
     QGroupBox,
-    QTableWidget,
-    QTableWidgetItem,
+    QHeaderView,
+    QTableView,
     QVBoxLayout,
     QWidget,
 )
-from sqlalchemy.orm import Session as SASession
 
-from factory.controller import StateController
-from factory.models import Foobar
+from factory.controller import SoldFoobar, StateController
+from factory.snapshots import Snapshot
 
 
-class TraceabilityView(QGroupBox):
+class SoldFoobarsModel(QAbstractTableModel):
     """
-    View the number of each resources available.
+    The sold foobars, with what they were made of. Rows are only ever
+    appended, in batches.
     """
 
-    def insertFoobar(self, foobar: Foobar) -> None:
-        current_rowcount = self.table.rowCount()
+    HEADERS = ["Foo used", "Bar used"]
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.foobars: list[SoldFoobar] = []
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        # Only the root has children, this is a table.
+        return 0 if parent.isValid() else len(self.foobars)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+
+        foobar = self.foobars[index.row()]
+        serial = foobar.foo_serial if index.column() == 0 else foobar.bar_serial
+
+        return serial or ""
 
-        assert foobar.foo_used.serial
-        assert foobar.bar_used.serial
-        foo_item = QTableWidgetItem(foobar.foo_used.serial)
-        bar_item = QTableWidgetItem(foobar.bar_used.serial)
+    def headerData(
+        self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole
+    ) -> Any:
+        if role != Qt.DisplayRole:
+            return None
 
-        # all type checkers are very annoying with the types ItemFlag and ItemFlags,
-        # I guess the binding generator are not very good for enum flags.
-        flags = cast(Qt.ItemFlags, Qt.ItemIsSelectable | Qt.ItemIsEnabled)  # type: ignore
-        foo_item.setFlags(flags)
-        bar_item.setFlags(flags)
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
 
-        self.table.setRowCount(current_rowcount + 1)
-        self.table.setItem(current_rowcount, 0, foo_item)
-        self.table.setItem(current_rowcount, 1, bar_item)
-        self.table.resizeColumnsToContents()
+        return section + 1
 
-    def update_from_controller(self, session: SASession) -> None:
-        foobars = self.controller.list_sold_foobars(session)
+    def append(self, foobars: Sequence[SoldFoobar]) -> None:
+        """
+        Adds rows at the end, all at once.
+        """
+        if not foobars:
+            return
 
-        db_foobars = {foobar.id: foobar for foobar in foobars}
-        to_add = set(db_foobars) - self.already_added
+        first = len(self.foobars)
+        self.beginInsertRows(QModelIndex(), first, first + len(foobars) - 1)
+        self.foobars.extend(foobars)
+        self.endInsertRows()
 
-        for new_foobar in to_add:
-            self.insertFoobar(db_foobars[new_foobar])
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.foobars.clear()
+        self.endResetModel()
 
-        self.already_added.update(set(db_foobars))
+
+class TraceabilityView(QGroupBox):
+    """
+    View the foobars that were sold, and what they were made of.
+    """
+
+    def apply(self, snapshot: Snapshot) -> None:
+        if snapshot.reset:
+            self.model.clear()
+
+        self.model.append(snapshot.sold_foobars)
 
     def __init__(self, controller: StateController, parent: Optional[QWidget] = None):
         super().__init__(parent)
         self.controller = controller
         self.setTitle("Sold foobars")
 
-        # Foobars already added to this widget
-        self.already_added: set[int] = set()
-
         self.internal_layout = QVBoxLayout(self)
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(["Foo used", "Bar used"])
+        self.model = SoldFoobarsModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+
+        # Serials all have the same size, so there is no need to measure every
+        # row, which would get slow with a lot of them.
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
         self.internal_layout.addWidget(self.table)
@@ -0,0 +1,113 @@
+import time
+from typing import Optional
+
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
+
+from factory.controller import StateController
+from factory.profiling import Profiler
+from factory.snapshots import SnapshotBuilder
+
+
+class SimulationWorker(QObject):
+    """
+    Runs the game, away from the widgets. It is meant to be moved to its own
+    thread, so that a slow commit doesn't freeze the window.
+
+    Only the worker's thread touches the controller and the database. After
+    each tick, what changed is sent as an immutable Snapshot, and widgets
+    ask for changes through the controller's commands.
+    """
+
+    # Sent after each tick, with a Snapshot.
+    ticked = Signal(object)
+    # Sent while saving or loading, with the number of pages copied and the
+    # total number of pages.
+    copying = Signal(int, int)
+    # Sent when a save or a load is done.
+    copied = Signal()
+    # Sent after each tick while profiling, with its TickTimings.
+    profiled = Signal(object)
+
+    TICK_INTERVAL = 16  # Number of milliseconds between each tick.
+
+    # Number of pages copied at a time when saving or loading, 1 MiB with
+    # the default page size.
+    COPY_PAGES = 256
+
+    def __init__(
+        self,
+        controller: StateController,
+        parent: Optional[QObject] = None,
+        profiler: Optional[Profiler] = None,
+    ):
+        super().__init__(parent)
+        self.controller = controller
+        self.profiler = profiler or Profiler()
+        self.snapshots = SnapshotBuilder(controller)
+        self.timer: Optional[QTimer] = None
+        self.last_tick = 0.0
+
+    @Slot()
+    def start(self) -> None:
+        """
+        Starts ticking. The timer belongs to the thread this is called from.
+        """
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(self.TICK_INTERVAL)
+
+    @Slot()
+    def stop(self) -> None:
+        if self.timer:
+            self.timer.stop()
+
+    @Slot(str)
+    def save(self, filename: str) -> None:
+        """
+        Saves the game, a few pages at a time, and keeps ticking meanwhile.
+        """
+        self.controller.save(filename, self.COPY_PAGES, self.copy_progress)
+        self.copied.emit()
+
+    @Slot(str)
+    def load(self, filename: str) -> None:
+        """
+        Loads a save, a few pages at a time, and keeps ticking meanwhile.
+        """
+        self.controller.load(filename, self.COPY_PAGES, self.copy_progress)
+        self.copied.emit()
+
+    def copy_progress(self, status: int, remaining: int, total: int) -> None:
+        """
+        Called between the steps of a save or a load. The timer can't fire
+        while we're copying, so we tick from here when it's time.
+        """
+        self.copying.emit(total - remaining, total)
+
+        if (time.monotonic() - self.last_tick) * 1000 >= self.TICK_INTERVAL:
+            self.tick()
+
+    @Slot()
+    def tick(self) -> None:
+        """
+        Runs what was asked, updates the state, then tells what changed.
+        """
+        self.last_tick = time.monotonic()
+        profiler = self.profiler
+        profiler.start_tick()
+
+        with self.controller.model_session() as session:
+            with profiler.phase("commands"):
+                self.controller.run_commands(session)
+            with profiler.phase("update"):
+                robots = self.controller.update(session)
+            with profiler.phase("commit"):
+                session.commit()
+            with profiler.phase("snapshot"):
+                snapshot = self.snapshots.build(session)
+
+        timings = profiler.end_tick(len(robots))
+
+        self.ticked.emit(snapshot)
+        if timings:
+            self.profiled.emit(timings)
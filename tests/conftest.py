@@ -7,6 +7,7 @@ from pytest_mock import MockerFixture
 from sqlalchemy.engine import create_engine
 from sqlalchemy.orm import Session as SASession
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
 
 import factory.database
 from factory.controller import RobotController, StateController
@@ -15,8 +16,12 @@ from factory.models import Bar, Foo, Foobar
 
 @pytest.fixture
 def mock_session(mocker: MockerFixture) -> Iterator[SASession]:
-    engine = create_engine("sqlite:///:memory:")
-    Session = scoped_session(sessionmaker(engine))
+    engine = create_engine(
+        "sqlite:///:memory:",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+    )
+    Session = scoped_session(sessionmaker(engine, expire_on_commit=False))
 
     mocker.patch("factory.database.engine", engine)
     mocker.patch("factory.database.Session", Session)
@@ -44,6 +49,7 @@ def test_controller(
     """
     creation_parameters = request.node.get_closest_marker("init_controller_with")
     controller = StateController()
+    controller.CHECK_COUNTS = True
 
     if not creation_parameters:
         # Short-circuit the initialization
@@ -0,0 +1,141 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from freezegun.api import FrozenDateTimeFactory
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+from factory.catchup import plan
+from factory.controller import StateController
+from factory.models import Foobar, RobotAction
+from factory.snapshots import RobotState
+
+START = datetime(2022, 1, 1)
+
+
+def working(robot_id: int, action: RobotAction, done: datetime = START) -> RobotState:
+    return RobotState(
+        id=robot_id,
+        name=f"Robot {robot_id}",
+        action=action,
+        time_started=done - timedelta(seconds=1),
+        time_when_available=None,
+        time_when_done=done,
+    )
+
+
+def randint(a: int, b: int) -> int:
+    """
+    Bars take the longest, foobars are always made, and sold one by one.
+    """
+    return b if a > 1 else 1
+
+
+class TestPlan:
+    def test_miners_jump_to_now(self) -> None:
+        result = plan(
+            [working(1, RobotAction.MINING_FOO)],
+            (0, 0, 0, 0),
+            START + timedelta(seconds=999),
+        )
+
+        assert result.cycles == {1: 500}
+        assert result.foos == 500
+        assert result.robots[1].time_started == START + timedelta(seconds=998)
+        assert result.robots[1].time_when_done == START + timedelta(seconds=1000)
+
+    def test_products_are_used_as_they_are_made(self, mocker: MockerFixture) -> None:
+        rng = random.Random()
+        mocker.patch.object(rng, "randint", randint)
+
+        result = plan(
+            [
+                working(1, RobotAction.MINING_FOO),
+                working(2, RobotAction.MINING_BAR),
+                working(3, RobotAction.MAKING_FOOBAR),
+                working(4, RobotAction.SELLING_FOOBAR),
+            ],
+            (0, 0, 0, 0),
+            START + timedelta(seconds=10),
+            rng,
+        )
+
+        # Everything is done every 2 seconds, but selling
+        assert result.cycles == {1: 6, 2: 6, 3: 6, 4: 2}
+        assert (result.foos_used, result.bars_used) == (6, 6)
+        assert result.foobars == [(i, i) for i in range(6)]
+        assert result.foobars_sold == result.euros == 2
+
+    def test_robots_stop_without_products(self) -> None:
+        maker = working(1, RobotAction.MAKING_FOOBAR)
+        buyer = RobotState(
+            id=2,
+            name="Robot 2",
+            action=RobotAction.BUYING_ROBOT,
+            time_started=START - timedelta(seconds=5),
+            time_when_available=START,
+            time_when_done=None,
+        )
+
+        result = plan([maker, buyer], (6, 0, 0, 2), START + timedelta(hours=1))
+
+        assert result.cycles == {1: 0, 2: 1}
+        assert result.robots[1] == RobotState(
+            id=1,
+            name="Robot 1",
+            action=None,
+            time_started=maker.time_started,
+            time_when_available=None,
+            time_when_done=maker.time_when_done,
+        )
+        assert result.robots[2].action is None
+        assert result.robots_bought == 0
+
+
+class TestCatchUp:
+    @pytest.mark.init_controller_with(foo=6, euros=3)
+    def test_a_long_time_is_caught_up_at_once(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+        mocker: MockerFixture,
+    ) -> None:
+        mocker.patch.object(test_controller.rng, "randint", randint)
+        actions = [
+            RobotAction.MINING_FOO,
+            RobotAction.MINING_BAR,
+            RobotAction.MAKING_FOOBAR,
+            RobotAction.SELLING_FOOBAR,
+            RobotAction.BUYING_ROBOT,
+        ]
+        robots = [test_controller.new_robot(initialized_session) for _ in actions]
+        for robot, action in zip(robots, actions):
+            robot.change_action(initialized_session, action)
+        initialized_session.commit()
+
+        frozen_time.tick(timedelta(hours=1))
+        assert test_controller.behind(frozen_time())
+        assert test_controller.update(initialized_session) == robots
+        initialized_session.commit()
+
+        # Checked against the database as well.
+        foo, bar, foobar, euros = test_controller.counts(initialized_session)
+        miner, _, maker, seller, buyer = robots
+        assert miner.robot.time_when_done == frozen_time() + timedelta(seconds=1)
+        assert maker.active and seller.active
+        assert buyer.action is None
+        assert len(test_controller.list_robots(initialized_session)) == 6
+
+        sold = test_controller.list_sold_foobars_since(initialized_session)
+        assert len(sold) == euros
+        assert all(foobar.foo_serial and foobar.bar_serial for foobar in sold)
+        assert foobar == initialized_session.scalar(
+            sa.select(sa.func.count(Foobar.id)).where(~Foobar.used)
+        )
+
+        # Nothing is left to catch up.
+        assert not test_controller.behind(frozen_time())
+        assert test_controller.update(initialized_session) == []
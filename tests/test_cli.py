@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy.orm import Session
+
+from factory import cli
+from factory.controller import StateController
+from factory.models import RobotAction
+
+
+class TestCli:
+    def test_starting_stays_light(self, capsys: pytest.CaptureFixture[str]) -> None:
+        # Timings depend on the machine, only what gets imported is checked.
+        cli.main(["startup-time", "--runs", "1", "--budget", "10000"])
+
+        assert capsys.readouterr().out.startswith("Startup: ")
+
+    @pytest.mark.init_controller_with(foo=3, euros=2)
+    def test_inspect_describes_a_save(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        capsys: pytest.CaptureFixture[str],
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3.gz")
+        test_controller.new_robots(initialized_session, 2)
+        robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+        test_controller.save(savefile)
+
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+        journal = Path(savefile + ".journal").read_bytes()
+
+        cli.main(["inspect", savefile])
+
+        assert capsys.readouterr().out.splitlines() == [
+            "Robots: 3",
+            "  Idle: 2",
+            "  Mining foo: 1",
+            "Inventory: 3 foos, 0 bars, 0 foobars, 2€",
+            "Sold foobars: 0",
+            f"Journal: 1 transactions, {len(journal)} bytes",
+        ]
+        # Only read.
+        assert Path(savefile + ".journal").read_bytes() == journal
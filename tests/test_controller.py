@@ -1,4 +1,5 @@
 from datetime import timedelta
+from pathlib import Path
 
 import pytest
 import sqlalchemy as sa
@@ -7,7 +8,9 @@ from pytest_mock import MockerFixture
 from sqlalchemy.orm import Session
 
 from factory.controller import RobotController, StateController
+from factory.journal import journal_path
 from factory.models import Bar, Foo, Foobar, Robot, RobotAction
+from factory.queries import QueryRecorder
 
 
 class TestStateController:
@@ -50,7 +53,9 @@ class TestStateController:
         mocker: MockerFixture,
     ) -> None:
         # Always get critical failure
-        mocker.patch("random.randint", mocker.MagicMock(return_value=100))
+        mocker.patch.object(
+            test_controller.rng, "randint", mocker.MagicMock(return_value=100)
+        )
 
         # There should be zero foobar
         assert Foobar.count_not_used(initialized_session) == 0
@@ -72,7 +77,9 @@ class TestStateController:
         mocker: MockerFixture,
     ) -> None:
         # Always get critical success
-        mocker.patch("random.randint", mocker.MagicMock(return_value=0))
+        mocker.patch.object(
+            test_controller.rng, "randint", mocker.MagicMock(return_value=0)
+        )
 
         # There should be zero foobar
         assert Foobar.count_not_used(initialized_session) == 0
@@ -114,6 +121,43 @@ class TestStateController:
         assert Foo.count_not_used(initialized_session) == 1
         assert foo.used
 
+    @pytest.mark.init_controller_with(foo=5)
+    def test_consuming_products(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        """
+        Products are used oldest first, in a single statement.
+        """
+        initialized_session.flush()
+        statements = []
+        sa.event.listen(
+            initialized_session.get_bind(),
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+
+        ids = test_controller.consume_products(initialized_session, Foo, 3)
+
+        assert ids == [1, 2, 3]
+        assert len(statements) == 1
+        assert Foo.count_not_used(initialized_session) == 2
+        assert test_controller.consume_products(initialized_session, Foo, 3) == [4, 5]
+
+    @pytest.mark.init_controller_with(foobar=3)
+    def test_list_sold_foobars_since(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        assert test_controller.list_sold_foobars_since(initialized_session) == []
+
+        test_controller.use_n_products(initialized_session, Foobar, 2)
+        sold = test_controller.list_sold_foobars_since(initialized_session)
+        assert [foobar.id for foobar in sold] == [1, 2]
+        assert all(foobar.foo_serial and foobar.bar_serial for foobar in sold)
+
+        test_controller.use_n_products(initialized_session, Foobar, 1)
+        sold = test_controller.list_sold_foobars_since(initialized_session, 2)
+        assert [foobar.id for foobar in sold] == [3]
+
     @pytest.mark.init_controller_with(foobar=5)
     def test_selling_max_foobar(
         self,
@@ -121,7 +165,9 @@ class TestStateController:
         test_controller: StateController,
         mocker: MockerFixture,
     ) -> None:
-        mocker.patch("random.randint", mocker.MagicMock(return_value=5))
+        mocker.patch.object(
+            test_controller.rng, "randint", mocker.MagicMock(return_value=5)
+        )
 
         _, _, foobar_count, euros_count = test_controller.counts(initialized_session)
         assert foobar_count == 5
@@ -148,7 +194,9 @@ class TestStateController:
         Tests what happens when we have less foobar than what we could sell.
         We should only sell what we have.
         """
-        mocker.patch("random.randint", mocker.MagicMock(return_value=5))
+        mocker.patch.object(
+            test_controller.rng, "randint", mocker.MagicMock(return_value=5)
+        )
 
         _, _, foobar_count, euros_count = test_controller.counts(initialized_session)
         assert foobar_count == 3
@@ -183,6 +231,146 @@ class TestStateController:
         assert new_foo_count == 0
         assert new_euros_count == 0
 
+    def test_update_only_touches_due_robots(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        busy_robot = test_controller.new_robot(initialized_session)
+        test_controller.new_robot(initialized_session)
+        busy_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+
+        # Nothing is due yet
+        assert test_controller.update(initialized_session) == []
+
+        frozen_time.tick(timedelta(seconds=5))
+        assert test_controller.update(initialized_session) == [busy_robot]
+        assert busy_robot.active
+        assert test_controller.next_event() == frozen_time() + (timedelta(seconds=2))
+
+    def test_changing_actions_at_once(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        busy_robot = test_controller.new_robot(initialized_session)
+        busy_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        idle_ids = test_controller.new_robots(initialized_session, 4)
+        initialized_session.commit()
+
+        with QueryRecorder() as recorder:
+            changed = test_controller.change_actions(
+                initialized_session, None, RobotAction.MINING_BAR, doing=[None]
+            )
+        initialized_session.commit()
+
+        assert changed == idle_ids
+        # Chosen, then changed, in a single statement.
+        assert [statement.sql.split()[0] for statement in recorder.statements] == [
+            "SELECT",
+            "UPDATE",
+        ]
+        # The loaded robot wasn't written again, nor forgotten.
+        assert busy_robot.action == RobotAction.MINING_FOO
+        assert test_controller.scheduler.deadlines.keys() == {busy_robot.id, *idle_ids}
+
+        changed = test_controller.change_actions(
+            initialized_session,
+            [busy_robot.id, idle_ids[0], idle_ids[3]],
+            RobotAction.SELLING_FOOBAR,
+            id_range=(busy_robot.id, idle_ids[2]),
+        )
+        initialized_session.commit()
+        assert changed == [busy_robot.id, idle_ids[0]]
+        assert busy_robot.changing
+        assert busy_robot.action == RobotAction.SELLING_FOOBAR
+
+        frozen_time.tick(timedelta(seconds=5))
+        updated = test_controller.update(initialized_session)
+        assert [robot.id for robot in updated] == [busy_robot.id, *idle_ids]
+        assert [robot.action for robot in updated] == [
+            RobotAction.SELLING_FOOBAR,
+            RobotAction.SELLING_FOOBAR,
+            RobotAction.MINING_BAR,
+            RobotAction.MINING_BAR,
+            RobotAction.MINING_BAR,
+        ]
+        assert all(robot.active for robot in updated)
+
+    def test_load_reschedules_robots(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        robot = test_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+        test_controller.save(savefile)
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+
+        assert other_controller.next_event() == frozen_time() + timedelta(seconds=5)
+
+    @pytest.mark.init_controller_with(foo=200)
+    def test_incremental_save_is_a_snapshot(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        initialized_session.commit()
+
+        def keep_playing(status: int, remaining: int, total: int) -> None:
+            test_controller.robot_action_done(
+                RobotAction.MINING_FOO, initialized_session
+            )
+            initialized_session.commit()
+
+        test_controller.save(savefile, pages=1, progress=keep_playing)
+        assert test_controller.counts(initialized_session)[0] > 201
+
+        counts = test_controller.counts(initialized_session)
+
+        # The copy is what the game was when it started, the rest is in the
+        # journal.
+        other_controller = StateController()
+        other_controller.load(savefile, pages=1)
+        assert other_controller.counts(initialized_session) == counts
+
+        Path(journal_path(savefile)).unlink()
+        other_controller.load(savefile, pages=1)
+        assert other_controller.counts(initialized_session)[0] == 200
+
+    def test_incremental_load_reports_progress(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+        test_controller.save(savefile)
+
+        steps: list[tuple[int, int, int]] = []
+        other_controller = StateController()
+        other_controller.load(
+            savefile, pages=1, progress=lambda *step: steps.append(step)
+        )
+
+        assert len(steps) > 1
+        assert steps[-1][1] == 0
+        assert (
+            other_controller.get_robot(initialized_session, robot.id).name == robot.name
+        )
+
 
 class TestRobotController:
     def test_changing_action(
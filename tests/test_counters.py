@@ -0,0 +1,136 @@
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+import factory.database
+from factory.controller import StateController
+from factory.models import Foo, GlobalState, RobotAction
+
+
+class TestInventoryCounters:
+    def test_commit_keeps_changes(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+
+        with factory.database.Session() as session:
+            assert test_controller.counts(session) == (1, 0, 0, 0)
+
+    def test_rollback_forgets_changes(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        assert test_controller.counts(initialized_session) == (0, 0, 0, 0)
+
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        test_controller.add_euros(initialized_session, 3)
+        assert test_controller.counts(initialized_session) == (1, 0, 0, 3)
+
+        initialized_session.rollback()
+        assert test_controller.counts(initialized_session) == (0, 0, 0, 0)
+
+    def test_counts_are_not_queried(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.counts(initialized_session)
+
+        statements = []
+        sa.event.listen(
+            initialized_session.get_bind(),
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+        test_controller.CHECK_COUNTS = False
+        test_controller.counts(initialized_session)
+
+        assert statements == []
+
+    def test_check_detects_drift(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.counts(initialized_session)
+
+        # Not going through the controller, so the counters can't know.
+        initialized_session.add(Foo())
+
+        with pytest.raises(AssertionError):
+            test_controller.counts(initialized_session)
+
+    @pytest.mark.init_controller_with(foo=2, euros=4)
+    def test_rebuilt_on_reload(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        initialized_session.add(Foo())
+        test_controller.reload(initialized_session)
+
+        assert test_controller.counts(initialized_session) == (3, 0, 0, 4)
+
+    @pytest.mark.init_controller_with(foo=2, euros=4)
+    def test_reload_keeps_pending_changes(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        initialized_session.commit()
+
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        test_controller.add_euros(initialized_session, 3)
+        test_controller.reload(initialized_session)
+        assert test_controller.counts(initialized_session) == (3, 0, 0, 7)
+
+        initialized_session.rollback()
+        assert test_controller.counts(initialized_session) == (2, 0, 0, 4)
+
+
+class TestEuroLedger:
+    def test_sales_are_written_once(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        statements = []
+        sa.event.listen(
+            initialized_session.get_bind(),
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+
+        for _ in range(10):
+            test_controller.add_euros(initialized_session, 2)
+        assert statements == []
+
+        initialized_session.commit()
+        assert len([s for s in statements if s.startswith("UPDATE")]) == 1
+        assert initialized_session.scalar(sa.select(GlobalState.euros)) == 20
+
+    def test_rollback_forgets_sales(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.add_euros(initialized_session, 5)
+        initialized_session.rollback()
+        initialized_session.commit()
+
+        assert initialized_session.scalar(sa.select(GlobalState.euros)) == 0
+
+    def test_can_spend_what_was_just_earned(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.add_euros(initialized_session, 3)
+
+        assert test_controller.sub_euros(initialized_session, 3)
+        assert not test_controller.sub_euros(initialized_session, 1)
+        assert test_controller.counts(initialized_session)[3] == 0
+
+    def test_concurrent_sessions(
+        self, tmp_path: Path, mocker: MockerFixture, test_controller: StateController
+    ) -> None:
+        engine = sa.create_engine(f"sqlite:///{tmp_path / 'game.sqlite3'}")
+        mocker.patch("factory.database.engine", engine)
+        factory.database.init_database()
+
+        with Session(engine) as first, Session(engine) as second:
+            test_controller.add_euros(first, 5)
+            test_controller.add_euros(second, 3)
+            first.commit()
+            second.commit()
+
+            assert first.scalar(sa.select(GlobalState.euros)) == 8
@@ -0,0 +1,176 @@
+import sqlite3
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+import sqlalchemy as sa
+from freezegun.api import FrozenDateTimeFactory
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+import factory.database
+from factory.controller import StateController
+from factory.journal import journal_path
+from factory.models import Bar, Foo, Foobar, Robot, RobotAction
+
+
+@pytest.fixture
+def configurable_database(mocker: MockerFixture) -> None:
+    """
+    Lets a test configure the database, and puts the previous one back after.
+    """
+    mocker.patch("factory.database.engine", factory.database.engine)
+    mocker.patch(
+        "factory.database.Session",
+        scoped_session(sessionmaker(expire_on_commit=False)),
+    )
+
+
+class TestIndexes:
+    def test_migration_creates_missing_indexes(self, mock_session: Session) -> None:
+        engine = factory.database.engine
+        factory.database.init_database()
+
+        # Pretend we're a save from before the indexes existed.
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_foo_not_used")
+
+        factory.database.migrate()
+
+        indexes = sa.inspect(engine).get_indexes("foo")
+        assert "ix_foo_not_used" in {index["name"] for index in indexes}
+
+    def test_hot_queries_use_indexes(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        initialized_session.add_all([Foo(), Bar(), Foobar()])
+        initialized_session.flush()
+
+        statements: list[tuple[str, Any]] = []
+
+        def record(*args: Any) -> None:
+            statements.append((args[2], args[3]))
+
+        engine = factory.database.engine
+        sa.event.listen(engine, "before_cursor_execute", record)
+        for product in (Foo, Bar, Foobar):
+            product.count_not_used(initialized_session)
+        test_controller.use_product(initialized_session, Foo)
+        test_controller.use_n_products(initialized_session, Foobar, 3)
+        sa.event.remove(engine, "before_cursor_execute", record)
+
+        # Every statement looking for unused products
+        lookups = [
+            (statement, params)
+            for statement, params in statements
+            if "used = 0" in statement
+        ]
+        assert len(lookups) == 5
+
+        connection = initialized_session.connection()
+        for statement, params in lookups:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", params
+            ).all()
+            assert any("_not_used" in row[-1] for row in plan), (statement, plan)
+
+
+class TestConfiguration:
+    def test_pragmas_are_set(self, configurable_database: None, tmp_path: Path) -> None:
+        factory.database.configure(
+            f"sqlite:///{tmp_path / 'game.sqlite3'}",
+            factory.database.Pragmas(synchronous="full", cache_size=-1000),
+        )
+
+        with factory.database.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 2
+            assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -1000
+            assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+
+        assert factory.database.is_persistent()
+        factory.database.engine.dispose()
+
+    def test_checkpoint_saves_the_game(
+        self, configurable_database: None, tmp_path: Path
+    ) -> None:
+        filename = tmp_path / "game.sqlite3"
+        factory.database.configure(f"sqlite:///{filename}")
+        factory.database.init_database()
+
+        controller = StateController()
+        with controller.model_session() as session:
+            controller.new_robot(session)
+            session.commit()
+
+        controller.checkpoint()
+
+        # Everything is in the file itself, the log is empty.
+        assert Path(f"{filename}-wal").stat().st_size == 0
+        with sqlite3.connect(filename) as savefile:
+            (count,) = savefile.execute(
+                f"SELECT count(*) FROM {Robot.__tablename__}"
+            ).fetchone()
+        assert count == 1
+
+        factory.database.engine.dispose()
+
+    def test_saves_of_a_file_have_no_journal(
+        self, configurable_database: None, tmp_path: Path
+    ) -> None:
+        factory.database.configure(f"sqlite:///{tmp_path / 'game.sqlite3'}")
+        factory.database.init_database()
+        savefile = str(tmp_path / "save.sqlite3")
+        # Left by a game that was in memory.
+        Path(journal_path(savefile)).write_text("[]\n")
+
+        controller = StateController()
+        with controller.model_session() as session:
+            controller.start(session)
+            session.commit()
+
+            controller.save(savefile)
+            assert not Path(journal_path(savefile)).exists()
+
+            controller.new_robot(session)
+            session.commit()
+            controller.load(savefile)
+            controller.new_robot(session)
+            session.commit()
+
+        assert controller.journal is None
+        assert not Path(journal_path(savefile)).exists()
+        factory.database.engine.dispose()
+
+    def test_restarted_game_goes_on(
+        self,
+        configurable_database: None,
+        tmp_path: Path,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        factory.database.configure(f"sqlite:///{tmp_path / 'game.sqlite3'}")
+        factory.database.init_database()
+
+        controller = StateController()
+        with controller.model_session() as session:
+            controller.start(session)
+            robot, _ = controller.list_robots(session)
+            robot.change_action(session, RobotAction.MINING_FOO)
+            session.commit()
+
+        # As if the game was launched again.
+        restarted = StateController()
+        with restarted.model_session() as session:
+            restarted.start(session)
+            session.commit()
+
+            assert len(restarted.list_robots(session)) == 2
+
+            for _ in range(2):
+                frozen_time.tick(timedelta(seconds=5))
+                restarted.update(session)
+                session.commit()
+            assert restarted.counts(session)[0] == 2
+
+        factory.database.engine.dispose()
@@ -0,0 +1,49 @@
+from sqlalchemy.orm import Session
+
+from factory.controller import StateController
+from factory.events import Event, InventoryChanged, RobotAdded, RobotChanged
+from factory.models import RobotAction
+
+
+class TestEventBus:
+    def test_published_on_commit(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        received: list[Event] = []
+        test_controller.events.subscribe(RobotAdded, received.append)
+
+        robot = test_controller.new_robot(initialized_session)
+        assert received == []
+
+        initialized_session.commit()
+        assert received == [RobotAdded(robot.id)]
+
+    def test_rollback_forgets_events(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        received: list[Event] = []
+        test_controller.events.subscribe(InventoryChanged, received.append)
+
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.rollback()
+        initialized_session.commit()
+
+        assert received == []
+
+    def test_same_event_is_published_once(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        received: list[Event] = []
+        test_controller.events.subscribe(RobotChanged, received.append)
+        test_controller.events.subscribe(InventoryChanged, received.append)
+
+        robot = test_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        robot.change_action(initialized_session, RobotAction.MINING_BAR)
+        for _ in range(3):
+            test_controller.robot_action_done(
+                RobotAction.MINING_FOO, initialized_session
+            )
+        initialized_session.commit()
+
+        assert received == [RobotChanged(robot.id), InventoryChanged()]
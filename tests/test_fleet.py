@@ -0,0 +1,289 @@
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from freezegun.api import FrozenDateTimeFactory
+from sqlalchemy.orm import Session
+
+from factory.models import Robot, RobotAction
+from factory.simulation import Simulation
+from factory.snapshots import RobotState
+
+pytest.importorskip("numpy")
+
+from factory.fleet import FleetStateController  # noqa: E402
+
+
+@pytest.fixture
+def fleet_controller(initialized_session: Session) -> FleetStateController:
+    controller = FleetStateController(seed=0)
+    controller.CHECK_COUNTS = True
+    return controller
+
+
+def saved_state(session: Session, robot_id: int) -> RobotState:
+    """
+    The robot as it is in the database, not as it was loaded.
+    """
+    row = session.execute(
+        sa.select(
+            Robot.id,
+            Robot.name,
+            Robot.action,
+            Robot.time_started,
+            Robot.time_when_available,
+            Robot.time_when_done,
+        ).where(Robot.id == robot_id)
+    ).one()
+
+    return RobotState(*row)
+
+
+class TestFleet:
+    def test_robots_are_written_at_commit(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        robot = fleet_controller.new_robot(initialized_session)
+        fleet_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+        assert saved_state(initialized_session, robot.id) == robot.state()
+
+        # Nothing is due yet
+        assert fleet_controller.update(initialized_session) == []
+        assert fleet_controller.next_event() == frozen_time() + timedelta(seconds=5)
+
+        frozen_time.tick(timedelta(seconds=5))
+        assert fleet_controller.update(initialized_session) == [robot]
+        assert robot.active
+        assert robot.robot.time_when_done == frozen_time() + timedelta(seconds=2)
+
+        frozen_time.tick(timedelta(seconds=2))
+        assert fleet_controller.update(initialized_session) == [robot]
+        assert fleet_controller.counts(initialized_session)[0] == 1
+        assert robot.robot.time_started == frozen_time()
+
+        initialized_session.commit()
+        assert saved_state(initialized_session, robot.id) == robot.state()
+
+    def test_mining_bar_takes_a_random_time(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        robots = [fleet_controller.new_robot(initialized_session) for _ in range(100)]
+        for robot in robots:
+            robot.change_action(initialized_session, RobotAction.MINING_BAR)
+
+        frozen_time.tick(timedelta(seconds=5))
+        assert len(fleet_controller.update(initialized_session)) == 100
+
+        done = [robot.robot.time_when_done for robot in robots]
+        durations = {when - frozen_time() for when in done if when}
+        assert len(durations) > 1
+        assert all(
+            timedelta(milliseconds=500) <= duration <= timedelta(milliseconds=2000)
+            for duration in durations
+        )
+
+    def test_progress_of_every_robot(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        changing, working, idle = (
+            fleet_controller.new_robot(initialized_session) for _ in range(3)
+        )
+        working.change_action(initialized_session, RobotAction.SELLING_FOOBAR)
+        frozen_time.tick(timedelta(seconds=4))
+        changing.change_action(initialized_session, RobotAction.MINING_FOO)
+        frozen_time.tick(timedelta(seconds=2))
+        fleet_controller.update(initialized_session)
+        frozen_time.tick(timedelta(seconds=1))
+
+        progress = fleet_controller.progress()
+
+        assert progress.keys() == {changing.id, working.id}
+        assert progress[changing.id] == pytest.approx(changing.progress())
+        assert progress[working.id] == pytest.approx(working.progress())
+
+    def test_buying_robot(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        for _ in range(6):
+            fleet_controller.robot_action_done(
+                RobotAction.MINING_FOO, initialized_session
+            )
+        fleet_controller.add_euros(initialized_session, 3)
+
+        robot = fleet_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.BUYING_ROBOT)
+        frozen_time.tick(timedelta(seconds=5))
+
+        assert fleet_controller.update(initialized_session) == [robot]
+        assert robot.action is None
+        assert len(fleet_controller.fleet) == 2
+        assert fleet_controller.counts(initialized_session) == (0, 0, 0, 0)
+
+    def test_rolled_back_robots_are_read_again(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        robot = fleet_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.rollback()
+        frozen_time.tick(timedelta(seconds=5))
+
+        assert fleet_controller.update(initialized_session) == []
+        assert robot.action is None
+        assert fleet_controller.next_event() is None
+
+    def test_changing_actions_at_once(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        miner = fleet_controller.new_robot(initialized_session)
+        idle = fleet_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        # Not written yet, but chosen by what it's doing.
+        miner.change_action(initialized_session, RobotAction.MINING_FOO)
+        changed = fleet_controller.change_actions(
+            initialized_session,
+            None,
+            RobotAction.SELLING_FOOBAR,
+            doing=[RobotAction.MINING_FOO],
+        )
+        initialized_session.commit()
+
+        assert changed == [miner.id]
+        assert miner.action == RobotAction.SELLING_FOOBAR
+        assert idle.action is None
+        assert saved_state(initialized_session, miner.id) == miner.state()
+
+        fleet_controller.change_actions(
+            initialized_session, [idle.id], RobotAction.MINING_BAR
+        )
+        initialized_session.rollback()
+        frozen_time.tick(timedelta(seconds=5))
+
+        assert fleet_controller.update(initialized_session) == [miner]
+        assert idle.action is None
+
+    def test_robots_made_in_bulk_change_actions(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        robot_ids = fleet_controller.new_robots(initialized_session, 3)
+        initialized_session.commit()
+
+        fleet_controller.change_actions(
+            initialized_session, None, RobotAction.MINING_FOO
+        )
+        initialized_session.commit()
+        assert fleet_controller.next_event() == frozen_time() + timedelta(seconds=5)
+
+        frozen_time.tick(timedelta(seconds=5))
+        updated = fleet_controller.update(initialized_session)
+        frozen_time.tick(timedelta(seconds=2))
+        fleet_controller.update(initialized_session)
+        initialized_session.commit()
+
+        assert [robot.id for robot in updated] == robot_ids
+        assert fleet_controller.counts(initialized_session)[0] == 3
+        for robot_id in robot_ids:
+            robot = fleet_controller.get_robot(initialized_session, robot_id)
+            assert saved_state(initialized_session, robot_id) == robot.state()
+
+    def test_catching_up(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        robot = fleet_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+
+        frozen_time.tick(timedelta(hours=1))
+        assert fleet_controller.update(initialized_session) == [robot]
+        initialized_session.commit()
+
+        assert fleet_controller.counts(initialized_session)[0] == 1797
+        assert saved_state(initialized_session, robot.id) == robot.state()
+        assert fleet_controller.next_event() == frozen_time() + timedelta(seconds=1)
+
+    def test_journal_is_replayed(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        frozen_time: FrozenDateTimeFactory,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        robot = fleet_controller.new_robot(initialized_session)
+        initialized_session.commit()
+        fleet_controller.save(savefile)
+
+        robot.change_action(initialized_session, RobotAction.MINING_BAR)
+        frozen_time.tick(timedelta(seconds=5))
+        fleet_controller.update(initialized_session)
+        initialized_session.commit()
+        fleet_controller.save_changes()
+
+        other_controller = FleetStateController()
+        other_controller.load(savefile)
+
+        assert (
+            other_controller.get_robot(initialized_session, robot.id).state()
+            == robot.state()
+        )
+
+    def test_reloading_forgets_changes_not_written(
+        self,
+        initialized_session: Session,
+        fleet_controller: FleetStateController,
+        tmp_path: Path,
+    ) -> None:
+        fleet_controller.save(str(tmp_path / "save.sqlite3"))
+        robot = fleet_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        # As if the database was replaced by one without the robot.
+        initialized_session.execute(sa.delete(Robot).where(Robot.id == robot.id))
+        fleet_controller.reload(initialized_session)
+        # Its row isn't the robot's anymore, and mustn't be written.
+        initialized_session.commit()
+
+        assert len(fleet_controller.fleet) == 0
+        assert fleet_controller.list_robots(initialized_session) == []
+
+    def test_simulation_reaches_target(
+        self, initialized_session: Session, fleet_controller: FleetStateController
+    ) -> None:
+        simulation = Simulation(fleet_controller)
+        fleet_controller.new_robot(initialized_session)
+        fleet_controller.new_robot(initialized_session)
+
+        result = simulation.run(target_robots=4)
+
+        assert result.robots == 4
+        assert len(fleet_controller.fleet) == 4
@@ -0,0 +1,130 @@
+from pathlib import Path
+
+import pytest
+from freezegun.api import FrozenDateTimeFactory
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+from factory.controller import StateController
+from factory.journal import Journal, journal_path
+from factory.models import RobotAction
+
+
+class TestJournal:
+    @pytest.mark.init_controller_with(foo=6, bar=1, foobar=2, euros=3)
+    def test_changes_are_replayed_on_load(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+        mocker: MockerFixture,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        initialized_session.commit()
+        test_controller.save(savefile)
+        saved = Path(savefile).read_bytes()
+
+        # Always succeed, and sell as much as possible.
+        mocker.patch.object(
+            test_controller.rng, "randint", mocker.MagicMock(return_value=1)
+        )
+        robot = test_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_BAR)
+        test_controller.new_robots(initialized_session, 2)
+        for action in RobotAction:
+            test_controller.robot_action_done(action, initialized_session)
+        initialized_session.commit()
+
+        test_controller.save_changes()
+        counts = test_controller.counts(initialized_session)
+
+        # Only the journal was written.
+        assert Path(savefile).read_bytes() == saved
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+
+        assert other_controller.counts(initialized_session) == counts
+        # With the two made at once, and the one that was bought.
+        assert len(other_controller.list_robots(initialized_session)) == 4
+        assert (
+            other_controller.get_robot(initialized_session, robot.id).state()
+            == robot.state()
+        )
+
+    def test_actions_changed_at_once_are_replayed(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        robots = [test_controller.new_robot(initialized_session) for _ in range(3)]
+        initialized_session.commit()
+        test_controller.save(savefile)
+
+        test_controller.change_actions(
+            initialized_session,
+            [robot.id for robot in robots[1:]],
+            RobotAction.MAKING_FOOBAR,
+        )
+        initialized_session.commit()
+        test_controller.save_changes()
+        states = [robot.state() for robot in robots]
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+
+        assert [
+            robot.state() for robot in other_controller.list_robots(initialized_session)
+        ] == states
+        assert states[0].action is None
+
+    def test_rolled_back_changes_are_not_written(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        test_controller.save(savefile)
+
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.rollback()
+        test_controller.robot_action_done(RobotAction.MINING_BAR, initialized_session)
+        initialized_session.commit()
+
+        transactions, _ = Journal.read(journal_path(savefile))
+        assert [
+            [entry[1] for entry in entries if entry[0] == "row"]
+            for entries in transactions
+        ] == [["bar"]]
+
+    def test_cut_line_is_ignored(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        test_controller.save(savefile)
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+        assert test_controller.journal
+        test_controller.journal.close()
+
+        # As if the game crashed while writing.
+        with open(journal_path(savefile), "ab") as file:
+            file.write(b'[["euros",')
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+        assert other_controller.counts(initialized_session) == (1, 0, 0, 0)
+
+        # What comes next can still be read.
+        other_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+        transactions, _ = Journal.read(journal_path(savefile))
+        assert len(transactions) == 2
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from factory.montecarlo import evaluate, seeds
+from factory.simulation import GreedyStrategy
+
+STRATEGIES = {
+    "greedy": GreedyStrategy(),
+    "sell-early": GreedyStrategy(sell_batch=1),
+}
+
+
+class TestEvaluate:
+    def test_games_are_played_again_from_the_seed(self) -> None:
+        reports = evaluate(STRATEGIES, games=3, seed=1, workers=2, target_robots=4)
+        again = evaluate(STRATEGIES, games=3, seed=1, workers=1, target_robots=4)
+
+        for name, report in reports.items():
+            assert [result.game.seed for result in report.results] == seeds(1, 3)
+            assert all(result.reached for result in report.results)
+            assert report.times == again[name].times
+            assert report.throughputs == again[name].throughputs
+
+        # Luck changes from a game to the other.
+        assert len(set(reports["greedy"].times)) > 1
+
+    def test_games_are_given_up(self) -> None:
+        (report,) = evaluate(
+            {"greedy": GreedyStrategy()},
+            games=1,
+            workers=1,
+            max_time=timedelta(minutes=1),
+        ).values()
+
+        assert report.given_up == 1
+        assert report.times == []
+        (result,) = report.results
+        assert result.elapsed >= timedelta(minutes=1)
+        assert "given up: 1" in report.summary()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from factory.controller import StateController
+from factory.events import Event, RobotAdded
+from factory.models import Robot
+from factory.names import NamePool
+
+
+def names(session: Session) -> list[str]:
+    return session.scalars(sa.select(Robot.name).order_by(Robot.id)).all()
+
+
+class TestNamePool:
+    def test_names_are_given_again_with_a_number(
+        self, initialized_session: Session
+    ) -> None:
+        pool = NamePool()
+        pool.first_names = ["Ada", "Alan"]
+        pool.last_names = ["Lovelace", "Turing", "Hopper"]
+
+        taken = pool.take(initialized_session, 13)
+
+        assert len(set(taken)) == 13
+        assert set(taken[:6]) == {
+            f"{first} {last}" for first in pool.first_names for last in pool.last_names
+        }
+        assert all(name.endswith(" 2") for name in taken[6:12])
+        assert taken[12].endswith(" 3")
+
+    def test_names_of_previous_versions_are_skipped(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        initialized_session.add(Robot(name=test_controller.names.name(0)))
+        initialized_session.commit()
+
+        test_controller.new_robot(initialized_session)
+
+        assert names(initialized_session) == [
+            test_controller.names.name(0),
+            test_controller.names.name(1),
+        ]
+
+    def test_names_go_on_after_load(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+        test_controller.save(savefile)
+
+        # Only in the journal.
+        test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+        other_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        assert len(set(names(initialized_session))) == 3
+
+
+class TestNewRobots:
+    def test_robots_are_made_at_once(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        received: list[Event] = []
+        test_controller.events.subscribe(RobotAdded, received.append)
+        robot = test_controller.new_robot(initialized_session)
+
+        ids = test_controller.new_robots(initialized_session, 100)
+        initialized_session.commit()
+
+        assert ids == list(range(robot.id + 1, robot.id + 101))
+        assert len(set(names(initialized_session))) == 101
+        assert received == [RobotAdded(robot.id)] + [RobotAdded(i) for i in ids]
+        assert test_controller.get_robot(initialized_session, ids[-1]).action is None
@@ -0,0 +1,66 @@
+import json
+import pstats
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from factory.profiling import PHASES, Profiler, TickTimings
+
+
+def tick(profiler: Profiler, robots: int = 0) -> None:
+    profiler.start_tick()
+    for name in PHASES:
+        with profiler.phase(name):
+            pass
+    profiler.end_tick(robots)
+
+
+class TestProfiler:
+    def test_disabled_keeps_nothing(self) -> None:
+        profiler = Profiler()
+        tick(profiler)
+
+        assert not profiler.ticks
+
+    def test_last_ticks_are_kept(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(Profiler, "CAPACITY", 3)
+        profiler = Profiler(enabled=True)
+
+        for robots in range(5):
+            tick(profiler, robots)
+
+        assert [timings.robots for timings in profiler.ticks] == [2, 3, 4]
+        assert all(timings.total >= 0 for timings in profiler.ticks)
+
+    def test_dump_timings(self, tmp_path: Path) -> None:
+        profiler = Profiler(enabled=True)
+        tick(profiler, robots=2)
+
+        filename = str(tmp_path / "timings.json")
+        profiler.dump(filename)
+
+        with open(filename) as file:
+            dumped = json.load(file)
+        assert dumped["phases"] == list(PHASES)
+        assert TickTimings(**dumped["ticks"][0]) == profiler.ticks[0]
+
+    def test_dump_profile(self, tmp_path: Path) -> None:
+        profiler = Profiler(enabled=True, profile=True)
+        tick(profiler)
+
+        filename = str(tmp_path / "ticks.pstats")
+        profiler.dump(filename)
+
+        assert pstats.Stats(filename).total_calls > 0
+
+    def test_from_environment(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("FACTORY_PROFILE", "ticks.pstats")
+        profiler = Profiler.from_environment()
+
+        assert profiler.enabled
+        assert profiler.profile
+        assert profiler.filename == "ticks.pstats"
+
+        monkeypatch.delenv("FACTORY_PROFILE")
+        assert not Profiler.from_environment().enabled
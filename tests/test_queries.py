@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from freezegun.api import FrozenDateTimeFactory
+from sqlalchemy.orm import Session
+
+from factory.controller import StateController
+from factory.models import RobotAction
+from factory.queries import QueryRecorder
+from factory.snapshots import SnapshotBuilder
+
+
+def tick(
+    recorder: QueryRecorder,
+    session: Session,
+    controller: StateController,
+    snapshots: SnapshotBuilder,
+) -> None:
+    """
+    Ticks the way the worker does.
+    """
+    with recorder.tick():
+        controller.run_commands(session)
+        controller.update(session)
+        session.commit()
+        snapshots.build(session)
+
+
+class TestQueryRecorder:
+    def test_tick_budgets(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
+    ) -> None:
+        # Counting everything again on each completion isn't what the game does.
+        test_controller.CHECK_COUNTS = False
+        snapshots = SnapshotBuilder(test_controller)
+        for _ in range(10):
+            robot = test_controller.new_robot(initialized_session)
+            robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+        snapshots.build(initialized_session)
+
+        with QueryRecorder() as recorder:
+            recorder.track(test_controller)
+
+            # Nobody is done
+            tick(recorder, initialized_session, test_controller, snapshots)
+            # Everybody starts mining
+            frozen_time.tick(timedelta(seconds=5))
+            tick(recorder, initialized_session, test_controller, snapshots)
+            # Everybody mined
+            frozen_time.tick(timedelta(seconds=2))
+            tick(recorder, initialized_session, test_controller, snapshots)
+
+        recorder.assert_at_most(3, tick=0)
+
+        started, mined = recorder.ticks[1:]
+        assert started.count <= 10
+        # One block of serials for every foo, then a robot and a foo per robot.
+        recorder.assert_at_most(2, tick=2, scope="robot_action_done")
+        assert mined.count <= 2 + 2 * 10
+        assert mined.rows >= 2 * 10
+
+        # The recorder is gone with its block
+        assert test_controller.update.__name__ == "update"
+        assert "update" not in vars(test_controller)
+
+    def test_hot_statements_are_explained(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        with QueryRecorder() as recorder:
+            for _ in range(3):
+                test_controller.counts(initialized_session)
+            test_controller.list_sold_foobars_since(initialized_session, 0)
+
+        (hot, count), *_ = recorder.hot_statements()
+        assert count >= 3
+
+        plans = recorder.explain()
+        assert plans
+        assert any("_not_used" in step for steps in plans.values() for step in steps)
@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import factory.savefile
+from factory.controller import StateController
+from factory.models import Foo, RobotAction
+
+
+class TestCompressedSave:
+    @pytest.mark.init_controller_with(foo=500, bar=500, foobar=100, euros=3)
+    def test_round_trip(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        robot = test_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        test_controller.use_n_products(initialized_session, Foo, 10)
+        initialized_session.commit()
+
+        plain = str(tmp_path / "save.sqlite3")
+        compressed = str(tmp_path / "save.sqlite3.gz")
+        test_controller.save(plain)
+        test_controller.save(compressed)
+
+        assert factory.savefile.is_compressed(compressed)
+        assert not factory.savefile.is_compressed(plain)
+        assert Path(compressed).stat().st_size < Path(plain).stat().st_size / 2
+
+        counts = test_controller.counts(initialized_session)
+        serials = initialized_session.scalars(sa.select(Foo.serial)).all()
+
+        other_controller = StateController()
+        other_controller.load(compressed)
+
+        assert other_controller.counts(initialized_session) == counts
+        assert initialized_session.scalars(sa.select(Foo.serial)).all() == serials
+        assert (
+            other_controller.get_robot(initialized_session, robot.id).state()
+            == robot.state()
+        )
+
+    @pytest.mark.init_controller_with(foo=500)
+    def test_progress_is_reported(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        initialized_session.commit()
+        compressed = str(tmp_path / "save.gz")
+
+        steps: list[tuple[int, int, int]] = []
+        test_controller.save(
+            compressed, pages=1, progress=lambda *step: steps.append(step)
+        )
+        assert len(steps) > 1
+        assert steps[-1][1] == 0
+
+        steps.clear()
+        StateController().load(
+            compressed, pages=1, progress=lambda *step: steps.append(step)
+        )
+        assert len(steps) > 1
+        assert steps[-1][1] == 0
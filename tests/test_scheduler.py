@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from factory.scheduler import Scheduler
+
+START = datetime(2022, 1, 1)
+
+
+class TestScheduler:
+    def test_pops_in_order(self) -> None:
+        scheduler = Scheduler()
+        scheduler.schedule(1, START + timedelta(seconds=2))
+        scheduler.schedule(2, START + timedelta(seconds=1))
+        scheduler.schedule(3, START + timedelta(seconds=10))
+
+        assert scheduler.peek() == START + timedelta(seconds=1)
+        assert scheduler.pop_due(START + timedelta(seconds=5)) == [2, 1]
+        assert scheduler.pop_due(START + timedelta(seconds=5)) == []
+        assert len(scheduler) == 1
+
+    def test_reschedule_replaces_deadline(self) -> None:
+        scheduler = Scheduler()
+        scheduler.schedule(1, START + timedelta(seconds=1))
+        scheduler.schedule(1, START + timedelta(seconds=5))
+
+        assert scheduler.peek() == START + timedelta(seconds=5)
+        assert scheduler.pop_due(START + timedelta(seconds=2)) == []
+        assert scheduler.pop_due(START + timedelta(seconds=5)) == [1]
+
+    def test_unschedule(self) -> None:
+        scheduler = Scheduler()
+        scheduler.schedule(1, START)
+        scheduler.schedule(1, None)
+
+        assert 1 not in scheduler
+        assert scheduler.peek() is None
+        assert scheduler.pop_due(START) == []
+
+    def test_compaction_keeps_deadlines(self) -> None:
+        scheduler = Scheduler()
+        for i in range(1000):
+            scheduler.schedule(1, START + timedelta(seconds=i))
+        scheduler.schedule(2, START)
+
+        assert len(scheduler.heap) < 1000
+        assert scheduler.pop_due(START + timedelta(hours=1)) == [2, 1]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import factory.database
+from factory.controller import StateController
+from factory.models import Bar, Foo, GlobalState, RobotAction
+from factory.serials import CounterSerials
+
+
+def serials(session: Session) -> list[str]:
+    return session.scalars(sa.select(Foo.serial).union_all(sa.select(Bar.serial))).all()
+
+
+class TestCounterSerials:
+    def test_serials_are_unique(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.serials.BLOCK_SIZE = 3
+
+        for _ in range(5):
+            test_controller.robot_action_done(
+                RobotAction.MINING_FOO, initialized_session
+            )
+            test_controller.robot_action_done(
+                RobotAction.MINING_BAR, initialized_session
+            )
+        initialized_session.commit()
+
+        assert sorted(serials(initialized_session)) == [
+            f"{n:08x}" for n in range(1, 11)
+        ]
+        # Only whole blocks are reserved.
+        assert initialized_session.scalar(sa.select(GlobalState.next_serial)) == 13
+
+    def test_many_serials_at_once(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        serials = test_controller.serials
+        serials.BLOCK_SIZE = 3
+
+        assert serials.next(initialized_session) == f"{1:08x}"
+        # What's left of the block, then a block for the rest.
+        assert serials.many(initialized_session, 7) == [f"{n:08x}" for n in range(2, 9)]
+        assert serials.next(initialized_session) == f"{9:08x}"
+        assert initialized_session.scalar(sa.select(GlobalState.next_serial)) == 12
+
+    def test_rolled_back_block_is_forgotten(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.rollback()
+
+        # Another controller might reserve the same block meanwhile.
+        other_serials = CounterSerials()
+        assert other_serials.next(initialized_session) == f"{1:08x}"
+        initialized_session.commit()
+
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+        assert serials(initialized_session) == [f"{CounterSerials.BLOCK_SIZE + 1:08x}"]
+
+    def test_serials_go_on_after_load(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        tmp_path: Path,
+    ) -> None:
+        savefile = str(tmp_path / "save.sqlite3")
+        test_controller.save(savefile)
+
+        # Only in the journal.
+        test_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+
+        other_controller = StateController()
+        other_controller.load(savefile)
+        other_controller.robot_action_done(RobotAction.MINING_FOO, initialized_session)
+        initialized_session.commit()
+
+        assert len(set(serials(initialized_session))) == 2
+
+    def test_migration_adds_the_counter(self, mock_session: Session) -> None:
+        engine = factory.database.engine
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE global_state (id INTEGER PRIMARY KEY, euros INTEGER)"
+            )
+            conn.exec_driver_sql("INSERT INTO global_state (euros) VALUES (3)")
+
+        factory.database.init_database()
+
+        assert mock_session.scalar(sa.select(GlobalState.next_serial)) == 1
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from typing import Sequence
+
+import pytest
+from sqlalchemy.orm import Session
+
+from factory.controller import RobotController, StateController
+from factory.models import Foo, RobotAction
+from factory.simulation import GreedyStrategy, Simulation, Strategy
+
+
+class IdleStrategy(Strategy):
+    """
+    Never tells anyone to do anything.
+    """
+
+    def assign(
+        self,
+        controller: StateController,
+        session: Session,
+        robots: Sequence[RobotController],
+    ) -> None:
+        pass
+
+
+class TestSimulation:
+    def test_nothing_to_do(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        simulation = Simulation(test_controller, IdleStrategy())
+        test_controller.new_robot(initialized_session)
+
+        assert test_controller.next_event() is None
+        assert not simulation.step(initialized_session)
+
+    def test_jumps_to_next_event(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        start = datetime(2022, 1, 1)
+        simulation = Simulation(test_controller, IdleStrategy(), start=start)
+        robot = test_controller.new_robot(initialized_session)
+        robot.change_action(initialized_session, RobotAction.MINING_FOO)
+
+        # First event is the end of the change, 5 seconds later.
+        assert test_controller.next_event() == start + timedelta(seconds=5)
+        assert simulation.step(initialized_session)
+        assert simulation.now == start + timedelta(seconds=5)
+        assert robot.active
+
+        # Then the foo is mined 2 seconds later.
+        assert simulation.step(initialized_session)
+        assert simulation.now == start + timedelta(seconds=7)
+        assert Foo.count_not_used(initialized_session) == 1
+
+    @pytest.mark.init_controller_with(foo=6, euros=3)
+    def test_greedy_strategy_buys_robots(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        simulation = Simulation(test_controller, GreedyStrategy())
+        robot = test_controller.new_robot(initialized_session)
+
+        simulation.decide(initialized_session, [])
+        assert robot.action == RobotAction.BUYING_ROBOT
+
+    def test_run_reaches_target(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        simulation = Simulation(test_controller)
+        test_controller.new_robot(initialized_session)
+        test_controller.new_robot(initialized_session)
+
+        result = simulation.run(target_robots=4)
+
+        assert result.robots == 4
+        assert result.elapsed > timedelta(0)
+        assert result.events > 0
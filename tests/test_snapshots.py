@@ -0,0 +1,86 @@
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+from factory.controller import RobotController, StateController
+from factory.models import Foobar, RobotAction
+from factory.snapshots import SnapshotBuilder
+
+
+class TestSnapshotBuilder:
+    def test_only_changes_are_read(
+        self,
+        initialized_session: Session,
+        test_controller: StateController,
+        mocker: MockerFixture,
+    ) -> None:
+        first_robot = test_controller.new_robot(initialized_session)
+        second_robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        snapshots = SnapshotBuilder(test_controller)
+        snapshot = snapshots.build(initialized_session)
+        assert [robot.id for robot in snapshot.robots] == [
+            first_robot.id,
+            second_robot.id,
+        ]
+        assert snapshot.counts == (0, 0, 0, 0)
+
+        counts = mocker.spy(test_controller, "counts")
+        snapshot = snapshots.build(initialized_session)
+        assert snapshot.robots == ()
+        assert snapshot.counts is None
+        counts.assert_not_called()
+
+        second_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+
+        snapshot = snapshots.build(initialized_session)
+        assert [robot.id for robot in snapshot.robots] == [second_robot.id]
+        assert snapshot.robots[0].action == RobotAction.MINING_FOO
+
+    def test_uncommitted_changes_are_not_sent(
+        self, initialized_session: Session, test_robot: RobotController
+    ) -> None:
+        controller = test_robot.parent_controller()
+        assert controller
+        initialized_session.commit()
+
+        snapshots = SnapshotBuilder(controller)
+        snapshots.build(initialized_session)
+
+        test_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        assert snapshots.build(initialized_session).robots == ()
+
+    @pytest.mark.init_controller_with(foobar=5)
+    def test_history_is_loaded_in_batches(
+        self, test_controller: StateController, initialized_session: Session
+    ) -> None:
+        snapshots = SnapshotBuilder(test_controller)
+        snapshots.BATCH_SIZE = 2
+
+        test_controller.use_n_products(initialized_session, Foobar, 5)
+
+        sold = []
+        for expected_rows in (2, 2, 1, 0):
+            snapshot = snapshots.build(initialized_session)
+            assert len(snapshot.sold_foobars) == expected_rows
+            sold.extend(snapshot.sold_foobars)
+
+        assert [foobar.id for foobar in sold] == [1, 2, 3, 4, 5]
+
+    def test_reload_resets(
+        self, initialized_session: Session, test_controller: StateController
+    ) -> None:
+        robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        snapshots = SnapshotBuilder(test_controller)
+        snapshots.build(initialized_session)
+
+        test_controller.reload(initialized_session)
+
+        snapshot = snapshots.build(initialized_session)
+        assert snapshot.reset
+        assert [state.id for state in snapshot.robots] == [robot.id]
+        assert not snapshots.build(initialized_session).reset
@@ -1,20 +1,27 @@
 from datetime import timedelta
+from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
-import sqlalchemy as sa
 from freezegun.api import FrozenDateTimeFactory
 from PySide6.QtCore import Qt
-from PySide6.QtWidgets import QSpacerItem, QWidgetItem
 from pytest_mock.plugin import MockerFixture
 from pytestqt.qtbot import QtBot
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql.elements import not_
 
-from factory.controller import RobotController, StateController
+from factory.controller import RobotController, SoldFoobar, StateController
 from factory.models import Foobar, RobotAction
+from factory.profiling import Profiler
+from factory.snapshots import Snapshot, SnapshotBuilder
 from factory.widgets import MainWindow
-from factory.widgets.robots import RobotsView, RobotView
+from factory.widgets.inventory import InventoryView
+from factory.widgets.robots import (
+    IDLE_ROBOTS,
+    ActionRole,
+    ProgressRole,
+    RobotDelegate,
+    RobotsView,
+)
 from factory.widgets.trace import TraceabilityView
 
 
@@ -22,13 +29,13 @@ class MockedStateController(StateController):
     counts = MagicMock(return_value=(0, 0, 0, 0))
     update = MagicMock()
     list_robots = MagicMock(return_value=[])
-    list_sold_foobars = MagicMock(return_value=[])
+    list_sold_foobars_since = MagicMock(return_value=[])
 
 
 class TestMainWindow:
     def test_timer_is_setup(self, qtbot: QtBot, mocker: MockerFixture) -> None:
         mocker.patch.object(MainWindow, "update", mocker.MagicMock())
-        window = MainWindow(MockedStateController())
+        window = MainWindow(MockedStateController(), threaded=False)
 
         qtbot.addWidget(window)
 
@@ -39,67 +46,179 @@ class TestMainWindow:
 
     def test_updates_the_state(self, qtbot: QtBot) -> None:
         """
-        Asserts the window updates the controller each time it tries to
-        update itself.
+        Asserts the worker updates the controller each time it ticks.
         """
         controller = MockedStateController()
-        window = MainWindow(controller)
+        window = MainWindow(controller, threaded=False)
 
         qtbot.addWidget(window)
-        window.update()
+        window.worker.tick()
 
         MockedStateController.update.assert_called()
 
+    def test_timings_are_shown(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+    ) -> None:
+        test_controller.new_robot(initialized_session)
+        initialized_session.commit()
 
-class TestRobotsView:
-    def test_insert_order(
+        window = MainWindow(test_controller, threaded=False, profiler=Profiler())
+        qtbot.addWidget(window)
+        assert window.timings_overlay.isHidden()
+
+        window.timings_action.setChecked(True)
+        window.worker.tick()
+
+        assert not window.timings_overlay.isHidden()
+        assert "Robots updated: 0" in window.timings_overlay.text()
+        assert len(window.profiler.ticks) == 1
+
+    def test_worker_thread_sends_snapshots(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+    ) -> None:
+        robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        window = MainWindow(test_controller)
+        qtbot.addWidget(window)
+
+        with qtbot.waitSignal(window.worker.ticked) as blocker:
+            pass
+
+        assert blocker.args
+        snapshot = blocker.args[0]
+        assert isinstance(snapshot, Snapshot)
+        assert [state.id for state in snapshot.robots] == [robot.id]
+
+        qtbot.waitUntil(lambda: window.robots_view.model.rowCount() == 1)
+        window.close()
+        assert window.worker_thread and window.worker_thread.isFinished()
+
+    def test_idle_robots_stay_readable(
         self,
         qtbot: QtBot,
         initialized_session: Session,
         test_controller: StateController,
+        frozen_time: FrozenDateTimeFactory,
     ) -> None:
         """
-        New robots should be second-to-last
+        Robots that aren't updated by the controller are still shown, after
+        the session they come from was committed and closed.
         """
+        busy_robot = test_controller.new_robot(initialized_session)
+        idle_robot = test_controller.new_robot(initialized_session)
+        busy_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        initialized_session.commit()
+
+        window = MainWindow(test_controller, threaded=False)
+        qtbot.addWidget(window)
+        model = window.robots_view.model
+
+        shown = []
+        for _ in range(3):
+            window.worker.tick()
+            window.update()
+            busy = model.index(0)
+            shown.append((busy.data(ActionRole), busy.data(ProgressRole)))
+            frozen_time.tick(timedelta(seconds=3))
+
+        assert model.rowCount() == 2
+        assert model.index(0).data() == busy_robot.name
+        assert shown == [
+            ("Changing to: Mining foo", 0),
+            ("Changing to: Mining foo", 60),
+            ("Current action: Mining foo", 0),
+        ]
+
+        idle = model.index(1)
+        assert idle.data() == idle_robot.name
+        assert idle.data(ActionRole) == "Idle"
+        assert idle.data(ProgressRole) == 0
+
+    def test_saves_while_ticking(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+        mocker: MockerFixture,
+        tmp_path: Path,
+    ) -> None:
         test_controller.new_robot(initialized_session)
-        widget = RobotsView(test_controller)
-        qtbot.addWidget(widget)
+        initialized_session.commit()
+
+        window = MainWindow(test_controller, threaded=False)
+        qtbot.addWidget(window)
+        window.worker.COPY_PAGES = 1
+        window.worker.TICK_INTERVAL = 0
+        update = mocker.spy(test_controller, "update")
 
-        # Order should be RobotView - SpacerItem
-        widget.update_from_controller(initialized_session)
-        assert isinstance(widget.robot_layout.itemAt(0), QWidgetItem)
+        with qtbot.waitSignal(window.worker.copied):
+            window.save_requested.emit(str(tmp_path / "save.sqlite3"))
 
-        first_robot_view = widget.robot_layout.itemAt(0).widget()
-        assert isinstance(first_robot_view, RobotView)
-        assert isinstance(widget.robot_layout.itemAt(1), QSpacerItem)
+        assert update.call_count > 1
+        assert window.copy_progress.maximum() > 1
+        assert window.copy_progress.value() == window.copy_progress.maximum()
+        assert window.copy_progress.isHidden()
 
-        test_controller.new_robot(initialized_session)
 
-        # Now it should be (the same) RobotView - (the new) RobotView - SpacerItem
-        widget.update_from_controller(initialized_session)
-        assert isinstance(widget.robot_layout.itemAt(0), QWidgetItem)
-        assert widget.robot_layout.itemAt(0).widget() == first_robot_view
+class TestInventoryView:
+    def test_only_updated_on_change(
+        self, qtbot: QtBot, test_controller: StateController
+    ) -> None:
+        widget = InventoryView(test_controller, None)
+        qtbot.addWidget(widget)
 
-        assert isinstance(widget.robot_layout.itemAt(1), QWidgetItem)
-        assert widget.robot_layout.itemAt(1).widget() != first_robot_view
+        widget.apply(Snapshot(counts=(1, 2, 3, 4)))
+        widget.apply(Snapshot())
 
-        assert isinstance(widget.robot_layout.itemAt(2), QSpacerItem)
+        assert widget.foo_label.text() == "Foos: 1"
+        assert widget.euros_label.text() == "Money: 4€"
 
 
-class TestRobotView:
+class TestRobotsView:
     def update(
-        self, session: Session, test_robot: RobotController, widget: RobotView
+        self, session: Session, controller: StateController, widget: RobotsView
     ) -> None:
         """
         Helper function to update controller then fetch state.
         """
-        state_controller = test_robot.parent_controller()
-        assert (
-            state_controller
-        ), "State controller went out of scope, shouldn't be possible"
+        controller.update(session)
+        session.commit()
+        widget.apply(SnapshotBuilder(controller).build(session))
 
-        state_controller.update(session)
-        widget.update_from_controller()
+    def test_insert_order(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+    ) -> None:
+        """
+        New robots should be last
+        """
+        snapshots = SnapshotBuilder(test_controller)
+        first_robot = test_controller.new_robot(initialized_session)
+        widget = RobotsView(test_controller)
+        qtbot.addWidget(widget)
+
+        widget.apply(snapshots.build(initialized_session))
+        assert [robot.id for robot in widget.model.robots] == [first_robot.id]
+
+        second_robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        # Now it should be (the same) robot - (the new) robot
+        widget.apply(snapshots.build(initialized_session))
+        assert [robot.id for robot in widget.model.robots] == [
+            first_robot.id,
+            second_robot.id,
+        ]
+        assert widget.model.index(1).data() == second_robot.name
 
     @pytest.mark.parametrize(
         "button_text,new_action",
@@ -116,24 +235,84 @@ class TestRobotView:
         button_text: str,
         new_action: RobotAction,
         qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
         test_robot: RobotController,
         mocker: MockerFixture,
     ) -> None:
-        change_action_mock = mocker.MagicMock()
-        mocker.patch.object(RobotController, "change_action", change_action_mock)
+        change_actions_mock = mocker.MagicMock()
+        mocker.patch.object(test_controller, "change_actions", change_actions_mock)
 
-        robot_view = RobotView(test_robot)
-        qtbot.addWidget(robot_view)
+        widget = RobotsView(test_controller)
+        qtbot.addWidget(widget)
+        self.update(initialized_session, test_controller, widget)
+        widget.list_view.selectAll()
 
-        for button in robot_view.robot_actions:
+        for button in widget.robot_actions:
             if button.text().lower() == button_text:
                 qtbot.mouseClick(button, Qt.LeftButton)
 
-        change_action_mock.assert_called_once()
+        # Buttons only ask, the change happens where the state lives.
+        change_actions_mock.assert_not_called()
+        test_controller.run_commands(initialized_session)
+        change_actions_mock.assert_called_once()
+
+        # Every robot is changed at once.
+        assert change_actions_mock.call_args.kwargs["robot_ids"] == [test_robot.id]
+        assert change_actions_mock.call_args.kwargs["action"] == new_action
+
+    def test_buttons_only_change_selected_robots(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+    ) -> None:
+        first_robot = test_controller.new_robot(initialized_session)
+        second_robot = test_controller.new_robot(initialized_session)
+        initialized_session.commit()
+
+        widget = RobotsView(test_controller)
+        qtbot.addWidget(widget)
+        self.update(initialized_session, test_controller, widget)
+        widget.list_view.setCurrentIndex(widget.model.index(1))
+
+        for button, action in widget.robot_actions.items():
+            if action == RobotAction.MINING_BAR:
+                qtbot.mouseClick(button, Qt.LeftButton)
+        test_controller.run_commands(initialized_session)
 
-        # We only care about the second argument (the first is the session)
-        _, button_action = change_action_mock.call_args.args
-        assert button_action == new_action
+        assert first_robot.action is None
+        assert second_robot.action == RobotAction.MINING_BAR
+
+    def test_buttons_apply_to_idle_robots(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+    ) -> None:
+        busy_robot = test_controller.new_robot(initialized_session)
+        busy_robot.change_action(initialized_session, RobotAction.MINING_FOO)
+        idle_ids = test_controller.new_robots(initialized_session, 2)
+        initialized_session.commit()
+
+        widget = RobotsView(test_controller)
+        qtbot.addWidget(widget)
+        self.update(initialized_session, test_controller, widget)
+        widget.apply_to.setCurrentText(IDLE_ROBOTS)
+
+        for button, action in widget.robot_actions.items():
+            if action == RobotAction.MINING_BAR:
+                qtbot.mouseClick(button, Qt.LeftButton)
+        test_controller.run_commands(initialized_session)
+        self.update(initialized_session, test_controller, widget)
+
+        assert busy_robot.action == RobotAction.MINING_FOO
+        assert [robot.action for robot in widget.model.robots] == [
+            RobotAction.MINING_FOO,
+            RobotAction.MINING_BAR,
+            RobotAction.MINING_BAR,
+        ]
+        assert [robot.id for robot in widget.model.robots[1:]] == idle_ids
 
     @pytest.mark.parametrize(
         "time_to_wait,expected_text,expected_progress",
@@ -150,26 +329,55 @@ class TestRobotView:
         expected_progress: int,
         qtbot: QtBot,
         initialized_session: Session,
+        test_controller: StateController,
         test_robot: RobotController,
         frozen_time: FrozenDateTimeFactory,
     ) -> None:
-        widget = RobotView(test_robot)
+        widget = RobotsView(test_controller)
         qtbot.addWidget(widget)
 
         test_robot.change_action(initialized_session, RobotAction.MINING_FOO)
         frozen_time.tick(timedelta(seconds=time_to_wait))
 
-        self.update(initialized_session, test_robot, widget)
-        assert widget.action_label.text().lower() == expected_text
-        assert widget.progress_bar.value() == expected_progress
+        self.update(initialized_session, test_controller, widget)
+        index = widget.model.index(0)
+        assert index.data(ActionRole).lower() == expected_text
+        assert index.data(ProgressRole) == expected_progress
 
     def test_default_is_idle(
-        self, test_robot: RobotController, initialized_session: Session, qtbot: QtBot
+        self,
+        test_controller: StateController,
+        test_robot: RobotController,
+        initialized_session: Session,
+        qtbot: QtBot,
     ) -> None:
-        widget = RobotView(test_robot)
-        self.update(initialized_session, test_robot, widget)
+        widget = RobotsView(test_controller)
+        qtbot.addWidget(widget)
+        self.update(initialized_session, test_controller, widget)
 
-        assert widget.action_label.text() == "Idle"
+        assert widget.model.index(0).data(ActionRole) == "Idle"
+
+    def test_only_visible_robots_are_painted(
+        self,
+        qtbot: QtBot,
+        initialized_session: Session,
+        test_controller: StateController,
+        mocker: MockerFixture,
+    ) -> None:
+        # Winning pops a modal message box.
+        mocker.patch("factory.widgets.robots.QMessageBox")
+        for _ in range(500):
+            test_controller.new_robot(initialized_session)
+
+        widget = RobotsView(test_controller)
+        widget.resize(800, 300)
+        qtbot.addWidget(widget)
+        self.update(initialized_session, test_controller, widget)
+
+        paint = mocker.spy(RobotDelegate, "paint")
+        widget.grab()
+
+        assert 0 < paint.call_count < 20
 
 
 class TestTraceability:
@@ -180,22 +388,33 @@ class TestTraceability:
         initialized_session: Session,
         qtbot: QtBot,
     ) -> None:
+        snapshots = SnapshotBuilder(test_controller)
         widget = TraceabilityView(test_controller)
         qtbot.addWidget(widget)
 
-        widget.update_from_controller(initialized_session)
-        assert widget.table.rowCount() == 0
+        widget.apply(snapshots.build(initialized_session))
+        assert widget.model.rowCount() == 0
 
         # Now we sell one foobar
-        initialized_session.execute(
-            sa.update(Foobar)
-            .values(used=True)
-            .where(
-                Foobar.id.in_(sa.select(Foobar.id).where(not_(Foobar.used)).limit(1))
-            )
-            .execution_options(synchronize_session="fetch")
-        )
+        test_controller.use_n_products(initialized_session, Foobar, 1)
+        initialized_session.commit()
 
         # Now there should be a row
-        widget.update_from_controller(initialized_session)
-        assert widget.table.rowCount() == 1
+        widget.apply(snapshots.build(initialized_session))
+        assert widget.model.rowCount() == 1
+        assert widget.model.index(0, 0).data() == widget.model.foobars[0].foo_serial
+
+        # And it shouldn't be added again
+        widget.apply(snapshots.build(initialized_session))
+        assert widget.model.rowCount() == 1
+
+    def test_reset_clears_rows(
+        self, test_controller: StateController, qtbot: QtBot
+    ) -> None:
+        widget = TraceabilityView(test_controller)
+        qtbot.addWidget(widget)
+
+        widget.apply(Snapshot(sold_foobars=(SoldFoobar(1, "a", "b"),)))
+        widget.apply(Snapshot(reset=True))
+
+        assert widget.model.rowCount() == 0